@@ -1,5 +1,87 @@
-# PAG Core Module 
-"""PAG 核心功能模块""" 
-from .pag_export_server import * 
-from .pag_runtime_renderer import * 
-from .pag_batch_editor import * 
+# PAG Core Module
+"""
+PAG 核心功能模块
+
+子模块在第一次访问对应名称时才导入（PEP 562 模块级 __getattr__）：
+import core 不会创建 Flask 应用、修改 sys.path 或导入 pypag，
+批量任务之类的短命进程只为实际用到的模块付出导入开销。
+
+    from core import PAGTemplateBatchEditor   # 只导入 pag_batch_editor
+    from core import app                      # 此时才创建 Flask 应用
+"""
+
+import importlib
+
+# 公开名称 -> 所在子模块
+_LAZY_ATTRS = {
+    # 导出服务器
+    'app': 'pag_export_server',
+    'APIError': 'pag_export_server',
+    'warm_up': 'pag_export_server',
+    'collect_layer_info': 'pag_export_server',
+    'apply_transforms_to_layers': 'pag_export_server',
+    # 以前 from .pag_export_server import * 导出的名称（路由函数、SDK 状态），保持兼容
+    'PAG_AVAILABLE': 'pag_export_server',
+    'PAG_MODULE': 'pag_export_server',
+    'IMPORT_ERROR_MSG': 'pag_export_server',
+    'index': 'pag_export_server',
+    'health': 'pag_export_server',
+    'debug_matrix': 'pag_export_server',
+    'analyze_layers': 'pag_export_server',
+    'export_pag': 'pag_export_server',
+    'export_pag_simple': 'pag_export_server',
+    # 运行时渲染器
+    'PAGRuntimeRenderer': 'pag_runtime_renderer',
+    'main': 'pag_runtime_renderer',
+    'FrameBufferPool': 'pag_frame_io',
+    'FrameEncoder': 'pag_frame_io',
+    'EncoderProcessSink': 'pag_frame_sinks',
+    'Y4MFrameSink': 'pag_frame_sinks',
+    'RawFrameSink': 'pag_frame_sinks',
+    'CallbackFrameSink': 'pag_frame_sinks',
+    # 批量编辑器
+    'PAGTemplateBatchEditor': 'pag_batch_editor',
+    'PAGBatchConfigGenerator': 'pag_batch_editor',
+    'BatchItemResult': 'pag_batch_editor',
+    'BatchSummary': 'pag_batch_editor',
+    'BatchCheckpointJournal': 'pag_batch_editor',
+    'generate_nodejs_script': 'pag_batch_editor',
+    'example_batch_namecard': 'pag_batch_editor',
+    'example_from_csv': 'pag_batch_editor',
+    'example_save_config': 'pag_batch_editor',
+    # 导出流程与后台任务
+    'PAGExportPipeline': 'pag_export_pipeline',
+    'ExportError': 'pag_export_pipeline',
+    'ExportJobManager': 'pag_export_jobs',
+    'PAGActorPool': 'pag_actors',
+    # 缓存 / 仓库 / 读写
+    'PAGTemplateCache': 'pag_template_cache',
+    'PAGTemplateStore': 'pag_template_store',
+    'PAGAnalysisStore': 'pag_analysis_store',
+    'PAGOutputCache': 'pag_output_cache',
+    'PAGImageCache': 'pag_image_cache',
+    'ImageFitPolicy': 'pag_image_resize',
+    'PAGBufferIO': 'pag_io',
+    'LayerTransformCache': 'pag_transforms',
+    'SingleFlight': 'pag_singleflight',
+    'AdmissionController': 'pag_admission',
+    # PAG SDK
+    'load_pag_module': 'pag_sdk',
+}
+
+__all__ = sorted(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f'.{module_name}', __name__)
+    value = getattr(module, name)
+    # 缓存到包命名空间，之后的访问不再经过 __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
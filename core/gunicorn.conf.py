@@ -0,0 +1,80 @@
+"""
+gunicorn 配置 - PAG 导出服务器的生产部署
+
+使用方法（在 core 目录下）：
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+每个工作进程独立导入 pypag、持有自己的模板 / 图片缓存，
+pypag 调用不再挤在一个解释器的 GIL 里。所有参数都可以用环境变量调整：
+
+    PAG_SERVER_BIND              监听地址（默认 0.0.0.0:5000）
+    PAG_SERVER_WORKERS           工作进程数（默认 CPU 核数）
+    PAG_SERVER_THREADS           每个进程的线程数（默认 2，流式下载 / 轮询不会占满进程）
+    PAG_SERVER_TIMEOUT           工作进程心跳超时秒数（默认 120，见下）
+    PAG_SERVER_GRACEFUL_TIMEOUT  平滑重启时等待请求完成的秒数（默认 30）
+    PAG_SERVER_MAX_REQUESTS      每个进程处理多少请求后自动重启（默认 1000，0 表示不重启）
+    PAG_WARM_TEMPLATES           进程启动时预热的模板数（默认 8）
+    PAG_ACTOR_THREADS            每个进程内的 pypag 工作线程数（默认同 PAG_SERVER_THREADS，按模板哈希路由）
+
+平滑重启：kill -HUP <master pid>
+
+超时：gthread 模式下 timeout 只是工作进程的心跳超时——整个进程卡住（例如
+绑定层死锁导致主循环无法响应）超过这个时间才会被 master 杀掉重启，单个慢请求
+占住一个线程不会被中断。请求级的期限由应用控制：PAG_CALL_TIMEOUT（默认 60 秒）
+限制请求等待 pypag 工作线程的时间，超时返回 504。
+
+后台导出任务（/api/jobs）的状态和结果保存在 PAG_EXPORT_JOB_RESULT_DIR 中，
+提交、查询、下载可以落到不同的工作进程；该目录需要是本机目录。
+
+注意：gunicorn 只支持 Linux / macOS。Windows 下请继续使用
+python pag_export_server.py（长耗时导出可以走 /api/jobs/export 进程池）。
+"""
+
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get('PAG_SERVER_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('PAG_SERVER_WORKERS', str(multiprocessing.cpu_count())))
+threads = int(os.environ.get('PAG_SERVER_THREADS', '2'))
+worker_class = 'gthread'
+
+# 工作进程心跳超时（不是单个请求的超时，见文件开头）
+timeout = int(os.environ.get('PAG_SERVER_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('PAG_SERVER_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# 定期重启工作进程，防止绑定层内存碎片长期累积；加随机抖动避免同时重启
+max_requests = int(os.environ.get('PAG_SERVER_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+# 不在 master 中预加载应用：pypag 在每个工作进程中各自初始化，
+# 避免 fork 之后共享绑定层的内部状态
+preload_app = False
+
+
+def post_worker_init(worker):
+    """工作进程加载完应用后预热模板缓存"""
+    try:
+        from pag_export_server import warm_up
+    except ImportError:
+        from core.pag_export_server import warm_up
+
+    warmed = warm_up()
+    worker.log.info("PAG 工作进程 %s 已预热 %d 个模板", worker.pid, warmed)
+
+
+def worker_exit(server, worker):
+    """
+    工作进程退出时关闭后台导出进程池
+
+    已开始的任务等待完成（结果照常写入结果目录），尚未开始的任务标记为失败，
+    客户端从任何一个工作进程都能查到最终状态
+    """
+    # 应用可能以 pag_export_server 或 core.pag_export_server 加载（见 post_worker_init）；
+    # 只查已加载的模块，没加载成功的进程不会在退出时再导入一遍
+    for name in ('pag_export_server', 'core.pag_export_server'):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.export_jobs.shutdown(wait=True)
+            return
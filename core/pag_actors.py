@@ -0,0 +1,234 @@
+"""
+pypag 工作线程（actor） - 每个 pypag 对象只在创建它的线程中使用
+
+服务器以多线程方式运行，原先任何请求线程都会直接调用 pypag，并共享同一个模板
+缓存里的 PAGFile / PAGImage。绑定层没有承诺这些对象可以跨线程共享，所以只能
+每个进程一个工作线程，内存浪费在重复的进程上。
+
+PAGActorPool 启动若干个专用线程，每个线程持有自己的 PAGExportPipeline
+（模板缓存、图片缓存、读写），pypag 对象从创建到释放都不离开这个线程：
+    - 请求按模板哈希路由到固定的线程，同一模板总是命中同一个线程的缓存
+    - 不同模板在不同线程中并行处理，不需要全局锁
+    - 缓存容量按线程数均分，总内存占用与原先的单个缓存相同
+
+    data = actors.call(template_hash, lambda pipeline: pipeline.export(pag_bytes, mods))
+
+调用方线程的阶段计时器、剖析和日志请求上下文会带到工作线程中：/metrics 的
+阶段耗时、日志里的 request_id 不受影响；被剖析的请求在工作线程执行期间，
+该线程也会被采样（调用栈以 pag-actor-N 为根），绑定调用照常计数。
+
+threads=0 时不启动工作线程，在调用方线程中使用一个共享的 pipeline（原先的行为）。
+线程数不需要超过服务器每个进程的请求线程数（同时最多这么多请求在调用 pypag）。
+"""
+
+import queue
+import threading
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+try:
+    from .pag_export_pipeline import PAGExportPipeline
+    from .pag_metrics import current_timer
+    from .pag_profiler import current_profile
+    from .pag_logging import get_request_context, set_request_context, clear_request_context
+except ImportError:
+    from pag_export_pipeline import PAGExportPipeline
+    from pag_metrics import current_timer
+    from pag_profiler import current_profile
+    from pag_logging import get_request_context, set_request_context, clear_request_context
+
+# 汇总各线程缓存统计时求和的字段
+_SUMMED_FIELDS = ('hits', 'misses', 'evictions', 'entries', 'bytes', 'max_bytes')
+
+
+def _capture_context():
+    """调用方线程的计时器 / 剖析 / 日志上下文"""
+    return current_timer(), current_profile(), get_request_context()
+
+
+class ActorTimeout(Exception):
+    """等待工作线程的结果超时"""
+
+
+class _Task:
+    __slots__ = ('fn', 'future', 'context')
+
+    def __init__(self, fn, future, context):
+        self.fn = fn
+        self.future = future
+        self.context = context
+
+
+class PAGActor:
+    """一个 pypag 工作线程及其独占的导出流程"""
+
+    def __init__(self, index, pipeline):
+        self.index = index
+        self.pipeline = pipeline
+        self.processed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f'pag-actor-{index}', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """在本线程中执行 fn(pipeline)，返回 Future"""
+        future = Future()
+        self._queue.put(_Task(fn, future, _capture_context()))
+        return future
+
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        self._queue.put(None)
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            if not task.future.set_running_or_notify_cancel():
+                continue
+
+            timer, profile, (request_id, endpoint) = task.context
+            if timer is not None:
+                timer.activate()
+            detach_profile = profile.attach_current_thread() if profile is not None else None
+            set_request_context(request_id, endpoint)
+            try:
+                result = task.fn(self.pipeline)
+            except BaseException as e:
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+            finally:
+                if detach_profile is not None:
+                    detach_profile()
+                if timer is not None:
+                    timer.deactivate()
+                clear_request_context()
+                self.processed += 1
+
+
+class PAGActorPool:
+    """按模板哈希把 pypag 工作分派到固定的工作线程"""
+
+    def __init__(self, pag_module, threads=4,
+                 template_cache_max_bytes=512 * 1024 * 1024,
+                 image_cache_max_bytes=256 * 1024 * 1024,
+                 image_fit=None):
+        """
+        Args:
+            pag_module: pypag / libpag 模块
+            threads: 工作线程数（0 表示在调用方线程中执行）
+            template_cache_max_bytes: 模板缓存总容量（按线程数均分）
+            image_cache_max_bytes: 图片缓存总容量（按线程数均分）
+            image_fit: ImageFitPolicy，替换图片按图层尺寸缩小（可选）
+        """
+        self.pag_module = pag_module
+        self.threads = max(threads, 0)
+        shares = max(self.threads, 1)
+        pipelines = [
+            PAGExportPipeline(pag_module,
+                              template_cache_max_bytes=template_cache_max_bytes // shares,
+                              image_cache_max_bytes=image_cache_max_bytes // shares,
+                              image_fit=image_fit)
+            for _ in range(shares)
+        ]
+        self.actors = [PAGActor(i, pipeline) for i, pipeline in enumerate(pipelines)] if self.threads else []
+        # 不启动工作线程时使用的共享 pipeline
+        self._inline_pipeline = None if self.threads else pipelines[0]
+
+    @property
+    def pipelines(self):
+        """所有 pipeline（用于统计和预热）"""
+        if self._inline_pipeline is not None:
+            return [self._inline_pipeline]
+        return [actor.pipeline for actor in self.actors]
+
+    def index_for(self, key):
+        """键对应的工作线程编号（模板哈希为 SHA-256 十六进制，直接取前 8 位）"""
+        if not self.actors:
+            return 0
+        try:
+            value = int(key[:8], 16)
+        except (TypeError, ValueError):
+            value = zlib.crc32(str(key).encode('utf-8'))
+        return value % len(self.actors)
+
+    def submit(self, key, fn):
+        """
+        把 fn(pipeline) 交给 key 对应的工作线程
+
+        Returns:
+            Future
+        """
+        if not self.actors:
+            future = Future()
+            try:
+                future.set_result(fn(self._inline_pipeline))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self.actors[self.index_for(key)].submit(fn)
+
+    def call(self, key, fn, timeout=None):
+        """
+        在 key 对应的工作线程中执行 fn(pipeline) 并等待结果
+
+        Args:
+            timeout: 最长等待秒数（None 表示一直等待）；超时后还在排队的任务会被取消，
+                     已开始的绑定调用无法中断，会在工作线程中执行完，结果丢弃
+
+        Raises:
+            fn() 抛出的异常
+            ActorTimeout: 等待超时
+        """
+        if not self.actors:
+            return fn(self._inline_pipeline)
+        future = self.submit(key, fn)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise ActorTimeout(f'pypag 调用超过 {timeout:g} 秒未完成')
+
+    def broadcast(self, fn):
+        """在每个工作线程中执行 fn(pipeline)，返回结果列表"""
+        if not self.actors:
+            return [fn(self._inline_pipeline)]
+        futures = [actor.submit(fn) for actor in self.actors]
+        return [future.result() for future in futures]
+
+    def cache_stats(self, name):
+        """
+        汇总各线程的缓存统计
+
+        Args:
+            name: 'template_cache' 或 'image_cache'
+        """
+        totals = dict.fromkeys(_SUMMED_FIELDS, 0)
+        for pipeline in self.pipelines:
+            stats = getattr(pipeline, name).stats()
+            for field in _SUMMED_FIELDS:
+                totals[field] += stats.get(field, 0)
+        return totals
+
+    def stats(self):
+        """工作线程统计信息"""
+        return {
+            'threads': self.threads,
+            'queued': [actor.queue_size() for actor in self.actors],
+            'processed': [actor.processed for actor in self.actors],
+        }
+
+    def shutdown(self, wait=True):
+        """停止所有工作线程（已排队的任务会先执行完）"""
+        for actor in self.actors:
+            actor.stop()
+        if wait:
+            for actor in self.actors:
+                actor.join()
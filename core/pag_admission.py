@@ -0,0 +1,129 @@
+"""
+准入控制 - 限制同时执行的 pypag 工作，超出的请求排队，队列满时快速拒绝
+
+线程模式的 Flask 服务器会无限制地接受并发导出，每个导出都持有解码后的模板和
+图片，压力大时机器会先开始 swap，最后被 OOM 杀掉。AdmissionController 放在
+加载模板 / 导出 / 分析这些真正调用 pypag 的代码前面：
+    - 最多 max_concurrent 个请求同时执行
+    - 其余最多 max_queue 个请求排队等待，等待超过 queue_timeout 秒放弃
+    - 队列已满或等待超时抛出 AdmissionRejected，服务器返回 503 + Retry-After
+Retry-After 按当前排队数 × 平均执行时间 / 并发数估算，客户端据此退避。
+"""
+
+import math
+import threading
+import time
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入（队列已满或排队超时）"""
+
+    def __init__(self, message, retry_after=1, reason='queue_full'):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """并发上限 + 有界等待队列"""
+
+    def __init__(self, max_concurrent, max_queue=32, queue_timeout=10.0):
+        """
+        Args:
+            max_concurrent: 同时执行的上限（<= 0 表示不限制）
+            max_queue: 排队等待的上限
+            queue_timeout: 排队最长等待秒数
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        # 平均执行时间（指数移动平均，用于估算 Retry-After）
+        self._avg_hold = None
+
+    @property
+    def enabled(self):
+        return self.max_concurrent > 0
+
+    def retry_after(self):
+        """建议客户端等待的秒数"""
+        with self._cond:
+            return self._retry_after()
+
+    def _retry_after(self):
+        avg = self._avg_hold if self._avg_hold is not None else 1.0
+        return max(1, math.ceil((self.queued + 1) * avg / max(self.max_concurrent, 1)))
+
+    def acquire(self):
+        """
+        获取执行名额
+
+        Returns:
+            float: 排队等待的秒数
+
+        Raises:
+            AdmissionRejected: 队列已满或等待超时
+        """
+        if not self.enabled:
+            return 0.0
+
+        started = time.perf_counter()
+        with self._cond:
+            if self.active < self.max_concurrent and self.queued == 0:
+                self.active += 1
+                self.admitted += 1
+                return 0.0
+
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected('服务器繁忙，请稍后重试', self._retry_after(), 'queue_full')
+
+            self.queued += 1
+            try:
+                deadline = started + self.queue_timeout
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected('排队等待超时，请稍后重试', self._retry_after(), 'timeout')
+                    self._cond.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.active += 1
+            self.admitted += 1
+        return time.perf_counter() - started
+
+    def release(self, held_seconds=None):
+        """
+        归还执行名额
+
+        Args:
+            held_seconds: 本次执行耗时（用于估算 Retry-After）
+        """
+        if not self.enabled:
+            return
+        with self._cond:
+            self.active -= 1
+            if held_seconds is not None:
+                if self._avg_hold is None:
+                    self._avg_hold = held_seconds
+                else:
+                    self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_seconds
+            self._cond.notify()
+
+    def stats(self):
+        """准入统计信息"""
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,161 @@
+"""
+图层分析结果存储 - 按模板哈希记忆 /api/analyze-layers 的结果
+
+分析一个模板要逐个调用 getLayersByEditableIndex / getTotalMatrix 等接口，
+结果只取决于模板内容，因此按模板哈希保存为 JSON：
+内存中保留最近使用的一部分，磁盘上持久化，服务重启后依然有效。
+磁盘上的总容量超过上限时删除最久未使用的结果（包括旧版本遗留的文件）。
+"""
+
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+# 分析结果的格式版本，修改 analyze 逻辑后递增，旧的记忆结果和 ETag 自动失效
+ANALYSIS_VERSION = 1
+
+
+class PAGAnalysisStore:
+    """模板分析结果的内存 + 磁盘存储"""
+
+    def __init__(self, root_dir, max_memory_entries=256, max_bytes=64 * 1024 * 1024):
+        """
+        初始化存储
+
+        Args:
+            root_dir: JSON 文件保存目录
+            max_memory_entries: 内存中保留的结果数量
+            max_bytes: 磁盘上的总字节数上限，超过后淘汰最久未使用的结果
+        """
+        self.root_dir = root_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # 磁盘上的总字节数，第一次写入时扫描目录得到，之后增量维护
+        self._total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root_dir, exist_ok=True)
+
+    @staticmethod
+    def etag_for(template_hash):
+        """分析结果的 ETag（不含引号）"""
+        return f'{template_hash}-v{ANALYSIS_VERSION}'
+
+    def _path_for(self, template_hash):
+        return os.path.join(self.root_dir, f'{self.etag_for(template_hash)}.json')
+
+    def get(self, template_hash):
+        """
+        读取分析结果
+
+        Returns:
+            dict: 分析结果，不存在时返回 None
+        """
+        with self._lock:
+            result = self._memory.get(template_hash)
+            if result is not None:
+                self._memory.move_to_end(template_hash)
+                self.hits += 1
+                return result
+
+        path = self._path_for(template_hash)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 更新访问时间，淘汰时按 mtime 判断最久未使用
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            self._remember(template_hash, result)
+        return result
+
+    def put(self, template_hash, result):
+        """保存分析结果"""
+        with self._lock:
+            self._remember(template_hash, result)
+
+        path = self._path_for(template_hash)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.root_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+                size = f.tell()
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
+            else:
+                # 覆盖已有结果时会多算一次，下次淘汰时重新扫描校正
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._prune(keep=path)
+
+    def stats(self):
+        """存储统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'evictions': self.evictions,
+                'bytes': self._total_bytes or 0,
+            }
+
+    def _scan(self):
+        """列出所有结果文件：([(mtime, size, path), ...], 总字节数)"""
+        files = []
+        total = 0
+        for name in os.listdir(self.root_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.root_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        return files, total
+
+    def _prune(self, keep=None):
+        """总容量超限时删除最久未使用的结果文件（调用方持有锁）"""
+        files, total = self._scan()
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def _remember(self, template_hash, result):
+        """放入内存 LRU（调用方持有锁）"""
+        self._memory[template_hash] = result
+        self._memory.move_to_end(template_hash)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
@@ -7,36 +7,198 @@ PAG 模板批量编辑器 - Python 版本
     或者使用 Node.js PAG SDK
     
 当前实现:
-    提供配置结构和使用示例
-    实际编辑需要 PAG SDK 支持
+    基于 pypag（PAGFile.Load / replaceText / replaceImage / save）批量生成
+    支持多进程模式：每个工作进程只加载一次模板，配置逐批流入
+    支持 CSV / JSONL 流式读取配置，内存占用与输入规模无关
+    支持断点日志，崩溃后 resume=True 跳过已完成的配置
 """
 
+import hashlib
 import json
 import os
+import tempfile
+import time
+import warnings
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+try:
+    from .pag_sdk import load_pag_module
+    from .pag_template_cache import PAGTemplateCache
+    from .pag_image_cache import PAGImageCache
+    from .pag_image_resize import ImageFitPolicy
+except ImportError:
+    from pag_sdk import load_pag_module
+    from pag_template_cache import PAGTemplateCache
+    from pag_image_cache import PAGImageCache
+    from pag_image_resize import ImageFitPolicy
+
+
+@dataclass
+class BatchItemResult:
+    """单个配置的生成结果"""
+    index: int
+    name: str
+    output_path: str
+    success: bool
+    applied: int = 0
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    sha256: Optional[str] = None
+    size: int = 0
+    key: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    """批量生成的汇总：只保留计数和失败项，成功项不留在内存中"""
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    # 失败项（最多 max_failures 个，超出的只计入 failed）
+    failures: List[BatchItemResult] = field(default_factory=list)
+
+
+class BatchCheckpointJournal:
+    """
+    批量生成的断点日志
+    
+    追加写入的 JSONL 文件，每行记录一个已完成配置的 key、输出文件哈希和大小。
+    进程崩溃时最多丢失最后一行（读取时忽略不完整的行，续写前先补上换行），
+    重跑时可据此跳过已完成的配置。
+    """
+    
+    def __init__(self, path: str, fsync_every: int = 100):
+        """
+        Args:
+            path: 日志文件路径
+            fsync_every: 每写入多少条记录强制落盘一次
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self._file = None
+        self._unsynced = 0
+    
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        读取已完成的记录
+        
+        Returns:
+            key -> 记录（output / sha256 / size）
+        """
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时写了一半的行
+                    continue
+                if isinstance(entry, dict) and 'key' in entry:
+                    completed[entry['key']] = entry
+        return completed
+    
+    def reset(self):
+        """清空日志（不续跑时，旧记录不能留到下一次 resume）"""
+        self.close()
+        self._file = open(self.path, 'w', encoding='utf-8')
+    
+    def _open_for_append(self):
+        """续写日志；上次崩溃留下的半行没有换行，先补上，新记录从新的一行开始"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                partial = f.read(1) != b'\n'
+        except OSError:
+            # 文件不存在或为空
+            partial = False
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if partial:
+            self._file.write('\n')
+    
+    def record(self, key: str, result: BatchItemResult):
+        """追加一条完成记录"""
+        if self._file is None:
+            self._open_for_append()
+        
+        self._file.write(json.dumps({
+            'key': key,
+            'index': result.index,
+            'output': result.output_path,
+            'sha256': result.sha256,
+            'size': result.size,
+        }, ensure_ascii=False) + '\n')
+        self._file.flush()
+        
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+    
+    def close(self):
+        """落盘并关闭日志文件"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._unsynced = 0
 
 
 class PAGTemplateBatchEditor:
     """PAG 模板批量编辑器"""
     
-    def __init__(self, template_path: str):
+    def __init__(self, template_path: str, image_fit: Optional[ImageFitPolicy] = None):
         """
         初始化编辑器
         
         Args:
             template_path: PAG 模板文件路径
+            image_fit: 替换图片的缩小策略（默认使用原图；传入 ImageFitPolicy() 时按图层
+                       占位图尺寸缩小，需要 Pillow。缩小后的图片按图层的缩放模式重新适配，
+                       只适合不依赖原图像素尺寸定位的模板）
         """
         self.template_path = template_path
         self.template_name = Path(template_path).stem
+        self.image_fit = image_fit if image_fit is not None else ImageFitPolicy(enabled=False)
+        self._template_bytes = None
+        self._template_cache = None
+        self._image_cache = None
+        # 可编辑图片索引 -> 目标尺寸（模板固定，每个进程只计算一次）
+        self._image_fits = {}
         
-    def generate_batch(self, config_list: List[Dict[str, Any]], output_dir: str):
+    def generate_batch(self, configs: Optional[Iterable[Dict[str, Any]]] = None,
+                       output_dir: Optional[str] = None,
+                       workers: int = 1, chunksize: int = 16,
+                       max_in_flight: Optional[int] = None,
+                       checkpoint: bool = True, resume: bool = False,
+                       verify_hashes: bool = False, max_failures: int = 1000, *,
+                       config_list: Optional[List[Dict[str, Any]]] = None) -> BatchSummary:
         """
         批量生成 PAG 文件
         
         Args:
-            config_list: 配置列表，每个配置包含修改信息
+            configs: 配置列表或任意配置迭代器（如 iter_csv / iter_jsonl）
             output_dir: 输出目录
+            workers: 工作进程数，1 表示在当前进程内串行执行
+            chunksize: 多进程模式下每次派发给工作进程的配置数量
+            max_in_flight: 多进程模式下同时在途的批次数上限（默认 workers * 2）
+            checkpoint: 是否把完成的配置写入断点日志（输出目录下的 .journal.jsonl）
+            resume: 是否跳过断点日志中已完成且输出文件完好的配置（按行号 + key 对应，
+                    配置顺序需与上次一致；为 False 时清空旧日志）
+            verify_hashes: resume 时是否重新计算输出文件哈希进行校验（默认只校验存在和大小）
+            max_failures: 汇总中最多保留的失败项数量
+            config_list: 已废弃，configs 的旧名称
+            
+        Returns:
+            BatchSummary：成功 / 失败数量和失败项，单个配置失败不影响其余配置；
+            成功项只写入断点日志，不保留在内存中，需要逐项结果时请迭代 iter_batch()
             
         示例配置:
             [
@@ -56,61 +218,371 @@ class PAGTemplateBatchEditor:
                 }
             ]
         """
+        if config_list is not None:
+            warnings.warn("generate_batch(config_list=...) 已废弃，请改用 configs",
+                          DeprecationWarning, stacklevel=2)
+            if configs is not None:
+                raise TypeError("configs 和 config_list 不能同时指定")
+            configs = config_list
+        if configs is None or output_dir is None:
+            raise TypeError("generate_batch() 需要 configs 和 output_dir")
+        
+        total = len(configs) if hasattr(configs, '__len__') else None
+        started = time.perf_counter()
+        
+        summary = BatchSummary()
+        for result in self.iter_batch(configs, output_dir, workers=workers,
+                                      chunksize=chunksize, max_in_flight=max_in_flight,
+                                      checkpoint=checkpoint, resume=resume,
+                                      verify_hashes=verify_hashes):
+            summary.total += 1
+            if result.success:
+                summary.succeeded += 1
+            else:
+                summary.failed += 1
+                if len(summary.failures) < max_failures:
+                    summary.failures.append(result)
+                print(f"❌ 生成失败: {result.output_path} - {result.error}")
+            
+            done = summary.total
+            if done % 100 == 0 or done == total:
+                print(f"   进度: {done}/{total or '?'} (失败 {summary.failed})")
+        
+        summary.elapsed = time.perf_counter() - started
+        print(f"✅ 批量生成完成: 成功 {summary.succeeded}，失败 {summary.failed}，耗时 {summary.elapsed:.1f} 秒")
+        return summary
+    
+    def iter_batch(self, configs: Iterable[Dict[str, Any]], output_dir: str,
+                   workers: int = 1, chunksize: int = 16,
+                   max_in_flight: Optional[int] = None,
+                   checkpoint: bool = True, resume: bool = False,
+                   verify_hashes: bool = False) -> Iterator[BatchItemResult]:
+        """
+        流式批量生成，边读取配置边产出结果
+        
+        配置按需从迭代器中读取，多进程模式下最多只有 max_in_flight 个批次在途，
+        内存占用与输入规模无关。多进程模式下结果按完成顺序产出（可用 index 对应）。
+        resume 时跳过的配置不会产出结果，只在结束时打印跳过数量。
+        
+        Args:
+            同 generate_batch
+            
+        Yields:
+            单个配置的生成结果
+        """
         os.makedirs(output_dir, exist_ok=True)
         
-        for i, config in enumerate(config_list):
-            name = config.get('name', f'output_{i}')
-            modifications = config.get('modifications', [])
+        journal = BatchCheckpointJournal(self.journal_path(output_dir)) if checkpoint else None
+        completed = {}
+        if journal is not None:
+            if resume:
+                completed = journal.load()
+            else:
+                journal.reset()
+        skipped = 0
+        
+        def pending_tasks():
+            nonlocal skipped
+            for index, config in enumerate(configs):
+                entry = completed.get(self._row_key(index, config))
+                if entry is not None and self._output_intact(entry, verify_hashes):
+                    skipped += 1
+                    continue
+                yield (index, config, output_dir)
+        
+        try:
+            for result in self._run_tasks(pending_tasks(), workers, chunksize, max_in_flight):
+                if journal is not None and result.success:
+                    journal.record(result.key, result)
+                yield result
+        finally:
+            if journal is not None:
+                journal.close()
+        
+        if skipped:
+            print(f"⏭️  断点续跑：跳过 {skipped} 个已完成的配置")
+    
+    def journal_path(self, output_dir: str) -> str:
+        """断点日志路径"""
+        return os.path.join(output_dir, f'.{self.template_name}.journal.jsonl')
+    
+    @staticmethod
+    def _row_key(index: int, config: Dict[str, Any]) -> str:
+        """
+        配置的唯一标识：行号 + key（没有 key 时用 name）
+        
+        name 可能重复（输出文件互相覆盖），只用 name 会把另一行的完成记录当成本行的，
+        因此总是带上行号；续跑时配置的顺序需要与上次一致
+        """
+        if not isinstance(config, dict):
+            return f"{index}:"
+        return f"{index}:{config.get('key', config.get('name', ''))}"
+    
+    @staticmethod
+    def _config_name(index: int, config: Dict[str, Any]) -> str:
+        """输出文件名中的配置名称（配置格式错误时使用行号）"""
+        if isinstance(config, dict):
+            return config.get('name', f'output_{index}')
+        return f'output_{index}'
+    
+    @staticmethod
+    def _output_intact(entry: Dict[str, Any], verify_hashes: bool) -> bool:
+        """检查断点日志记录的输出文件是否仍然完好"""
+        output_path = entry.get('output')
+        try:
+            if os.path.getsize(output_path) != entry.get('size'):
+                return False
+        except (OSError, TypeError):
+            return False
+        
+        if verify_hashes:
+            return _file_sha256(output_path) == entry.get('sha256')
+        return True
+    
+    def _run_tasks(self, tasks, workers: int, chunksize: int,
+                   max_in_flight: Optional[int]) -> Iterator[BatchItemResult]:
+        """执行生成任务：串行，或在进程池中按批次流式执行"""
+        if workers <= 1:
+            for task in tasks:
+                yield self._process_config(task)
+            return
+        
+        # 进程池相关模块导入较慢（multiprocessing），只在多进程模式下导入
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+        
+        if max_in_flight is None:
+            max_in_flight = workers * 2
+        
+        def new_executor():
+            # 每个工作进程只加载一次模板，之后配置按批次流入。
+            # 使用 spawn：调用方进程可能是多线程的且已加载 pypag（例如在服务器中调用），
+            # fork 会把其他线程持有的锁和绑定层状态复制进子进程；pypag 在 _init_worker 中导入
+            return ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker,
+                                       initargs=(self.template_path, self.image_fit))
+        
+        executor = new_executor()
+        in_flight = {}  # future -> 批次
+        
+        def collect(done, broken=False):
+            # 某个工作进程崩溃（绑定层段错误、被 OOM 杀死）时整个进程池失效，
+            # 所有在途批次都会抛出 BrokenProcessPool：无法得知是哪一项导致的，
+            # 在途的配置全部记为失败，换一个新的进程池继续处理剩余配置
+            nonlocal executor
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    yield from future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    for task in chunk:
+                        yield self._failed_result(task, '工作进程异常退出')
+            if broken:
+                for future, chunk in list(in_flight.items()):
+                    wait([future])
+                    del in_flight[future]
+                    try:
+                        yield from future.result()
+                    except BrokenProcessPool:
+                        for task in chunk:
+                            yield self._failed_result(task, '工作进程异常退出')
+                executor.shutdown(wait=True)
+                executor = new_executor()
+        
+        try:
+            for chunk in _chunked(tasks, chunksize):
+                try:
+                    future = executor.submit(_process_chunk_in_worker, chunk)
+                except BrokenProcessPool:
+                    # 进程池在上一批次结果取回前已经失效
+                    yield from collect(list(in_flight), broken=True)
+                    future = executor.submit(_process_chunk_in_worker, chunk)
+                in_flight[future] = chunk
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    yield from collect(done)
             
+            while in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的批次
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _process_config(self, task) -> BatchItemResult:
+        """生成单个配置，异常记录在结果中而不是抛出"""
+        index, config, output_dir = task
+        started = time.perf_counter()
+        # 格式错误的配置（不是字典等）只让这一项失败，不影响工作进程
+        try:
+            if not isinstance(config, dict):
+                raise TypeError(f"配置必须是字典，实际为 {type(config).__name__}")
+            name = self._config_name(index, config)
+            modifications = config.get('modifications', [])
             output_path = os.path.join(output_dir, f'{self.template_name}_{name}.pag')
+            applied = self._apply_modifications(modifications, output_path)
+            return BatchItemResult(index, name, output_path, True, applied=applied,
+                                   elapsed=time.perf_counter() - started,
+                                   sha256=_file_sha256(output_path),
+                                   size=os.path.getsize(output_path),
+                                   key=self._row_key(index, config))
+        except Exception as e:
+            return self._failed_result(task, str(e), time.perf_counter() - started)
+    
+    def _failed_result(self, task, error: str, elapsed: float = 0.0) -> BatchItemResult:
+        """生成失败的结果（工作进程崩溃时在主进程中构造）"""
+        index, config, output_dir = task
+        name = self._config_name(index, config)
+        output_path = os.path.join(output_dir, f'{self.template_name}_{name}.pag')
+        return BatchItemResult(index, name, output_path, False, error=error,
+                               elapsed=elapsed, key=self._row_key(index, config))
+    
+    def _load_template_copy(self):
+        """返回模板的一份全新副本（模板只读取、解析一次）"""
+        if self._template_cache is None:
+            pag_module = load_pag_module()
+            if pag_module is None:
+                raise RuntimeError("未安装 pypag 或 libpag")
+            with open(self.template_path, 'rb') as f:
+                self._template_bytes = f.read()
+            self._template_cache = PAGTemplateCache(pag_module)
+            # Logo、公共背景等重复使用的图片在每个进程内只解码一次
+            self._image_cache = PAGImageCache(pag_module)
+        
+        pag, _ = self._template_cache.checkout(self._template_bytes)
+        if not pag:
+            raise RuntimeError(f"无法加载 PAG 模板: {self.template_path}")
+        return pag
             
-            print(f"生成: {output_path}")
-            self._apply_modifications(modifications, output_path)
-            
-    def _apply_modifications(self, modifications: List[Dict], output_path: str):
+    def _apply_modifications(self, modifications: List[Dict], output_path: str) -> int:
         """
         应用修改并保存
         
-        注意: 这需要 PAG SDK 支持
-        当前为示例代码
+        Args:
+            modifications: 修改列表（text: value；image: imagePath）
+            output_path: 输出文件路径
+            
+        Returns:
+            应用的修改数量
         """
-        # TODO: 使用 PAG SDK 实际实现
-        # 1. 加载模板
-        # pag_file = PAG.load(self.template_path)
+        pag = self._load_template_copy()
         
-        # 2. 应用修改
-        # for mod in modifications:
-        #     if mod['type'] == 'text':
-        #         pag_file.replace_text(mod['layerIndex'], mod['value'])
-        #     elif mod['type'] == 'image':
-        #         pag_file.replace_image(mod['layerIndex'], mod['imagePath'])
+        applied = 0
+        for mod in modifications:
+            layer_index = mod.get('layerIndex', 0)
+            mod_type = mod.get('type')
+            
+            if mod_type == 'text':
+                text_data = pag.getTextData(layer_index)
+                if not text_data:
+                    raise ValueError(f"文本图层 {layer_index} 不存在")
+                text_data.text = mod.get('value', '')
+                pag.replaceText(layer_index, text_data)
+                applied += 1
+            
+            elif mod_type == 'image':
+                image_path = mod.get('imagePath', mod.get('value'))
+                if not image_path or not os.path.exists(image_path):
+                    raise FileNotFoundError(f"图片文件不存在: {image_path}")
+                image = self._image_cache.from_path(image_path, fit=self._image_fit_for(pag, layer_index))
+                if not image:
+                    raise ValueError(f"无法加载图片: {image_path}")
+                pag.replaceImage(layer_index, image)
+                applied += 1
         
-        # 3. 保存
-        # pag_file.save(output_path)
+        # 先保存到同目录的临时文件再原子替换：保存失败或进程崩溃时
+        # 不会留下半个文件，也不会破坏上次生成的完整结果
+        fd, temp_path = tempfile.mkstemp(suffix='.pag.tmp', dir=os.path.dirname(output_path) or '.')
+        os.close(fd)
+        try:
+            if not pag.save(temp_path):
+                raise RuntimeError(f"保存失败: {output_path}")
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
         
-        print(f"  - 应用了 {len(modifications)} 个修改")
+        return applied
+    
+    def _image_fit_for(self, pag, editable_index: int):
+        """图片图层需要的图片尺寸（未启用或无法获取时返回 None）"""
+        if not self.image_fit.active:
+            return None
+        if editable_index not in self._image_fits:
+            fit = None
+            pag_module = load_pag_module()
+            try:
+                layers = pag.getLayersByEditableIndex(editable_index, pag_module.LayerType.Image)
+                if layers:
+                    fit = self.image_fit.target_for_layer(layers[0])
+            except Exception:
+                fit = None
+            self._image_fits[editable_index] = fit
+        return self._image_fits[editable_index]
+
+
+# 工作进程内的编辑器实例（每个进程初始化一次，模板随之只加载一次）
+_worker_editor = None
+
+
+def _init_worker(template_path: str, image_fit: Optional[ImageFitPolicy] = None):
+    """工作进程初始化：创建编辑器并预先加载模板"""
+    global _worker_editor
+    _worker_editor = PAGTemplateBatchEditor(template_path, image_fit=image_fit)
+    try:
+        _worker_editor._load_template_copy()
+    except Exception as e:
+        # 加载失败时每个配置都会记录同样的错误，不在这里中断进程池
+        print(f"❌ 工作进程加载模板失败: {e}")
+
+
+def _process_chunk_in_worker(chunk) -> List[BatchItemResult]:
+    """在工作进程中生成一批配置"""
+    return [_worker_editor._process_config(task) for task in chunk]
+
+
+def _file_sha256(path: str) -> str:
+    """计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunked(iterable, size: int):
+    """把迭代器按 size 切分为列表批次（惰性读取）"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
         
 
 class PAGBatchConfigGenerator:
     """PAG 批量配置生成器"""
     
     @staticmethod
-    def from_csv(csv_path: str) -> List[Dict]:
+    def iter_csv(csv_path: str) -> Iterator[Dict]:
         """
-        从 CSV 文件生成配置
+        逐行读取 CSV 并生成配置（流式，内存占用与文件大小无关）
         
         CSV 格式:
             name,title,subtitle,phone
             张三,产品经理,创新部,138****1234
             李四,设计师,设计部,139****5678
             
-        Returns:
-            配置列表
+        Yields:
+            单个配置
         """
         import csv
         
-        configs = []
-        with open(csv_path, 'r', encoding='utf-8') as f:
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 config = {
@@ -130,9 +602,35 @@ class PAGBatchConfigGenerator:
                         })
                         layer_index += 1
                 
-                configs.append(config)
-                
-        return configs
+                yield config
+    
+    @staticmethod
+    def iter_jsonl(jsonl_path: str) -> Iterator[Dict]:
+        """
+        逐行读取 JSONL 配置（每行一个配置对象，空行忽略）
+        
+        Yields:
+            单个配置
+        """
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{jsonl_path}:{line_no} 不是有效的 JSON: {e}") from e
+    
+    @staticmethod
+    def from_csv(csv_path: str) -> List[Dict]:
+        """
+        从 CSV 文件生成配置（一次性读入，大文件请使用 iter_csv）
+            
+        Returns:
+            配置列表
+        """
+        return list(PAGBatchConfigGenerator.iter_csv(csv_path))
     
     @staticmethod
     def from_json(json_path: str) -> List[Dict]:
@@ -184,12 +682,15 @@ def example_batch_namecard():
 def example_from_csv():
     """示例: 从 CSV 批量生成"""
     
-    # 1. 从 CSV 加载配置
-    configs = PAGBatchConfigGenerator.from_csv('data/employees.csv')
+    # 1. 从 CSV 流式读取配置（不会一次性读入内存）
+    configs = PAGBatchConfigGenerator.iter_csv('data/employees.csv')
     
-    # 2. 批量生成
+    # 2. 批量生成（多进程，边读边生成）
     editor = PAGTemplateBatchEditor('templates/employee_card.pag')
-    editor.generate_batch(configs, 'output/employee_cards')
+    for result in editor.iter_batch(configs, 'output/employee_cards', workers=os.cpu_count()):
+        # 3. 查看失败项
+        if not result.success:
+            print(f"{result.name}: {result.error}")
     
 
 def example_save_config():
@@ -285,8 +786,6 @@ batchGenerate().catch(console.error);
 # ============================================================
 
 if __name__ == '__main__':
-    import sys
-    
     print("=" * 60)
     print("PAG 模板批量编辑器")
     print("=" * 60)
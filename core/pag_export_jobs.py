@@ -0,0 +1,612 @@
+"""
+PAG 后台导出任务 - 提交后立即返回任务 ID，由工作进程池完成导出
+
+大模板 + 多张替换图片的导出要好几秒，放在请求线程里会一直占着连接。
+这里把导出交给固定大小的进程池：
+    - 模板通过模板仓库的文件路径传给工作进程，不在进程间复制模板字节
+    - 每个工作进程启动时创建自己的 PAGExportPipeline（自带模板 / 图片缓存）
+    - 结果写到结果目录，完成的任务超过保留时间后连同结果文件一起清理
+    - 排队任务数超过上限时拒绝提交（由调用方返回 503）
+
+任务状态：queued → running → done / failed
+
+任务状态以 <jobId>.json 的形式和结果文件一起保存在结果目录里，gunicorn 的
+任何一个工作进程都能回答状态查询 / 下载 / 取消，不要求请求落到提交任务的进程。
+提交任务的进程退出（max_requests 定期重启、部署重启）时：已开始的任务等待完成，
+尚未开始的任务标记为失败（503，需要重新提交）；进程被强制杀掉而留下的
+queued / running 记录在查询时识别出来并标记为失败。
+结果目录必须是本机目录（同一台机器上的工作进程共享）。
+
+同一个进程池也用于批量导出（一个模板 + 多组修改配置），
+结果按完成顺序逐个返回，不落盘。
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from .pag_export_pipeline import PAGExportPipeline, ExportError
+    from .pag_sdk import load_pag_module, import_error_message
+    from .pag_metrics import StageTimer, observe_stages
+    from .pag_logging import get_logger
+except ImportError:
+    from pag_export_pipeline import PAGExportPipeline, ExportError
+    from pag_sdk import load_pag_module, import_error_message
+    from pag_metrics import StageTimer, observe_stages
+    from pag_logging import get_logger
+
+
+log = get_logger('jobs')
+
+
+class JobQueueFull(Exception):
+    """排队中的任务数已达到上限"""
+
+
+# 工作进程内的导出流程（由 _init_worker 创建）
+_worker_pipeline = None
+
+
+def _init_worker(template_cache_max_bytes, image_cache_max_bytes, image_fit=None):
+    """工作进程初始化：导入 PAG SDK 并创建导出流程"""
+    global _worker_pipeline
+
+    pag_module = load_pag_module()
+    if pag_module is None:
+        log.error("导出工作进程无法导入 PAG SDK: %s", import_error_message())
+        return
+    _worker_pipeline = PAGExportPipeline(
+        pag_module,
+        template_cache_max_bytes=template_cache_max_bytes,
+        image_cache_max_bytes=image_cache_max_bytes,
+        image_fit=image_fit,
+    )
+
+
+def _read_record(path):
+    """读取任务记录，不存在或损坏时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_record(path, record):
+    """先写临时文件再重命名，其他进程不会读到写了一半的记录"""
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def _cancel_marker(record_path):
+    """
+    任务被取消的标记文件
+
+    取消时先写标记再删除记录：读出记录后、写回之前被取消的任务，写回后检查
+    标记就能发现，不会把已删除的任务重新写回来
+    """
+    return os.path.splitext(record_path)[0] + '.cancelled'
+
+
+def _process_alive(pid):
+    """同一台机器上的进程是否仍在运行"""
+    if os.name == 'nt':
+        # Windows 下只有一个服务器进程（不支持 gunicorn），其他 PID 都是之前运行留下的；
+        # 而且 os.kill(pid, 0) 在 Windows 上会结束目标进程
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _run_export_job(template_path, template_id, modifications, images, output_path, record_path=None):
+    """
+    在工作进程中执行一个导出任务
+
+    Returns:
+        tuple: (输出文件大小, 各阶段耗时)
+    """
+    if record_path is not None:
+        record = _read_record(record_path)
+        if record is None:
+            # 排队期间已被其他进程删除（DELETE /api/jobs/<id>）
+            raise ExportError('任务已取消', 410)
+        record['state'] = 'running'
+        _write_record(record_path, record)
+        if os.path.exists(_cancel_marker(record_path)):
+            # 读出记录之后被取消，撤销刚才的写回
+            try:
+                os.unlink(record_path)
+            except OSError:
+                pass
+            raise ExportError('任务已取消', 410)
+
+    if _worker_pipeline is None:
+        raise ExportError(f'PAG SDK 未安装: {import_error_message()}', 500)
+
+    timer = StageTimer()
+    with timer.bind():
+        try:
+            with open(template_path, 'rb') as f:
+                pag_bytes = f.read()
+        except FileNotFoundError:
+            raise ExportError(f'模板不存在: {template_id}', 404)
+
+        output_data = _worker_pipeline.export(pag_bytes, modifications, images=images,
+                                              template_hash=template_id)
+
+    # 先写临时文件再重命名，轮询方不会读到半个文件
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(output_data)
+    os.replace(temp_path, output_path)
+    return len(output_data), timer.stages
+
+
+def _run_variant(template_path, template_id, modifications, images):
+    """
+    在工作进程中导出一个变体
+
+    Returns:
+        tuple: (修改后的 PAG 文件字节, 各阶段耗时)
+    """
+    if _worker_pipeline is None:
+        raise ExportError(f'PAG SDK 未安装: {import_error_message()}', 500)
+
+    timer = StageTimer()
+    with timer.bind():
+        with open(template_path, 'rb') as f:
+            pag_bytes = f.read()
+        output_data = _worker_pipeline.export(pag_bytes, modifications, images=images,
+                                              template_hash=template_id)
+    return output_data, timer.stages
+
+
+def _referenced_images(modifications, images):
+    """只挑出本组修改用到的图片，避免把所有图片都发给每个工作进程"""
+    names = {mod.get('value') for mod in modifications
+             if isinstance(mod, dict) and mod.get('type') == 'image'}
+    return {name: images[name] for name in names if isinstance(name, str) and name in images}
+
+
+def variant_modifications(variants):
+    """
+    校验批量导出的变体，取出每个变体的修改配置
+
+    Args:
+        variants: 序列，每个元素是 modifications 数组，或 {"name": ..., "modifications": [...]}
+
+    Returns:
+        list: 每个变体的修改配置列表
+
+    Raises:
+        ExportError: 某个变体格式不正确（400）
+    """
+    result = []
+    for index, variant in enumerate(variants):
+        modifications = variant.get('modifications', []) if isinstance(variant, dict) else variant
+        if not isinstance(modifications, list) or not all(isinstance(mod, dict) for mod in modifications):
+            raise ExportError(f'variants[{index}] 必须是修改项对象的数组，或包含 modifications 数组的对象', 400)
+        result.append(modifications)
+    return result
+
+
+class ExportJob:
+    """一个导出任务的状态"""
+
+    # 保存到任务记录中的字段
+    FIELDS = ('job_id', 'template_id', 'filename', 'state', 'owner_pid', 'created_at',
+              'finished_at', 'size', 'error', 'error_status')
+
+    def __init__(self, job_id, template_id, filename, output_path):
+        self.job_id = job_id
+        self.template_id = template_id
+        self.filename = filename
+        self.output_path = output_path
+        self.state = 'queued'
+        # 提交任务（持有进程池）的服务器进程
+        self.owner_pid = os.getpid()
+        self.created_at = time.time()
+        self.finished_at = None
+        self.size = 0
+        self.error = None
+        self.error_status = None
+
+    @property
+    def status(self):
+        return self.state
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'failed')
+
+    def to_record(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_record(cls, record, output_path):
+        job = cls(record['job_id'], record['template_id'], record['filename'], output_path)
+        for field in cls.FIELDS:
+            if field in record:
+                setattr(job, field, record[field])
+        return job
+
+    def to_dict(self):
+        info = {
+            'jobId': self.job_id,
+            'status': self.status,
+            'templateId': self.template_id,
+            'filename': self.filename,
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at,
+        }
+        if self.finished_at is not None:
+            info['elapsed'] = round(self.finished_at - self.created_at, 3)
+        if self.status == 'done':
+            info['size'] = self.size
+        if self.error:
+            info['error'] = self.error
+        return info
+
+
+# 任务 ID 是 uuid4 的十六进制，也用作结果目录中的文件名
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# 扫描结果目录清理过期任务的最小间隔（秒）
+_PURGE_INTERVAL = 60
+# 各状态任务数的缓存时间（秒）：/metrics 和 /api/health 频繁调用，不能每次都扫描结果目录
+_STATE_COUNTS_TTL = 5
+
+
+class ExportJobManager:
+    """后台导出任务管理：进程池 + 结果目录中的任务记录"""
+
+    def __init__(self, template_store, result_dir, workers=2, max_pending=32,
+                 result_ttl=3600,
+                 template_cache_max_bytes=512 * 1024 * 1024,
+                 image_cache_max_bytes=256 * 1024 * 1024,
+                 image_fit=None):
+        """
+        Args:
+            template_store: PAGTemplateStore，任务按模板 ID 引用模板
+            result_dir: 导出结果和任务记录的保存目录（同一台机器上的服务器进程共享）
+            workers: 工作进程数
+            max_pending: 本进程未完成任务（排队 + 运行中）的上限
+            result_ttl: 完成的任务及结果文件保留秒数
+            template_cache_max_bytes: 每个工作进程的模板缓存容量
+            image_cache_max_bytes: 每个工作进程的图片缓存容量
+            image_fit: ImageFitPolicy，替换图片按图层尺寸缩小（可选）
+        """
+        self.template_store = template_store
+        self.result_dir = result_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._worker_args = (template_cache_max_bytes, image_cache_max_bytes, image_fit)
+        # 本进程提交、尚未完成的任务：job_id -> Future
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._closing = False
+        self._last_purge = 0.0
+        self._state_counts = None
+        self._state_counts_at = 0.0
+        os.makedirs(result_dir, exist_ok=True)
+
+    def submit(self, template_id, modifications, images=None, filename=None):
+        """
+        提交导出任务
+
+        Args:
+            template_id: 模板仓库中的模板 ID
+            modifications: 修改配置列表
+            images: 图片字段名 -> 图片字节（可选）
+            filename: 下载时使用的原始文件名（可选）
+
+        Returns:
+            ExportJob
+
+        Raises:
+            JobQueueFull: 未完成任务数已达上限
+        """
+        self.purge_expired()
+
+        job_id = uuid.uuid4().hex
+        job = ExportJob(job_id, template_id, filename or f'{template_id[:12]}.pag',
+                        self._output_path(job_id))
+
+        with self._lock:
+            pending = len(self._futures)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f'导出任务已满（{pending}/{self.max_pending}），请稍后重试')
+            # 占位，提交失败时移除
+            self._futures[job_id] = None
+
+        try:
+            self._save(job)
+            future = self._get_executor().submit(
+                _run_export_job,
+                self.template_store.path_for(template_id),
+                template_id,
+                modifications,
+                images or {},
+                job.output_path,
+                self._record_path(job_id),
+            )
+        except Exception:
+            with self._lock:
+                self._futures.pop(job_id, None)
+            self._remove(self._record_path(job_id))
+            raise
+
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda future: self._on_done(job, future))
+        return job
+
+    def iter_variants(self, template_id, variants, images=None, max_in_flight=None):
+        """
+        并行导出同一模板的多组修改，按完成顺序逐个返回
+
+        同时提交给进程池的变体数不超过 max_in_flight，
+        调用方停止迭代（例如客户端断开）时取消尚未开始的变体。
+        模板和变体在调用时立即检查（不是在第一次迭代时），
+        调用方可以在开始发送响应之前返回 404 / 400。
+
+        Args:
+            template_id: 模板仓库中的模板 ID
+            variants: 变体序列（见 variant_modifications）
+            images: 图片字段名 -> 图片字节，各变体共用（可选）
+            max_in_flight: 同时在途的变体数（默认工作进程数 × 2）
+
+        Returns:
+            迭代器，逐个产出 (变体序号, PAG 字节或 None, 错误信息或 None)
+
+        Raises:
+            ExportError: 模板不存在（404）或变体格式不正确（400）
+        """
+        modification_sets = variant_modifications(variants)
+        template_path = self.template_store.path_for(template_id)
+        if not os.path.exists(template_path):
+            raise ExportError(f'模板不存在: {template_id}', 404)
+        if max_in_flight is None:
+            max_in_flight = self.workers * 2
+        return self._iter_variants(template_path, template_id, modification_sets,
+                                   images or {}, max_in_flight)
+
+    def _iter_variants(self, template_path, template_id, variants, images, max_in_flight):
+        executor = self._get_executor()
+        pending = {}
+
+        def collect(done):
+            for future in sorted(done, key=pending.get):
+                index = pending.pop(future)
+                try:
+                    output_data, stages = future.result()
+                except ExportError as e:
+                    yield index, None, e.message
+                except Exception as e:
+                    yield index, None, f'{type(e).__name__}: {e}'
+                else:
+                    observe_stages('export_pag_batch', stages, 200)
+                    yield index, output_data, None
+
+        try:
+            for index, modifications in enumerate(variants):
+                future = executor.submit(_run_variant, template_path, template_id, modifications,
+                                         _referenced_images(modifications, images))
+                pending[future] = index
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def get(self, job_id):
+        """按 ID 获取任务（可以是其他服务器进程提交的），不存在或已过期清理时返回 None"""
+        self.purge_expired()
+        job = self._load(job_id)
+        if job is None or job.finished:
+            return job
+
+        with self._lock:
+            tracked = job_id in self._futures
+        if not tracked and not _process_alive(job.owner_pid):
+            # 提交任务的进程已经退出，任务不会再有结果
+            job.state = 'failed'
+            job.error = '任务所在的服务进程已退出，请重新提交'
+            job.error_status = 503
+            job.finished_at = time.time()
+            self._save(job)
+            log.warning("导出任务 %s 的服务进程 %s 已退出，标记为失败", job_id, job.owner_pid)
+        return job
+
+    def cancel(self, job_id):
+        """
+        取消任务并删除结果
+
+        Returns:
+            bool: 任务是否存在
+        """
+        if self._load(job_id) is None:
+            return False
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        # 先写取消标记再删除记录：其他进程中的任务开始时会跳过，
+        # 正在写回记录的一方写完后看到标记会撤销写入，完成时会丢弃结果
+        with open(_cancel_marker(self._record_path(job_id)), 'w'):
+            pass
+        self._remove(self._record_path(job_id))
+        self._remove(self._output_path(job_id))
+        return True
+
+    def purge_expired(self, force=False):
+        """清理超过保留时间的已完成任务及其结果文件（按间隔扫描结果目录）"""
+        now = time.time()
+        if not force and now - self._last_purge < _PURGE_INTERVAL:
+            return
+        self._last_purge = now
+
+        deadline = now - self.result_ttl
+        for job in self._iter_jobs():
+            if job.finished and job.finished_at < deadline:
+                self._remove(self._record_path(job.job_id))
+                self._remove(job.output_path)
+        # 取消标记只需要保留到任务不可能再被写回（远短于保留时间）
+        for name in self._list_names():
+            path = os.path.join(self.result_dir, name)
+            try:
+                if name.endswith('.cancelled') and os.path.getmtime(path) < deadline:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def state_counts(self):
+        """
+        各状态的任务数（结果目录中所有进程的任务）
+
+        统计需要读取所有任务记录，结果缓存 _STATE_COUNTS_TTL 秒，
+        频繁抓取 /metrics 时扫描次数与任务数量无关
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._state_counts is not None and now - self._state_counts_at < _STATE_COUNTS_TTL:
+                return dict(self._state_counts)
+
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for job in self._iter_jobs():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        with self._lock:
+            self._state_counts = counts
+            self._state_counts_at = now
+        return dict(counts)
+
+    def stats(self):
+        """任务统计信息"""
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'started': self._executor is not None,
+            'jobs': self.state_counts(),
+        }
+
+    def shutdown(self, wait=False):
+        """
+        关闭进程池：尚未开始的任务取消并标记为失败（503，需要重新提交）
+
+        Args:
+            wait: 是否等待已开始的任务完成
+        """
+        self._closing = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self):
+        # 第一次提交任务时才启动进程池，不使用任务接口的部署不会多出工作进程
+        with self._lock:
+            if self._executor is None:
+                # spawn 而不是 fork：服务器进程是多线程的（请求线程、actor、剖析采样）且已加载 pypag，
+                # fork 出的子进程会继承被其他线程持有的锁和绑定层状态；
+                # 工作进程在 _init_worker 中自己导入 pypag
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=self._worker_args,
+                )
+            return self._executor
+
+    def _on_done(self, job, future):
+        if future.cancelled():
+            if self._closing:
+                job.error = '服务进程正在退出，任务未执行，请重新提交'
+                job.error_status = 503
+            else:
+                job.error = '任务已取消'
+                job.error_status = 410
+        else:
+            error = future.exception()
+            if error is None:
+                job.size, stages = future.result()
+                observe_stages('submit_export_job', stages, 200)
+            elif isinstance(error, ExportError):
+                job.error = error.message
+                job.error_status = error.status
+            else:
+                job.error = f'{type(error).__name__}: {error}'
+                job.error_status = 500
+        job.state = 'failed' if job.error else 'done'
+        job.finished_at = time.time()
+
+        with self._lock:
+            self._futures.pop(job.job_id, None)
+        record_path = self._record_path(job.job_id)
+        if os.path.exists(record_path) and not os.path.exists(_cancel_marker(record_path)):
+            self._save(job)
+        # 任务已被删除（可能是其他进程处理的 DELETE），或在检查之后、保存之前被取消：
+        # 丢弃结果，连同被写回的记录
+        if os.path.exists(_cancel_marker(record_path)) or not os.path.exists(record_path):
+            self._remove(record_path)
+            self._remove(job.output_path)
+            return
+        if job.error:
+            log.error("导出任务失败 %s: %s", job.job_id, job.error)
+
+    def _record_path(self, job_id):
+        return os.path.join(self.result_dir, f'{job_id}.json')
+
+    def _output_path(self, job_id):
+        return os.path.join(self.result_dir, f'{job_id}.pag')
+
+    def _save(self, job):
+        _write_record(self._record_path(job.job_id), job.to_record())
+
+    def _load(self, job_id):
+        if not _JOB_ID_RE.match(job_id or ''):
+            return None
+        record = _read_record(self._record_path(job_id))
+        if record is None:
+            return None
+        return ExportJob.from_record(record, self._output_path(job_id))
+
+    def _list_names(self):
+        try:
+            return os.listdir(self.result_dir)
+        except OSError:
+            return []
+
+    def _iter_jobs(self):
+        for name in self._list_names():
+            if name.endswith('.json'):
+                job = self._load(name[:-5])
+                if job is not None:
+                    yield job
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,371 @@
+"""
+PAG 导出流程 - 把修改配置应用到模板并输出 PAG 字节
+
+原先这段逻辑直接写在 /api/export-pag 的请求处理函数里，只能在 Flask
+请求线程中运行。抽出来之后，同步接口和后台导出任务的工作进程共用一份实现：
+每个进程持有一个 PAGExportPipeline（自带模板缓存和图片缓存）。
+"""
+
+import base64
+import logging
+import os
+
+try:
+    from .pag_template_cache import PAGTemplateCache
+    from .pag_image_cache import PAGImageCache
+    from .pag_io import PAGBufferIO
+    from .pag_metrics import stage
+    from .pag_logging import get_logger
+    from .pag_profiler import traced
+except ImportError:
+    from pag_template_cache import PAGTemplateCache
+    from pag_image_cache import PAGImageCache
+    from pag_io import PAGBufferIO
+    from pag_metrics import stage
+    from pag_logging import get_logger
+    from pag_profiler import traced
+
+log = get_logger('export')
+
+
+class ExportError(Exception):
+    """导出失败（模板无法加载、保存失败等），status 为建议的 HTTP 状态码"""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+    def __reduce__(self):
+        # 从工作进程传回时保留状态码
+        return (ExportError, (self.message, self.status))
+
+
+class PAGExportPipeline:
+    """模板 + 修改配置 → 修改后的 PAG 字节"""
+
+    def __init__(self, pag_module,
+                 template_cache_max_bytes=512 * 1024 * 1024,
+                 image_cache_max_bytes=256 * 1024 * 1024,
+                 image_fit=None):
+        """
+        Args:
+            pag_module: pypag / libpag 模块
+            template_cache_max_bytes: 已解析模板缓存容量
+            image_cache_max_bytes: 解码图片缓存容量
+            image_fit: ImageFitPolicy，替换图片按图层尺寸缩小（可选，None 表示使用原图）
+        """
+        self.pag_module = pag_module
+        self.image_fit = image_fit
+        self.template_cache = PAGTemplateCache(pag_module, max_bytes=template_cache_max_bytes)
+        self.image_cache = PAGImageCache(pag_module, max_bytes=image_cache_max_bytes)
+        # 模板 / 图片从内存加载，结果直接保存为字节（绑定不支持时退回临时文件）
+        self.io = PAGBufferIO(pag_module)
+
+    def export(self, pag_bytes, modifications, images=None, template_hash=None, failures=None):
+        """
+        应用修改并导出
+
+        单个修改项失败（图片无法解码、图层不存在等）只记录日志，其余修改照常应用并保存
+
+        Args:
+            pag_bytes: 模板文件字节
+            modifications: 修改配置列表（与 /api/export-pag 的 modifications 相同）
+            images: 图片字段名 -> 图片字节（对应 FormData 中上传的图片，可选）
+            template_hash: 已计算好的模板内容哈希（可选）
+            failures: 传入列表时，未能应用的修改项以 (layerIndex, 原因) 追加到其中
+
+        Returns:
+            bytes: 修改后的 PAG 文件
+
+        Raises:
+            ExportError: 模板无法加载或保存失败
+        """
+        # 请求被剖析时返回计数代理，统计每个绑定方法的调用次数
+        libpag = traced(self.pag_module)
+        images = images or {}
+        if failures is None:
+            failures = []
+        # 仅用于调试输出的绑定调用（numImages、matrix() 等）只在 DEBUG 级别执行
+        debug = log.isEnabledFor(logging.DEBUG)
+
+        # 加载 PAG 文件（命中缓存时直接复制已解析的模板）
+        with stage('load'):
+            pag, template_hash = self.template_cache.checkout(pag_bytes, key=template_hash)
+        
+        if not pag:
+            raise ExportError('无法加载 PAG 文件', 400)
+        pag = traced(pag)
+        
+        if debug:
+            log.debug("PAG 文件加载成功 (sha256=%s)", template_hash[:12])
+            log.debug("- 图片层数量: %s", pag.numImages())
+            log.debug("- 文本层数量: %s", pag.numTexts())
+            
+            # 尝试获取可编辑的图片索引
+            try:
+                # 检查 LayerType 是否存在
+                if hasattr(libpag, 'LayerType') and hasattr(libpag.LayerType, 'Image'):
+                    image_editable_indices = pag.getEditableIndices(libpag.LayerType.Image)
+                    log.debug("- 可编辑图片索引 (Image类型): %s", image_editable_indices)
+                else:
+                    log.debug("- LayerType.Image 不可用，跳过索引检查")
+            except Exception as e:
+                log.debug("- 获取可编辑索引失败: %s", e)
+                log.debug("- 将直接使用 layerIndex 作为 editableImageIndex")
+        
+        # 应用修改
+        for mod in modifications:
+            layer_index = mod.get('layerIndex')
+            mod_type = mod.get('type')
+            value = mod.get('value')
+            
+            if mod_type == 'text':
+                # 替换文本
+                with stage('replace_text'):
+                    text_data = pag.getTextData(layer_index)
+                    if text_data:
+                        text_data.text = value
+                        pag.replaceText(layer_index, text_data)
+                    else:
+                        failures.append((layer_index, '文本图层不存在'))
+                log.debug("替换文本 - 图层 %s: %s", layer_index, value)
+            
+            elif mod_type == 'image':
+                # 替换图片
+                # ⚠️ 重要：pypag 的 replaceImage 需要 editableImageIndex，不是 layerIndex！
+                # layer_index 是前端传来的可编辑图片的索引（0, 1, 2...）
+                # 直接作为 editableImageIndex 使用
+                
+                editable_image_index = layer_index
+                
+                # value 可能是：
+                # 1. FormData 字段名（如 "image_0"）- 优先
+                # 2. base64 数据字符串
+                # 3. 文件路径
+                try:
+                    # 情况 1：从 FormData 中获取图片文件
+                    if value in images:
+                        image_file_bytes = images[value]
+                        log.debug("从 FormData 获取图片 - EditableIndex %s: %s", editable_image_index, value)
+                        
+                        try:
+                            # ✨ 使用 libpag 新 API：从图层直接获取原始占位图的变换信息
+                            # 先获取原始图层信息
+                            with stage('layer_lookup'):
+                                original_layers = pag.getLayersByEditableIndex(editable_image_index, libpag.LayerType.Image)
+                            log.debug("- 找到 %s 个对应的图层", len(original_layers) if original_layers else 0)
+                            
+                            # 获取原始图片的 matrix 和 scaleMode
+                            original_matrix = None
+                            original_scale_mode = None
+                            layer_name = None
+                            
+                            if original_layers and len(original_layers) > 0:
+                                original_layer = original_layers[0]
+                                if debug and hasattr(original_layer, 'layerName'):
+                                    layer_name = original_layer.layerName()
+                                    log.debug("- 原始图层名称: %s", layer_name)
+                                
+                                # ✅ 方案 1（优先）：使用 libpag 新 API - 从图层直接获取变换信息
+                                # pypag 实际提供的 API（已实现）：
+                                # - original_layer.getOriginalImageMatrix()  ✅ 获取原始图片矩阵
+                                # - original_layer.getOriginalImageBounds()  ✅ 获取原始图片边界
+                                # - original_layer.getOriginalScaleFactor()  ✅ 获取原始缩放因子
+                                # - original_layer.getOriginalAnchorPoint()  ✅ 获取原始锚点
+                                
+                                # 尝试获取原始图片的 matrix
+                                if hasattr(original_layer, 'getOriginalImageMatrix'):
+                                    try:
+                                        original_matrix = original_layer.getOriginalImageMatrix()
+                                        log.debug("- ✅ 从图层获取原始 matrix: %s", original_matrix)
+                                    except Exception as e:
+                                        log.debug("- ⚠️ getOriginalImageMatrix() 调用失败: %s", e)
+                                
+                                # 尝试获取原始图片的边界（可选，用于调试）
+                                if debug and hasattr(original_layer, 'getOriginalImageBounds'):
+                                    try:
+                                        original_bounds = original_layer.getOriginalImageBounds()
+                                        log.debug("- 原始图片边界: %s", original_bounds)
+                                    except Exception as e:
+                                        log.debug("- ⚠️ getOriginalImageBounds() 调用失败: %s", e)
+                                
+                                # 注意：pypag 没有提供 getOriginalScaleMode()
+                                # scaleMode 需要从已替换的图片获取，或使用默认值
+                                
+                                # ⚠️ 方案 2（回退）：如果新 API 不可用，从已替换的图片获取（仅第二次替换时有效）
+                                if original_matrix is None and hasattr(original_layer, 'getReplacedImage'):
+                                    try:
+                                        original_image = original_layer.getReplacedImage()
+                                        if original_image:
+                                            log.debug("- 回退方案：从已替换图片获取变换信息")
+                                            if hasattr(original_image, 'matrix'):
+                                                original_matrix = original_image.matrix()
+                                                log.debug("- 从已替换图片获取 matrix: %s", original_matrix)
+                                            if hasattr(original_image, 'scaleMode') and original_scale_mode is None:
+                                                original_scale_mode = original_image.scaleMode()
+                                                log.debug("- 从已替换图片获取 scaleMode: %s", original_scale_mode)
+                                        else:
+                                            log.debug("- ⚠️ getReplacedImage() 返回 None（首次替换且新 API 不可用）")
+                                    except Exception as e:
+                                        log.debug("- 回退方案失败: %s", e)
+                            
+                            # 图层只需要占位图尺寸的像素，大图先缩小再解码、嵌入
+                            fit = None
+                            if self.image_fit is not None and original_layers:
+                                fit = self.image_fit.target_for_layer(original_layers[0])
+                                log.debug("- 目标图片尺寸: %s", fit)
+                            # 原始 matrix 按原图像素定位，缩小后需要按同样的倍数放大 matrix；
+                            # 绑定不支持 preScale 时不缩小，避免图片在图层中变小
+                            if fit is not None and original_matrix is not None and not hasattr(original_matrix, 'preScale'):
+                                log.debug("- matrix 不支持 preScale，使用原图")
+                                fit = None
+                            
+                            # 加载新图片（同一图片只解码一次；下面会修改 matrix/scaleMode，按模板 + 图层区分缓存）
+                            with stage('image_decode'):
+                                new_image, fit_scale = self.image_cache.from_bytes_fitted(
+                                    image_file_bytes, variant=(template_hash, editable_image_index), fit=fit)
+                                new_image = traced(new_image)
+                            if new_image:
+                                if debug:
+                                    log.debug("PAGImage 创建成功 - EditableIndex %s", editable_image_index)
+                                    log.debug("- 新图片尺寸: %sx%s", new_image.width(), new_image.height())
+                                    log.debug("- 新图片默认 matrix: %s", new_image.matrix())
+                                    log.debug("- 新图片默认 scaleMode: %s", new_image.scaleMode())
+                                
+                                # 🔑 关键：应用原始图层的变换信息到新图片
+                                # ⚠️ 重要：必须先设置 scaleMode，再设置 matrix！
+                                # 因为 setScaleMode 可能会重新计算 matrix
+                                
+                                # 步骤 1：设置 scaleMode
+                                if original_scale_mode is not None:
+                                    try:
+                                        log.debug("✨ 应用原始 scaleMode: %s", original_scale_mode)
+                                        new_image.setScaleMode(original_scale_mode)
+                                        log.debug("✅ ScaleMode 应用成功")
+                                    except Exception as e:
+                                        log.debug("⚠️ 应用 scaleMode 失败: %s", e)
+                                else:
+                                    # 如果没有原始 scaleMode，但有 matrix，就不设置 scaleMode
+                                    # 让 matrix 完全控制变换
+                                    if original_matrix is None:
+                                        # 只有在没有 matrix 的情况下才使用默认 scaleMode
+                                        if hasattr(libpag, 'PAGScaleMode') and hasattr(libpag.PAGScaleMode, 'LetterBox'):
+                                            try:
+                                                log.debug("ℹ️ 使用默认 scaleMode: LetterBox（保持宽高比）")
+                                                new_image.setScaleMode(libpag.PAGScaleMode.LetterBox)
+                                            except Exception as e:
+                                                log.debug("⚠️ 设置默认 scaleMode 失败: %s", e)
+                                    else:
+                                        log.debug("ℹ️ 跳过 scaleMode 设置（优先使用 matrix）")
+                                
+                                # 步骤 2：设置 matrix（必须在 scaleMode 之后）
+                                if original_matrix is not None:
+                                    try:
+                                        if fit_scale != (1.0, 1.0):
+                                            log.debug("✨ 图片已缩小，matrix 放大 %.3f x %.3f", *fit_scale)
+                                            original_matrix.preScale(*fit_scale)
+                                        log.debug("✨ 应用原始 matrix: %s", original_matrix)
+                                        new_image.setMatrix(original_matrix)
+                                        if debug:
+                                            log.debug("✅ Matrix 应用成功，新 matrix: %s", new_image.matrix())
+                                    except Exception as e:
+                                        log.debug("⚠️ 应用 matrix 失败: %s", e)
+                                else:
+                                    log.debug("ℹ️ 未获取到原始 matrix，新图片将使用默认变换")
+                                
+                                # 执行替换
+                                log.debug("执行 replaceImage(editableImageIndex=%s, ...)", editable_image_index)
+                                with stage('replace_image'):
+                                    result = pag.replaceImage(editable_image_index, new_image)
+                                log.debug("replaceImage 返回值: %s", result)
+                                
+                                # 验证替换结果（仅调试）
+                                if debug and original_layers and len(original_layers) > 0 and hasattr(original_layer, 'getReplacedImage'):
+                                    try:
+                                        # 重用前面已定义的 original_layer 变量，保持一致性
+                                        replaced_img = original_layer.getReplacedImage()
+                                        log.debug("替换后 getReplacedImage 类型: %s 是否为 None: %s", type(replaced_img), replaced_img is None)
+                                    except Exception as e:
+                                        log.debug("替换后 getReplacedImage 调用异常: %s", e)
+                                if debug:
+                                    log.debug("替换后图片层数量: %s", pag.numImages())
+                            else:
+                                log.error("PAGImage.FromPath 返回 None - EditableIndex %s", editable_image_index)
+                                failures.append((layer_index, '图片解码失败'))
+                        
+                        except Exception as e:
+                            log.exception("图片替换过程出错: %s", e)
+                            failures.append((layer_index, f'图片替换出错: {e}'))
+                    
+                    # 情况 2：base64 数据
+                    elif value.startswith('data:image/'):
+                        # 处理 base64 图片数据
+                        # 格式: data:image/png;base64,iVBORw0KGgo...
+                        base64_data = value.split(',', 1)[1] if ',' in value else value
+                        image_bytes = base64.b64decode(base64_data)
+                        
+                        # 加载图片（同一图片只解码一次）
+                        with stage('image_decode'):
+                            image = traced(self.image_cache.from_bytes(image_bytes))
+                        if image:
+                            with stage('replace_image'):
+                                result = pag.replaceImage(layer_index, image)
+                            log.debug("替换图片 - 图层 %s: base64 数据 (%s 字节), 结果: %s", layer_index, len(image_bytes), result)
+                        else:
+                            log.error("无法加载图片 - 图层 %s", layer_index)
+                            failures.append((layer_index, '图片解码失败'))
+                            
+                    elif os.path.exists(value):
+                        # 如果是文件路径
+                        with stage('image_decode'):
+                            image = traced(self.image_cache.from_path(value))
+                        if image:
+                            with stage('replace_image'):
+                                result = pag.replaceImage(layer_index, image)
+                            log.debug("替换图片 - 图层 %s: 文件 %s, 结果: %s", layer_index, value, result)
+                        else:
+                            log.error("无法加载图片文件 - %s", value)
+                            failures.append((layer_index, '图片解码失败'))
+                    else:
+                        log.warning("无效的图片数据 - 图层 %s: %s...", layer_index, value[:50])
+                        failures.append((layer_index, '无效的图片数据'))
+                        
+                except Exception as e:
+                    log.exception("图片替换失败 - 图层 %s: %s", layer_index, str(e))
+                    failures.append((layer_index, f'图片替换失败: {e}'))
+            
+            elif mod_type == 'imageTransform':
+                # 🆕 应用图层变换（位置、锚点、缩放、旋转、不透明度）
+                # ⚠️ 注意：变换不会持久化到文件，需要在渲染时应用
+                transform = mod.get('transform', {})
+                log.debug("记录图层变换 - 图层 %s: %s", layer_index, transform)
+                log.debug("⚠️ 变换将在渲染时应用（不会保存到文件）")
+                
+                # 不在这里应用变换，因为它们不会持久化
+                # 变换会在渲染时由 apply_transforms_to_layers() 函数应用
+        
+        # 保存修改后的文件
+        # 注意：新版本的 pypag 支持 save() 方法
+        if debug:
+            log.debug("========================================")
+            log.debug("准备保存文件")
+            log.debug("- 当前图片层数: %s", pag.numImages())
+            log.debug("========================================")
+        
+        # 直接保存为字节（绑定不支持时内部退回临时文件）
+        with stage('save'):
+            output_data = self.io.save(pag)
+        
+        if not output_data:
+            raise ExportError('PAG 文件保存失败，save() 返回 False', 500)
+        
+        # 对比文件大小
+        input_size = len(pag_bytes)
+        output_size = len(output_data)
+        log.debug("文件大小对比:")
+        log.debug("- 输入文件: %s 字节", input_size)
+        log.debug("- 输出文件: %s 字节", output_size)
+        log.debug("- 差异: %+d 字节", output_size - input_size)
+        
+        return output_data
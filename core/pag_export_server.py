@@ -22,14 +22,61 @@ API 端点：
         - 返回：修改后的 PAG 文件
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 import io
 import json
 import base64
-from pathlib import Path
+from contextlib import contextmanager
 import tempfile
+import hmac
 import os
+import re
+import time
+import uuid
+
+try:
+    from .pag_template_cache import template_key
+    from .pag_template_store import PAGTemplateStore, is_valid_template_id
+    from .pag_analysis_store import PAGAnalysisStore
+    from .pag_transforms import LayerTransformCache
+    from .pag_export_pipeline import ExportError
+    from .pag_actors import PAGActorPool, ActorTimeout
+    from .pag_image_resize import ImageFitPolicy, pillow_available
+    from .pag_export_jobs import ExportJobManager, JobQueueFull
+    from .pag_zip_stream import iter_zip
+    from .pag_sdk import load_pag_module, import_error_message
+    from .pag_metrics import (REGISTRY, REQUEST_SECONDS, IN_FLIGHT, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+                              ADMISSION_WAIT_SECONDS, StageTimer, stage, current_timer)
+    from .pag_logging import configure_logging, get_logger, set_request_context, clear_request_context
+    from .pag_profiler import RequestProfile, ProfileStore, traced
+    from .pag_wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, WireFormatError, read_request as read_wire_request
+    from .pag_output_cache import PAGOutputCache, output_key
+    from .pag_singleflight import SingleFlight, SingleFlightTimeout
+    from .pag_admission import AdmissionController, AdmissionRejected
+except ImportError:
+    from pag_template_cache import template_key
+    from pag_template_store import PAGTemplateStore, is_valid_template_id
+    from pag_analysis_store import PAGAnalysisStore
+    from pag_transforms import LayerTransformCache
+    from pag_export_pipeline import ExportError
+    from pag_actors import PAGActorPool, ActorTimeout
+    from pag_image_resize import ImageFitPolicy, pillow_available
+    from pag_export_jobs import ExportJobManager, JobQueueFull
+    from pag_zip_stream import iter_zip
+    from pag_sdk import load_pag_module, import_error_message
+    from pag_metrics import (REGISTRY, REQUEST_SECONDS, IN_FLIGHT, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+                             ADMISSION_WAIT_SECONDS, StageTimer, stage, current_timer)
+    from pag_logging import configure_logging, get_logger, set_request_context, clear_request_context
+    from pag_profiler import RequestProfile, ProfileStore, traced
+    from pag_wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, WireFormatError, read_request as read_wire_request
+    from pag_output_cache import PAGOutputCache, output_key
+    from pag_singleflight import SingleFlight, SingleFlightTimeout
+    from pag_admission import AdmissionController, AdmissionRejected
+
+# 日志级别 / 格式由 PAG_LOG_LEVEL、PAG_LOG_FORMAT 控制（默认 INFO，DEBUG 日志不输出）
+configure_logging()
+log = get_logger('server')
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -38,31 +85,95 @@ CORS(app)  # 允许跨域请求
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
 app.config['JSON_AS_ASCII'] = False  # 支持中文
 
-# 注意：需要安装 PAG Python SDK
-# pip install libpag
+# 已解析模板缓存容量（按模板字节数计算）
+app.config['TEMPLATE_CACHE_MAX_BYTES'] = int(os.environ.get('PAG_TEMPLATE_CACHE_MB', '512')) * 1024 * 1024
 
-# 优先使用项目本地的 pypag.pyd（包含 Matrix.getTranslateX/Y 等方法）
-import sys
-from pathlib import Path
+# 解码后替换图片的缓存容量（按 宽 × 高 × 4 估算）
+app.config['IMAGE_CACHE_MAX_BYTES'] = int(os.environ.get('PAG_IMAGE_CACHE_MB', '256')) * 1024 * 1024
 
-# 获取项目根目录
-project_root = Path(__file__).parent.parent
-pypag_path = str(project_root / 'pylib')
+# 替换图片按图层占位图尺寸缩小后再解码、嵌入（需要 Pillow，未安装时使用原图）
+# OVERSAMPLE：在图层所需尺寸基础上额外保留的倍数；FORMAT：空为保持原格式，jpeg 把不透明图片转为 JPEG
+app.config['IMAGE_DOWNSCALE'] = os.environ.get('PAG_IMAGE_DOWNSCALE', '1') == '1'
+app.config['IMAGE_OVERSAMPLE'] = float(os.environ.get('PAG_IMAGE_OVERSAMPLE', '1'))
+app.config['IMAGE_FORMAT'] = os.environ.get('PAG_IMAGE_FORMAT', '')
+app.config['IMAGE_QUALITY'] = int(os.environ.get('PAG_IMAGE_QUALITY', '90'))
 
-if pypag_path not in sys.path:
-    sys.path.insert(0, pypag_path)
-    print(f"✅ 添加本地 pypag 路径到 sys.path: {pypag_path}")
+# 模板仓库（POST /api/templates 上传一次，之后用 templateId 引用）
+app.config['TEMPLATE_STORE_DIR'] = os.environ.get(
+    'PAG_TEMPLATE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'pag_templates'))
+app.config['TEMPLATE_STORE_MAX_BYTES'] = int(os.environ.get('PAG_TEMPLATE_STORE_MB', '2048')) * 1024 * 1024
 
-PAG_AVAILABLE = False
-PAG_MODULE = None
-IMPORT_ERROR_MSG = ""
+# 图层分析结果的持久化目录（按模板哈希记忆 /api/analyze-layers 的结果）
+app.config['ANALYSIS_STORE_DIR'] = os.environ.get(
+    'PAG_ANALYSIS_STORE_DIR', os.path.join(tempfile.gettempdir(), 'pag_analysis'))
+app.config['ANALYSIS_STORE_MAX_BYTES'] = int(os.environ.get('PAG_ANALYSIS_STORE_MB', '64')) * 1024 * 1024
 
-try:
-    import pypag as libpag
-    PAG_AVAILABLE = True
-    PAG_MODULE = libpag
-    print("✅ 成功导入 pypag (作为 libpag)")
-    print(f"   模块位置: {libpag.__file__ if hasattr(libpag, '__file__') else '内置模块'}")
+# 导出结果缓存：相同的 (模板, 修改配置, 图片) 直接返回上次的结果，不再调用 pypag
+app.config['OUTPUT_CACHE_DIR'] = os.environ.get(
+    'PAG_OUTPUT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pag_outputs'))
+app.config['OUTPUT_CACHE_MAX_BYTES'] = int(os.environ.get('PAG_OUTPUT_CACHE_MB', '1024')) * 1024 * 1024
+# 导出响应的 Cache-Control（结果可能包含用户上传的图片，默认只允许客户端缓存）
+app.config['OUTPUT_CACHE_CONTROL'] = os.environ.get('PAG_OUTPUT_CACHE_CONTROL', 'private, max-age=86400')
+
+# 同时到达的相同导出 / 分析只执行一次，其余请求等待共享结果；等待超过该秒数返回 503
+app.config['SINGLEFLIGHT_TIMEOUT'] = float(os.environ.get('PAG_SINGLEFLIGHT_TIMEOUT', '120'))
+
+# 准入控制：同时调用 pypag（加载 / 导出 / 分析）的请求数上限、排队上限和排队超时，
+# 超出时快速返回 503 + Retry-After，而不是把内存耗尽。PAG_MAX_CONCURRENT_EXPORTS=0 表示不限制
+app.config['MAX_CONCURRENT_EXPORTS'] = int(os.environ.get('PAG_MAX_CONCURRENT_EXPORTS', str(os.cpu_count() or 4)))
+app.config['EXPORT_QUEUE_SIZE'] = int(os.environ.get('PAG_EXPORT_QUEUE_SIZE', '32'))
+app.config['EXPORT_QUEUE_TIMEOUT'] = float(os.environ.get('PAG_EXPORT_QUEUE_TIMEOUT', '10'))
+
+# pypag 工作线程数：pypag 对象只在所属工作线程中创建和使用，请求按模板哈希路由，
+# 模板 / 图片缓存容量按线程数均分。0 表示在请求线程中直接调用 pypag（共享一份缓存）。
+# 默认与每个进程的请求线程数（PAG_SERVER_THREADS）相同：gunicorn 按 CPU 核数启动进程，
+# 线程数再按核数算会随核数平方增长
+app.config['PAG_ACTOR_THREADS'] = int(os.environ.get(
+    'PAG_ACTOR_THREADS', os.environ.get('PAG_SERVER_THREADS', '2')))
+# 请求等待 pypag 工作线程的最长秒数，超时返回 504（0 表示不限制）。
+# gunicorn 的 timeout 在 gthread 模式下只是进程心跳超时，不会中断单个慢请求，
+# 请求级的期限只能在这里设置；已开始的绑定调用无法中断，会在工作线程中执行完
+app.config['PAG_CALL_TIMEOUT'] = float(os.environ.get('PAG_CALL_TIMEOUT', '60'))
+
+# 后台导出任务（POST /api/jobs/export）：工作进程数、未完成任务上限、结果保留时间
+app.config['EXPORT_JOB_WORKERS'] = int(os.environ.get('PAG_EXPORT_JOB_WORKERS', '2'))
+app.config['EXPORT_JOB_MAX_PENDING'] = int(os.environ.get('PAG_EXPORT_JOB_MAX_PENDING', '32'))
+app.config['EXPORT_JOB_RESULT_TTL'] = int(os.environ.get('PAG_EXPORT_JOB_RESULT_TTL', '3600'))
+app.config['EXPORT_JOB_RESULT_DIR'] = os.environ.get(
+    'PAG_EXPORT_JOB_RESULT_DIR', os.path.join(tempfile.gettempdir(), 'pag_export_jobs'))
+
+# 按需剖析：请求带 X-PAG-Profile: <token> 头时，该请求在采样剖析器下运行并统计
+# pypag 绑定调用。未配置令牌时剖析功能关闭。令牌只接受请求头（查询参数会进访问日志）
+app.config['PROFILE_TOKEN'] = os.environ.get('PAG_PROFILE_TOKEN', '')
+app.config['PROFILE_INTERVAL'] = float(os.environ.get('PAG_PROFILE_INTERVAL_MS', '5')) / 1000
+app.config['PROFILE_MAX_STORED'] = int(os.environ.get('PAG_PROFILE_MAX_STORED', '50'))
+
+# 工作进程启动时预热的模板数量（模板仓库中最近使用的模板）
+app.config['WARM_TEMPLATES'] = int(os.environ.get('PAG_WARM_TEMPLATES', '8'))
+
+# 注意：需要安装 PAG Python SDK
+# pip install libpag
+
+# 优先使用项目本地的 pypag.pyd（包含 Matrix.getTranslateX/Y 等方法），其次系统安装的 libpag
+libpag = load_pag_module()
+PAG_AVAILABLE = libpag is not None
+PAG_MODULE = libpag
+IMPORT_ERROR_MSG = import_error_message()
+
+
+def print_pag_sdk_status():
+    """打印 PAG SDK 导入结果和 Matrix API 自检（启动服务器时调用，导入模块时不输出）"""
+    if not PAG_AVAILABLE:
+        print("⚠️ 警告：未安装 libpag 或 pypag，将使用模拟模式")
+        print(f"   详细错误: {IMPORT_ERROR_MSG}")
+        return
+    
+    if libpag.__name__ == 'pypag':
+        print("✅ 成功导入 pypag (作为 libpag)")
+        print(f"   模块位置: {libpag.__file__ if hasattr(libpag, '__file__') else '内置模块'}")
+    else:
+        print("✅ 成功导入 libpag (系统安装版)")
+        print(f"   ⚠️ 警告: 系统版本可能不支持新的 Matrix API")
     
     # 验证 Matrix API
     if hasattr(libpag, 'Matrix'):
@@ -71,27 +182,309 @@ try:
         print(f"   Matrix API 状态: {'✅ 新版 (支持 getTranslateX/Y)' if has_new_api else '⚠️ 旧版 (不支持 getTranslateX/Y)'}")
         if has_new_api:
             print(f"   测试 Matrix.MakeTrans(100, 200): X={test_matrix.getTranslateX()}, Y={test_matrix.getTranslateY()}")
-except ImportError as e1:
+
+# 同步导出流程：每个 pypag 工作线程持有自己的导出流程（按内容哈希缓存已解析的模板，
+# 同一张替换图片只解码一次，模板 / 图片从内存加载，结果直接保存为字节），
+# 同一模板总是路由到同一个工作线程
+image_fit = ImageFitPolicy(
+    enabled=app.config['IMAGE_DOWNSCALE'],
+    oversample=app.config['IMAGE_OVERSAMPLE'],
+    format=app.config['IMAGE_FORMAT'] or None,
+    quality=app.config['IMAGE_QUALITY'],
+)
+
+pag_actors = PAGActorPool(
+    PAG_MODULE,
+    threads=app.config['PAG_ACTOR_THREADS'],
+    template_cache_max_bytes=app.config['TEMPLATE_CACHE_MAX_BYTES'],
+    image_cache_max_bytes=app.config['IMAGE_CACHE_MAX_BYTES'],
+    image_fit=image_fit,
+)
+
+template_store = PAGTemplateStore(app.config['TEMPLATE_STORE_DIR'],
+                                  max_bytes=app.config['TEMPLATE_STORE_MAX_BYTES'])
+
+analysis_store = PAGAnalysisStore(app.config['ANALYSIS_STORE_DIR'],
+                                  max_bytes=app.config['ANALYSIS_STORE_MAX_BYTES'])
+
+output_cache = PAGOutputCache(app.config['OUTPUT_CACHE_DIR'],
+                              max_bytes=app.config['OUTPUT_CACHE_MAX_BYTES'])
+
+admission = AdmissionController(
+    app.config['MAX_CONCURRENT_EXPORTS'],
+    max_queue=app.config['EXPORT_QUEUE_SIZE'],
+    queue_timeout=app.config['EXPORT_QUEUE_TIMEOUT'],
+)
+
+# 按内容哈希合并正在进行的相同工作（导出按输入规范化哈希，分析按模板哈希）
+export_flight = SingleFlight('export')
+analysis_flight = SingleFlight('analysis')
+
+profile_store = ProfileStore(max_entries=app.config['PROFILE_MAX_STORED'])
+
+# 后台导出任务（进程池在第一次提交任务时才启动）
+export_jobs = ExportJobManager(
+    template_store,
+    app.config['EXPORT_JOB_RESULT_DIR'],
+    workers=app.config['EXPORT_JOB_WORKERS'],
+    max_pending=app.config['EXPORT_JOB_MAX_PENDING'],
+    result_ttl=app.config['EXPORT_JOB_RESULT_TTL'],
+    template_cache_max_bytes=app.config['TEMPLATE_CACHE_MAX_BYTES'],
+    image_cache_max_bytes=app.config['IMAGE_CACHE_MAX_BYTES'],
+    image_fit=image_fit,
+)
+
+
+def _cache_metric(field):
+    """抓取时读取模板 / 图片缓存的统计值"""
+    def collect():
+        return [(('template',), pag_actors.cache_stats('template_cache')[field]),
+                (('image',), pag_actors.cache_stats('image_cache')[field]),
+                (('output',), output_cache.stats()[field])]
+    return collect
+
+
+REGISTRY.callback('pag_cache_hits_total', '缓存命中次数', _cache_metric('hits'), ('cache',), 'counter')
+REGISTRY.callback('pag_cache_misses_total', '缓存未命中次数', _cache_metric('misses'), ('cache',), 'counter')
+REGISTRY.callback('pag_cache_evictions_total', '缓存淘汰次数', _cache_metric('evictions'), ('cache',), 'counter')
+REGISTRY.callback('pag_cache_bytes', '缓存占用字节数（图片按解码后估算）', _cache_metric('bytes'), ('cache',))
+REGISTRY.callback('pag_singleflight_total', '合并的相同工作（role=leader 实际执行，shared 共享结果）',
+                  lambda: [((f.name, role), f.stats()[role]) for f in (export_flight, analysis_flight)
+                           for role in ('leaders', 'shared')],
+                  ('group', 'role'), 'counter')
+REGISTRY.callback('pag_admission_requests', '占用 / 等待 pypag 执行名额的请求数',
+                  lambda: [(('active',), admission.stats()['active']),
+                           (('queued',), admission.stats()['queued'])], ('state',))
+REGISTRY.callback('pag_admission_rejected_total', '未被准入（返回 503）的请求数',
+                  lambda: [((), admission.stats()['rejected'])], (), 'counter')
+REGISTRY.callback('pag_actor_queue_size', '各 pypag 工作线程排队的任务数',
+                  lambda: [((str(i),), n) for i, n in enumerate(pag_actors.stats()['queued'])], ('actor',))
+REGISTRY.callback('pag_export_jobs', '后台导出任务数（按状态，最多延迟 5 秒）',
+                  lambda: [((state,), n) for state, n in export_jobs.state_counts().items()], ('state',))
+
+
+def _profile_token_ok(value):
+    """剖析令牌校验（未配置令牌时一律拒绝）"""
+    token = app.config['PROFILE_TOKEN']
+    return bool(token) and bool(value) and hmac.compare_digest(value, token)
+
+
+@app.before_request
+def _start_request_context():
+    # 请求 ID：沿用上游传入的 X-Request-ID，否则生成一个，日志中每条都会带上
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    set_request_context(g.request_id, request.endpoint)
+    
+    flag = request.headers.get('X-PAG-Profile')
+    if flag and _profile_token_ok(flag):
+        g.profile = RequestProfile(interval=app.config['PROFILE_INTERVAL'])
+        g.profile.start()
+
+
+@app.after_request
+def _finish_request_context(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        timer = g.get('metrics_timer')
+        summary = profile.to_dict(
+            requestId=g.request_id,
+            endpoint=request.endpoint,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            stages={k: round(v, 6) for k, v in (timer.stages if timer else {}).items()},
+        )
+        profile_store.put(profile.profile_id, summary, profile.sampler.collapsed())
+        response.headers['X-PAG-Profile-Id'] = profile.profile_id
+        log.info("剖析完成 %s: %s %s 用时 %.3fs，采样 %d 次，绑定调用 %d 次",
+                 profile.profile_id, request.method, request.path, profile.duration,
+                 profile.sampler.samples, summary['bindingCallsTotal'])
+    return response
+
+
+@app.teardown_request
+def _clear_request_context(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+    clear_request_context()
+
+
+@app.before_request
+def _start_request_metrics():
+    # 每个请求一个阶段计时器，导出流程中的 stage() 耗时记到这里
+    g.metrics_endpoint = request.endpoint or 'unknown'
+    g.metrics_started = time.perf_counter()
+    g.metrics_timer = StageTimer()
+    g.metrics_timer.activate()
+    IN_FLIGHT.inc(g.metrics_endpoint)
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    # after_request 按注册的逆序执行，本函数先于 _finish_request_context 运行：
+    # 这里只读取计时器，剖析摘要还要用到各阶段耗时，计时器在 teardown 中清除
+    timer = g.get('metrics_timer')
+    if timer is None or g.get('metrics_observed'):
+        return response
+    g.metrics_observed = True
+    timer.deactivate()
+    
+    endpoint = g.metrics_endpoint
+    status = str(response.status_code)
+    finished = time.perf_counter()
+    REQUEST_SECONDS.observe(finished - g.metrics_started, endpoint, request.method, status)
+    timer.observe(endpoint, status)
+    
+    # 响应体发送完（包括流式响应）时记录 send 阶段并减少并发计数
+    def on_close():
+        timer.stages = {'send': time.perf_counter() - finished}
+        timer.observe(endpoint, status)
+        IN_FLIGHT.dec(endpoint)
+    
+    response.call_on_close(on_close)
+    return response
+
+
+@app.teardown_request
+def _abort_request_metrics(exc):
+    timer = g.pop('metrics_timer', None)
+    if timer is not None and not g.pop('metrics_observed', False):
+        # 未走到 after_request（未处理的异常）时补上清理
+        timer.deactivate()
+        IN_FLIGHT.dec(g.metrics_endpoint)
+
+
+def warm_up(max_templates=None):
+    """
+    预热当前进程：把模板仓库中最近使用的模板解析进模板缓存
+    
+    由 gunicorn 的 post_worker_init 钩子在每个工作进程启动时调用，
+    避免第一批请求都去解析模板。
+    
+    Returns:
+        int: 预热的模板数量
+    """
+    if not PAG_AVAILABLE:
+        return 0
+    
+    if max_templates is None:
+        max_templates = app.config['WARM_TEMPLATES']
+    
+    warmed = 0
+    for template_id in template_store.recent(max_templates):
+        pag_bytes = template_store.get(template_id)
+        if pag_bytes is None:
+            continue
+        try:
+            # 在模板所属的工作线程中加载，之后的请求命中该线程的缓存
+            loaded = pag_actors.call(template_id, lambda pipeline, data=pag_bytes, key=template_id:
+                                     pipeline.template_cache.checkout(data, key=key)[0] is not None)
+        except Exception as e:
+            log.warning("预热模板失败 %s: %s", template_id[:12], e)
+            continue
+        if loaded:
+            warmed += 1
+    return warmed
+
+
+class APIError(Exception):
+    """请求参数错误，由 errorhandler 统一转换为 JSON 响应"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@app.errorhandler(APIError)
+def handle_api_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+@app.errorhandler(ActorTimeout)
+def handle_actor_timeout(e):
+    return jsonify({'error': str(e)}), 504
+
+
+def _call_timeout():
+    """pag_actors.call 的等待期限"""
+    return app.config['PAG_CALL_TIMEOUT'] or None
+
+
+@app.errorhandler(AdmissionRejected)
+def handle_admission_rejected(e):
+    response = jsonify({'error': e.message, 'reason': e.reason})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+@contextmanager
+def admitted():
+    """
+    在准入控制下执行 pypag 工作
+
+    排队时间记入 pag_admission_queue_wait_seconds 和 queue_wait 阶段
+
+    Raises:
+        AdmissionRejected: 队列已满或排队超时（由 errorhandler 转换为 503 + Retry-After）
+    """
+    endpoint = request.endpoint or '-'
+    started = time.perf_counter()
     try:
-        import libpag
-        PAG_AVAILABLE = True
-        PAG_MODULE = libpag
-        print("✅ 成功导入 libpag (系统安装版)")
-        print(f"   ⚠️ 警告: 系统版本可能不支持新的 Matrix API")
-    except ImportError as e2:
-        PAG_AVAILABLE = False
-        IMPORT_ERROR_MSG = f"pypag: {str(e1)}, libpag: {str(e2)}"
-        print("⚠️ 警告：未安装 libpag 或 pypag，将使用模拟模式")
-        print(f"   详细错误: {IMPORT_ERROR_MSG}")
+        waited = admission.acquire()
+    except AdmissionRejected as e:
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, endpoint, e.reason)
+        log.warning("拒绝请求 (%s): 执行中 %d，排队 %d", e.reason, admission.active, admission.queued)
+        raise
+    ADMISSION_WAIT_SECONDS.observe(waited, endpoint, 'admitted')
+    if waited:
+        timer = current_timer()
+        if timer is not None:
+            timer.add('queue_wait', waited)
+    
+    held_from = time.perf_counter()
+    try:
+        yield
+    finally:
+        admission.release(time.perf_counter() - held_from)
 
 
-def apply_transforms_to_layers(pag, modifications):
+def read_template_from_request():
+    """
+    从请求中读取模板：上传的 pagFile 或已注册的 templateId
+
+    Returns:
+        tuple: (模板字节, 内容哈希, 文件名)
+    """
+    if 'pagFile' in request.files:
+        pag_file = request.files['pagFile']
+        pag_bytes = pag_file.read()
+        return pag_bytes, template_key(pag_bytes), pag_file.filename
+
+    template_id = request.form.get('templateId') or request.args.get('templateId')
+    if not template_id:
+        raise APIError('缺少 PAG 文件（pagFile 或 templateId）')
+
+    pag_bytes = template_store.get(template_id)
+    if pag_bytes is None:
+        # 模板可能已被淘汰，客户端应重新 POST /api/templates
+        raise APIError(f'模板不存在: {template_id}', 404)
+    return pag_bytes, template_id, f'{template_id[:12]}.pag'
+
+
+def apply_transforms_to_layers(pag, modifications, state=None):
     """
     应用变换到图层（运行时应用，需要在渲染前调用）
     
     Args:
         pag: PAG 文件对象
         modifications: 修改配置列表
+        state: LayerTransformCache（可选）。逐帧渲染时传入同一个实例，
+               图层对象只查找一次，没有变化的属性不会重复下发
     
     Returns:
         int: 应用的变换数量
@@ -99,72 +492,10 @@ def apply_transforms_to_layers(pag, modifications):
     if not PAG_AVAILABLE:
         return 0
     
-    applied_count = 0
-    
-    for mod in modifications:
-        if mod.get('type') != 'imageTransform':
-            continue
-        
-        layer_index = mod.get('layerIndex', mod.get('editableIndex', 0))
-        transform = mod.get('transform', {})
-        
-        try:
-            # 获取对应的图层
-            if hasattr(libpag, 'LayerType') and hasattr(libpag.LayerType, 'Image'):
-                layers = pag.getLayersByEditableIndex(layer_index, libpag.LayerType.Image)
-                
-                if layers and len(layers) > 0:
-                    layer = layers[0]
-                    
-                    # 提取变换参数
-                    position = transform.get('position', {})
-                    anchor_point = transform.get('anchorPoint', {})
-                    scale = transform.get('scale', {})
-                    rotation = transform.get('rotation', 0)
-                    opacity = transform.get('opacity', 1)
-                    
-                    # 应用位置
-                    if position:
-                        try:
-                            layer.setPosition(position.get('x', 0), position.get('y', 0))
-                        except Exception as e:
-                            print(f"[DEBUG] ⚠️ setPosition 失败: {e}")
-                    
-                    # 应用锚点
-                    if anchor_point:
-                        try:
-                            layer.setAnchorPoint(anchor_point.get('x', 0), anchor_point.get('y', 0))
-                        except Exception as e:
-                            print(f"[DEBUG] ⚠️ setAnchorPoint 失败: {e}")
-                    
-                    # 应用缩放
-                    if scale:
-                        try:
-                            layer.setScale(scale.get('x', 1), scale.get('y', 1))
-                        except Exception as e:
-                            print(f"[DEBUG] ⚠️ setScale 失败: {e}")
-                    
-                    # 应用旋转
-                    if rotation != 0:
-                        try:
-                            layer.setRotation(rotation)
-                        except Exception as e:
-                            print(f"[DEBUG] ⚠️ setRotation 失败: {e}")
-                    
-                    # 应用不透明度
-                    if opacity != 1:
-                        try:
-                            alpha_value = int(opacity * 255)
-                            layer.setAlpha(alpha_value)
-                        except Exception as e:
-                            print(f"[DEBUG] ⚠️ setAlpha 失败: {e}")
-                    
-                    applied_count += 1
-        
-        except Exception as e:
-            print(f"[ERROR] 应用变换失败 - 图层 {layer_index}: {str(e)}")
+    if state is None:
+        state = LayerTransformCache(libpag, pag)
     
-    return applied_count
+    return state.apply(modifications, skip_defaults=True)
 
 
 @app.route('/')
@@ -180,8 +511,20 @@ def index():
         
         <h2>📋 API 端点</h2>
         <ul>
+            <li><code>POST /api/templates</code> - 上传模板，返回 templateId（之后导出/分析可用 templateId 代替 pagFile）</li>
+            <li><code>GET /api/templates/&lt;templateId&gt;</code> - 查询模板是否已注册</li>
+            <li><code>GET|POST /api/analyze-layers</code> - 分析图层信息（支持 ETag / 304）</li>
             <li><code>POST /api/export-pag</code> - 导出修改后的 PAG 文件</li>
-            <li><code>GET /api/health</code> - 健康检查</li>
+            <li><code>GET /api/exports/&lt;etag&gt;</code> - 按 ETag 获取已缓存的导出结果（支持 If-None-Match / 304）</li>
+            <li><code>POST /api/export-pag-simple</code> - 模板和图片随请求发送（JSON + base64，或 application/x-pag-wire 二进制帧格式直接返回 PAG）</li>
+            <li><code>POST /api/export-pag-batch</code> - 一个模板 + 多组修改（variants），并行导出并以 ZIP 流式返回</li>
+            <li><code>POST /api/jobs/export</code> - 提交后台导出任务（参数同 export-pag），立即返回 jobId</li>
+            <li><code>GET /api/jobs/&lt;jobId&gt;</code> - 查询任务状态（queued / running / done / failed）</li>
+            <li><code>GET /api/jobs/&lt;jobId&gt;/result</code> - 下载任务结果</li>
+            <li><code>GET /api/health</code> - 健康检查（含模板缓存命中统计）</li>
+            <li><code>GET /api/profiles</code> - 最近的请求剖析（需 PAG_PROFILE_TOKEN；请求带 X-PAG-Profile 头开启剖析）</li>
+            <li><code>GET /api/profiles/&lt;profileId&gt;</code> - 剖析详情（?format=collapsed 输出火焰图格式）</li>
+            <li><code>GET /metrics</code> - Prometheus 指标（导出各阶段耗时直方图、并发请求数、任务队列）</li>
         </ul>
         
         <h2>🔧 使用方法</h2>
@@ -220,10 +563,92 @@ def health():
     """健康检查"""
     return jsonify({
         'status': 'ok',
-        'pag_available': PAG_AVAILABLE
+        'pag_available': PAG_AVAILABLE,
+        'template_cache': pag_actors.cache_stats('template_cache'),
+        'image_cache': pag_actors.cache_stats('image_cache'),
+        'buffer_io': pag_actors.pipelines[0].io.capabilities(),
+        'image_downscale': {'enabled': image_fit.active, 'pillow': pillow_available(), 'policy': image_fit.tag()},
+        'actors': pag_actors.stats(),
+        'analysis_store': analysis_store.stats(),
+        'output_cache': output_cache.stats(),
+        'admission': admission.stats(),
+        'singleflight': {'export': export_flight.stats(), 'analysis': analysis_flight.stats()},
+        'export_jobs': export_jobs.stats()
     })
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus 指标（文本格式）"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """最近的请求剖析摘要"""
+    if not _profile_token_ok(request.headers.get('X-PAG-Profile')):
+        return jsonify({'error': '剖析未开启或令牌无效'}), 404
+    return jsonify({'profiles': profile_store.list()})
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    剖析详情
+    
+    参数：
+        - format=collapsed: 输出 collapsed 调用栈文本（flamegraph.pl / speedscope 可直接读取）
+    """
+    if not _profile_token_ok(request.headers.get('X-PAG-Profile')):
+        return jsonify({'error': '剖析未开启或令牌无效'}), 404
+    entry = profile_store.get(profile_id)
+    if entry is None:
+        return jsonify({'error': f'剖析不存在: {profile_id}'}), 404
+    summary, collapsed = entry
+    if request.args.get('format') == 'collapsed':
+        return Response(collapsed + '\n', mimetype='text/plain')
+    return jsonify(summary)
+
+
+@app.route('/api/templates', methods=['POST'])
+def upload_template():
+    """
+    注册模板（上传一次，之后用 templateId 引用）
+    
+    请求参数：
+        - pagFile: PAG 文件（multipart/form-data），或直接以请求体发送文件字节
+    
+    返回：
+        - templateId: 模板 ID（内容的 SHA-256）
+    """
+    if 'pagFile' in request.files:
+        pag_bytes = request.files['pagFile'].read()
+    else:
+        pag_bytes = request.get_data()
+    
+    if not pag_bytes:
+        return jsonify({'error': '缺少 PAG 文件'}), 400
+    
+    template_id, created = template_store.put(pag_bytes)
+    log.debug("注册模板 %s (%s 字节, 新模板: %s)", template_id[:12], len(pag_bytes), created)
+    
+    return jsonify({
+        'success': True,
+        'templateId': template_id,
+        'size': len(pag_bytes),
+        'created': created
+    }), 201 if created else 200
+
+
+@app.route('/api/templates/<template_id>', methods=['GET'])
+def get_template_info(template_id):
+    """查询模板是否已注册"""
+    info = template_store.info(template_id)
+    if info is None:
+        return jsonify({'error': f'模板不存在: {template_id}'}), 404
+    return jsonify(info)
+
+
 @app.route('/api/debug-matrix')
 def debug_matrix():
     """调试 Matrix API"""
@@ -271,16 +696,222 @@ def debug_matrix():
         }), 500
 
 
-@app.route('/api/analyze-layers', methods=['POST'])
+def collect_layer_info(pag):
+    """
+    收集 PAG 文件的图层详细信息
+    
+    Args:
+        pag: PAG 文件对象
+    
+    Returns:
+        dict: 包含 fileInfo / imageLayers / textLayers
+    """
+    # 收集基本信息
+    file_info = {
+        'width': pag.width(),
+        'height': pag.height(),
+        'duration': pag.duration() / 1000000,  # 转换为秒
+        'frameRate': pag.frameRate(),
+        'numImages': pag.numImages(),
+        'numTexts': pag.numTexts()
+    }
+    
+    # 收集图片图层信息
+    image_layers = []
+    if hasattr(libpag, 'LayerType') and hasattr(libpag.LayerType, 'Image'):
+        try:
+            image_indices = pag.getEditableIndices(libpag.LayerType.Image)
+            
+            for idx in image_indices:
+                layer_info = {
+                    'index': idx,
+                    'type': 'image'
+                }
+                
+                # 获取图层对象
+                try:
+                    layers = pag.getLayersByEditableIndex(idx, libpag.LayerType.Image)
+                    if layers and len(layers) > 0:
+                        layer = layers[0]
+                        
+                        # 图层名称
+                        if hasattr(layer, 'layerName'):
+                            layer_info['name'] = layer.layerName()
+                        
+                        # ✅ 使用 getTotalMatrix() 获取图层的完整变换矩阵（包括父图层变换）
+                        if hasattr(layer, 'getTotalMatrix'):
+                            try:
+                                matrix = layer.getTotalMatrix()
+                                
+                                # 使用正确的 Matrix API 获取变换信息
+                                if hasattr(matrix, 'getTranslateX') and hasattr(matrix, 'getTranslateY'):
+                                    pos_x = matrix.getTranslateX()
+                                    pos_y = matrix.getTranslateY()
+                                    
+                                    layer_info['position'] = {
+                                        'x': float(pos_x),
+                                        'y': float(pos_y)
+                                    }
+                                    
+                                    # 同时获取其他变换信息
+                                    layer_info['matrix_values'] = {
+                                        'translateX': float(pos_x),
+                                        'translateY': float(pos_y),
+                                        'scaleX': float(matrix.getScaleX()) if hasattr(matrix, 'getScaleX') else 1.0,
+                                        'scaleY': float(matrix.getScaleY()) if hasattr(matrix, 'getScaleY') else 1.0,
+                                        'skewX': float(matrix.getSkewX()) if hasattr(matrix, 'getSkewX') else 0.0,
+                                        'skewY': float(matrix.getSkewY()) if hasattr(matrix, 'getSkewY') else 0.0,
+                                    }
+                                    
+                                    log.debug("✅ 从 getTotalMatrix 获取位置: (%s, %s)", pos_x, pos_y)
+                                    log.debug("Matrix 详情: %s", layer_info['matrix_values'])
+                                else:
+                                    log.debug("⚠️ Matrix 没有 getTranslateX/Y 方法")
+                                
+                            except Exception as e:
+                                layer_info['matrix_error'] = str(e)
+                                import traceback
+                                log.debug("getTotalMatrix 解析错误: %s", traceback.format_exc())
+                        
+                        # 🔄 备用方案：尝试 getOriginalImageMatrix
+                        elif hasattr(layer, 'getOriginalImageMatrix'):
+                            try:
+                                matrix = layer.getOriginalImageMatrix()
+                                
+                                if hasattr(matrix, 'getTranslateX') and hasattr(matrix, 'getTranslateY'):
+                                    pos_x = matrix.getTranslateX()
+                                    pos_y = matrix.getTranslateY()
+                                    
+                                    layer_info['position'] = {
+                                        'x': float(pos_x),
+                                        'y': float(pos_y)
+                                    }
+                                    layer_info['matrix_values'] = {
+                                        'translateX': float(pos_x),
+                                        'translateY': float(pos_y),
+                                        'scaleX': float(matrix.getScaleX()) if hasattr(matrix, 'getScaleX') else 1.0,
+                                        'scaleY': float(matrix.getScaleY()) if hasattr(matrix, 'getScaleY') else 1.0,
+                                    }
+                                    log.debug("⚠️ 使用 getOriginalImageMatrix (备用): (%s, %s)", pos_x, pos_y)
+                                
+                            except Exception as e:
+                                layer_info['matrix_error'] = str(e)
+                        
+                        if hasattr(layer, 'getOriginalImageBounds'):
+                            try:
+                                bounds = layer.getOriginalImageBounds()
+                                # Bounds 提供尺寸信息，但 left/top 通常是 0
+                                # 真实位置来自 Matrix 的 tx/ty
+                                layer_info['bounds'] = {
+                                    'left': layer_info.get('position', {}).get('x', 0),  # 使用 Matrix 的 tx
+                                    'top': layer_info.get('position', {}).get('y', 0),   # 使用 Matrix 的 ty
+                                    'right': (layer_info.get('position', {}).get('x', 0) + 
+                                             (bounds.width() if hasattr(bounds, 'width') else 0)),
+                                    'bottom': (layer_info.get('position', {}).get('y', 0) + 
+                                              (bounds.height() if hasattr(bounds, 'height') else 0)),
+                                    'width': bounds.width() if hasattr(bounds, 'width') else None,
+                                    'height': bounds.height() if hasattr(bounds, 'height') else None,
+                                }
+                            except Exception as e:
+                                layer_info['bounds_error'] = str(e)
+                        
+                        if hasattr(layer, 'getOriginalScaleFactor'):
+                            try:
+                                scale = layer.getOriginalScaleFactor()
+                                layer_info['scaleFactor'] = str(scale)
+                            except Exception as e:
+                                layer_info['scaleFactor_error'] = str(e)
+                        
+                        if hasattr(layer, 'getOriginalAnchorPoint'):
+                            try:
+                                anchor = layer.getOriginalAnchorPoint()
+                                # 尝试转换为坐标
+                                if hasattr(anchor, 'x') and hasattr(anchor, 'y'):
+                                    layer_info['anchorPoint'] = {
+                                        'x': anchor.x,
+                                        'y': anchor.y
+                                    }
+                                else:
+                                    layer_info['anchorPoint'] = str(anchor)
+                            except Exception as e:
+                                layer_info['anchorPoint_error'] = str(e)
+                        
+                        # 🆕 尝试获取图层的图片（如果已被替换）
+                        if hasattr(layer, 'getReplacedImage'):
+                            try:
+                                replaced_image = layer.getReplacedImage()
+                                if replaced_image:
+                                    # 尝试导出为 base64（如果 API 支持）
+                                    # 注意：pypag 可能不直接支持导出为图片数据
+                                    # 这里我们标记图层已有替换图片
+                                    layer_info['hasReplacedImage'] = True
+                                else:
+                                    layer_info['hasReplacedImage'] = False
+                            except Exception as e:
+                                layer_info['hasReplacedImage'] = False
+                        
+                except Exception as e:
+                    layer_info['error'] = str(e)
+                
+                image_layers.append(layer_info)
+                
+        except Exception as e:
+            log.error("获取图片图层信息失败: %s", e)
+    
+    # 收集文本图层信息
+    text_layers = []
+    for i in range(pag.numTexts()):
+        try:
+            text_data = pag.getTextData(i)
+            layer_info = {
+                'index': i,
+                'type': 'text',
+                'text': text_data.text if hasattr(text_data, 'text') else '',
+                'fontFamily': text_data.fontFamily if hasattr(text_data, 'fontFamily') else None,
+                'fontSize': text_data.fontSize if hasattr(text_data, 'fontSize') else None,
+            }
+            text_layers.append(layer_info)
+        except Exception as e:
+            text_layers.append({
+                'index': i,
+                'type': 'text',
+                'error': str(e)
+            })
+    
+    return {
+        'fileInfo': file_info,
+        'imageLayers': image_layers,
+        'textLayers': text_layers
+    }
+
+
+def _analysis_response(result, etag):
+    """
+    返回分析结果，带 ETag；result 为 None 时返回 304
+    
+    no-cache 让浏览器每次都带 If-None-Match 重新验证，模板不变即得到 304
+    """
+    if result is None:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(dict(result, success=True))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/analyze-layers', methods=['GET', 'POST'])
 def analyze_layers():
     """
     分析 PAG 文件的图层详细信息
     
     请求参数：
         - pagFile: PAG 文件（multipart/form-data）
+        - templateId: 已注册模板的 ID（可代替 pagFile；GET 请求时放在查询参数中）
     
     返回：
         - JSON 包含所有图层的详细信息（位置、尺寸、变换等）
+        - 结果按模板哈希记忆，并带 ETag，If-None-Match 匹配时返回 304
     """
     try:
         # 检查是否安装了 PAG SDK
@@ -290,212 +921,48 @@ def analyze_layers():
                 'message': '请运行: pip install libpag'
             }), 500
         
-        # 获取上传的文件
-        if 'pagFile' not in request.files:
-            return jsonify({'error': '缺少 PAG 文件'}), 400
+        # 按 templateId 请求时先用 ID 判断缓存和记忆结果，命中则无需读取模板
+        template_id = request.values.get('templateId')
+        if 'pagFile' not in request.files and is_valid_template_id(template_id):
+            pag_bytes, template_hash = None, template_id
+        else:
+            pag_bytes, template_hash, _ = read_template_from_request()
         
-        pag_file = request.files['pagFile']
+        etag = analysis_store.etag_for(template_hash)
+        if request.if_none_match.contains(etag):
+            return _analysis_response(None, etag)
         
-        # 读取 PAG 文件到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pag') as temp_input:
-            pag_file.save(temp_input.name)
-            temp_input_path = temp_input.name
-        
-        try:
-            # 加载 PAG 文件
-            pag = libpag.PAGFile.Load(temp_input_path)
-            
-            if not pag:
-                return jsonify({'error': '无法加载 PAG 文件'}), 400
-            
-            # 收集基本信息
-            file_info = {
-                'width': pag.width(),
-                'height': pag.height(),
-                'duration': pag.duration() / 1000000,  # 转换为秒
-                'frameRate': pag.frameRate(),
-                'numImages': pag.numImages(),
-                'numTexts': pag.numTexts()
-            }
-            
-            # 收集图片图层信息
-            image_layers = []
-            if hasattr(libpag, 'LayerType') and hasattr(libpag.LayerType, 'Image'):
-                try:
-                    image_indices = pag.getEditableIndices(libpag.LayerType.Image)
+        # 结果只取决于模板内容，命中记忆时无需加载模板
+        result = analysis_store.get(template_hash)
+        if result is None:
+            def analyze():
+                data = pag_bytes
+                if data is None:
+                    data, _, _ = read_template_from_request()
+                
+                def run(pipeline):
+                    # 加载 PAG 文件（命中缓存时直接复制已解析的模板）
+                    with stage('load'):
+                        pag, _ = pipeline.template_cache.checkout(data, key=template_hash)
                     
-                    for idx in image_indices:
-                        layer_info = {
-                            'index': idx,
-                            'type': 'image'
-                        }
-                        
-                        # 获取图层对象
-                        try:
-                            layers = pag.getLayersByEditableIndex(idx, libpag.LayerType.Image)
-                            if layers and len(layers) > 0:
-                                layer = layers[0]
-                                
-                                # 图层名称
-                                if hasattr(layer, 'layerName'):
-                                    layer_info['name'] = layer.layerName()
-                                
-                                # ✅ 使用 getTotalMatrix() 获取图层的完整变换矩阵（包括父图层变换）
-                                if hasattr(layer, 'getTotalMatrix'):
-                                    try:
-                                        matrix = layer.getTotalMatrix()
-                                        
-                                        # 使用正确的 Matrix API 获取变换信息
-                                        if hasattr(matrix, 'getTranslateX') and hasattr(matrix, 'getTranslateY'):
-                                            pos_x = matrix.getTranslateX()
-                                            pos_y = matrix.getTranslateY()
-                                            
-                                            layer_info['position'] = {
-                                                'x': float(pos_x),
-                                                'y': float(pos_y)
-                                            }
-                                            
-                                            # 同时获取其他变换信息
-                                            layer_info['matrix_values'] = {
-                                                'translateX': float(pos_x),
-                                                'translateY': float(pos_y),
-                                                'scaleX': float(matrix.getScaleX()) if hasattr(matrix, 'getScaleX') else 1.0,
-                                                'scaleY': float(matrix.getScaleY()) if hasattr(matrix, 'getScaleY') else 1.0,
-                                                'skewX': float(matrix.getSkewX()) if hasattr(matrix, 'getSkewX') else 0.0,
-                                                'skewY': float(matrix.getSkewY()) if hasattr(matrix, 'getSkewY') else 0.0,
-                                            }
-                                            
-                                            print(f"[DEBUG] ✅ 从 getTotalMatrix 获取位置: ({pos_x}, {pos_y})")
-                                            print(f"[DEBUG] Matrix 详情: {layer_info['matrix_values']}")
-                                        else:
-                                            print(f"[DEBUG] ⚠️ Matrix 没有 getTranslateX/Y 方法")
-                                        
-                                    except Exception as e:
-                                        layer_info['matrix_error'] = str(e)
-                                        import traceback
-                                        print(f"[DEBUG] getTotalMatrix 解析错误: {traceback.format_exc()}")
-                                
-                                # 🔄 备用方案：尝试 getOriginalImageMatrix
-                                elif hasattr(layer, 'getOriginalImageMatrix'):
-                                    try:
-                                        matrix = layer.getOriginalImageMatrix()
-                                        
-                                        if hasattr(matrix, 'getTranslateX') and hasattr(matrix, 'getTranslateY'):
-                                            pos_x = matrix.getTranslateX()
-                                            pos_y = matrix.getTranslateY()
-                                            
-                                            layer_info['position'] = {
-                                                'x': float(pos_x),
-                                                'y': float(pos_y)
-                                            }
-                                            layer_info['matrix_values'] = {
-                                                'translateX': float(pos_x),
-                                                'translateY': float(pos_y),
-                                                'scaleX': float(matrix.getScaleX()) if hasattr(matrix, 'getScaleX') else 1.0,
-                                                'scaleY': float(matrix.getScaleY()) if hasattr(matrix, 'getScaleY') else 1.0,
-                                            }
-                                            print(f"[DEBUG] ⚠️ 使用 getOriginalImageMatrix (备用): ({pos_x}, {pos_y})")
-                                        
-                                    except Exception as e:
-                                        layer_info['matrix_error'] = str(e)
-                                
-                                if hasattr(layer, 'getOriginalImageBounds'):
-                                    try:
-                                        bounds = layer.getOriginalImageBounds()
-                                        # Bounds 提供尺寸信息，但 left/top 通常是 0
-                                        # 真实位置来自 Matrix 的 tx/ty
-                                        layer_info['bounds'] = {
-                                            'left': layer_info.get('position', {}).get('x', 0),  # 使用 Matrix 的 tx
-                                            'top': layer_info.get('position', {}).get('y', 0),   # 使用 Matrix 的 ty
-                                            'right': (layer_info.get('position', {}).get('x', 0) + 
-                                                     (bounds.width() if hasattr(bounds, 'width') else 0)),
-                                            'bottom': (layer_info.get('position', {}).get('y', 0) + 
-                                                      (bounds.height() if hasattr(bounds, 'height') else 0)),
-                                            'width': bounds.width() if hasattr(bounds, 'width') else None,
-                                            'height': bounds.height() if hasattr(bounds, 'height') else None,
-                                        }
-                                    except Exception as e:
-                                        layer_info['bounds_error'] = str(e)
-                                
-                                if hasattr(layer, 'getOriginalScaleFactor'):
-                                    try:
-                                        scale = layer.getOriginalScaleFactor()
-                                        layer_info['scaleFactor'] = str(scale)
-                                    except Exception as e:
-                                        layer_info['scaleFactor_error'] = str(e)
-                                
-                                if hasattr(layer, 'getOriginalAnchorPoint'):
-                                    try:
-                                        anchor = layer.getOriginalAnchorPoint()
-                                        # 尝试转换为坐标
-                                        if hasattr(anchor, 'x') and hasattr(anchor, 'y'):
-                                            layer_info['anchorPoint'] = {
-                                                'x': anchor.x,
-                                                'y': anchor.y
-                                            }
-                                        else:
-                                            layer_info['anchorPoint'] = str(anchor)
-                                    except Exception as e:
-                                        layer_info['anchorPoint_error'] = str(e)
-                                
-                                # 🆕 尝试获取图层的图片（如果已被替换）
-                                if hasattr(layer, 'getReplacedImage'):
-                                    try:
-                                        replaced_image = layer.getReplacedImage()
-                                        if replaced_image:
-                                            # 尝试导出为 base64（如果 API 支持）
-                                            # 注意：pypag 可能不直接支持导出为图片数据
-                                            # 这里我们标记图层已有替换图片
-                                            layer_info['hasReplacedImage'] = True
-                                        else:
-                                            layer_info['hasReplacedImage'] = False
-                                    except Exception as e:
-                                        layer_info['hasReplacedImage'] = False
-                                
-                        except Exception as e:
-                            layer_info['error'] = str(e)
-                        
-                        image_layers.append(layer_info)
-                        
-                except Exception as e:
-                    print(f"[ERROR] 获取图片图层信息失败: {e}")
-            
-            # 收集文本图层信息
-            text_layers = []
-            for i in range(pag.numTexts()):
-                try:
-                    text_data = pag.getTextData(i)
-                    layer_info = {
-                        'index': i,
-                        'type': 'text',
-                        'text': text_data.text if hasattr(text_data, 'text') else '',
-                        'fontFamily': text_data.fontFamily if hasattr(text_data, 'fontFamily') else None,
-                        'fontSize': text_data.fontSize if hasattr(text_data, 'fontSize') else None,
-                    }
-                    text_layers.append(layer_info)
-                except Exception as e:
-                    text_layers.append({
-                        'index': i,
-                        'type': 'text',
-                        'error': str(e)
-                    })
-            
-            # 清理临时文件
-            os.unlink(temp_input_path)
-            
-            return jsonify({
-                'success': True,
-                'fileInfo': file_info,
-                'imageLayers': image_layers,
-                'textLayers': text_layers
-            })
+                    if not pag:
+                        raise APIError('无法加载 PAG 文件', 400)
+                    
+                    with stage('analyze'):
+                        return collect_layer_info(pag)
+                
+                with admitted():
+                    layer_info = pag_actors.call(template_hash, run, timeout=_call_timeout())
+                analysis_store.put(template_hash, layer_info)
+                return layer_info
             
-        except Exception as e:
-            # 清理临时文件
-            if os.path.exists(temp_input_path):
-                os.unlink(temp_input_path)
-            raise e
+            # 同一模板同时到达的分析请求只分析一次
+            result, _ = _coalesced(analysis_flight, template_hash, analyze)
+        
+        return _analysis_response(result, etag)
         
+    except (APIError, AdmissionRejected, ActorTimeout):
+        raise
     except Exception as e:
         import traceback
         return jsonify({
@@ -504,6 +971,124 @@ def analyze_layers():
         }), 500
 
 
+def _coalesced(flight, key, fn):
+    """
+    合并同时进行的相同工作；共享结果的请求把等待时间记为 coalesced_wait 阶段
+
+    Returns:
+        tuple: (结果, 是否共享了其他请求的结果)
+    """
+    started = time.perf_counter()
+    try:
+        result, shared = flight.do(key, fn, timeout=app.config['SINGLEFLIGHT_TIMEOUT'])
+    except SingleFlightTimeout as e:
+        raise APIError(str(e), 503)
+    if shared:
+        timer = current_timer()
+        if timer is not None:
+            timer.add('coalesced_wait', time.perf_counter() - started)
+    return result, shared
+
+
+def _cached_export(key, template_hash, export):
+    """
+    先查导出结果缓存，未命中时在模板所属的 pypag 工作线程中调用 export(pipeline, failures) 并保存结果
+    
+    同时到达的相同导出只执行一次，其余请求共享结果（异常同样共享）。
+    export 把未能应用的修改项追加到 failures 中；有修改项失败时结果照常返回，但不写入缓存，
+    否则一次失败的导出会以合法的键被永久缓存
+
+    Returns:
+        tuple: (PAG 文件字节, 缓存状态 'HIT' / 'MISS' / 'SHARED' / 'BYPASS'（结果未缓存）)
+    """
+    with stage('output_cache'):
+        output_data = output_cache.get(key)
+    if output_data is not None:
+        return output_data, 'HIT'
+    
+    def run():
+        # 上一个相同导出可能在我们查缓存之后刚刚完成
+        with stage('output_cache'):
+            data = output_cache.get(key)
+        if data is not None:
+            return data, True
+        failures = []
+        with admitted():
+            data = pag_actors.call(template_hash, lambda pipeline: export(pipeline, failures),
+                                   timeout=_call_timeout())
+        if failures:
+            log.warning("导出有 %d 个修改项未能应用，结果不缓存 %s: %s", len(failures), key[:12], failures)
+            return data, False
+        with stage('output_cache'):
+            try:
+                output_cache.put(key, data)
+            except OSError as e:
+                log.warning("保存导出结果缓存失败 %s: %s", key[:12], e)
+                return data, False
+        return data, True
+    
+    (output_data, stored), shared = _coalesced(export_flight, key, run)
+    if not stored:
+        return output_data, 'BYPASS'
+    return output_data, 'SHARED' if shared else 'MISS'
+
+
+def _export_cache_headers(response, etag, cache_status=None, location=True):
+    """
+    导出响应的缓存头
+    
+    ETag 即输入的规范化哈希。导出是 POST，代理不会缓存；结果写入缓存后可以通过
+    Content-Location 指向的 GET /api/exports/<ETag> 按 ETag 重新验证 / 下载
+    """
+    if cache_status is not None:
+        response.headers['X-PAG-Cache'] = cache_status
+    if cache_status == 'BYPASS':
+        # 有修改项未能应用：不给 ETag，客户端重试时会重新导出
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = app.config['OUTPUT_CACHE_CONTROL']
+    if location:
+        response.headers['Content-Location'] = f'/api/exports/{etag}'
+    return response
+
+
+def _export_precondition_failed(etag):
+    """
+    POST 带 If-None-Match 且 ETag 匹配：客户端已有这份结果
+    
+    状态改变类方法的条件请求不成立时按 RFC 9110 返回 412（304 只用于 GET / HEAD）
+    """
+    response = jsonify({'error': '结果未变化（If-None-Match 匹配）', 'etag': etag})
+    response.status_code = 412
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/api/exports/<key>', methods=['GET'])
+def get_cached_export(key):
+    """
+    按 ETag 获取已缓存的导出结果（支持 If-None-Match → 304）
+    
+    导出接口响应的 ETag / Content-Location 指向这里，客户端和代理可以用 GET 重新验证
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({'error': f'无效的结果 ID: {key}'}), 404
+    if request.if_none_match.contains(key) and os.path.exists(output_cache.path_for(key)):
+        return _export_cache_headers(app.response_class(status=304), key, location=False)
+    
+    output_data = output_cache.get(key)
+    if output_data is None:
+        return jsonify({'error': f'结果不存在或已过期: {key}'}), 404
+    response = send_file(
+        io.BytesIO(output_data),
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f'{key[:12]}.pag'
+    )
+    return _export_cache_headers(response, key, 'HIT', location=False)
+
+
 @app.route('/api/export-pag', methods=['POST'])
 def export_pag():
     """
@@ -511,6 +1096,7 @@ def export_pag():
     
     请求参数：
         - pagFile: 原始 PAG 文件（multipart/form-data）
+        - templateId: 已注册模板的 ID（可代替 pagFile）
         - modifications: JSON 字符串，包含修改配置
     
     返回：
@@ -524,331 +1110,45 @@ def export_pag():
                 'message': '请运行: pip install libpag'
             }), 500
         
-        # 获取上传的文件
-        if 'pagFile' not in request.files:
-            return jsonify({'error': '缺少 PAG 文件'}), 400
-        
-        pag_file = request.files['pagFile']
-        modifications_json = request.form.get('modifications', '[]')
-        
-        # 解析修改配置
-        try:
-            modifications = json.loads(modifications_json)
-        except json.JSONDecodeError:
-            return jsonify({'error': 'modifications 必须是有效的 JSON'}), 400
-        
-        print(f"[DEBUG] 收到 {len(modifications)} 个修改项")
-        print(f"[DEBUG] FormData 字段: {list(request.files.keys())}")
+        with stage('parse_upload'):
+            # 获取上传的文件或已注册的模板
+            pag_bytes, template_hash, pag_filename = read_template_from_request()
+            modifications_json = request.form.get('modifications', '[]')
+            
+            # 解析修改配置
+            try:
+                modifications = json.loads(modifications_json)
+            except json.JSONDecodeError:
+                return jsonify({'error': 'modifications 必须是有效的 JSON'}), 400
+            
+            # 收集上传的图片（字段名 -> 字节）
+            images = {name: f.read() for name, f in request.files.items() if name != 'pagFile'}
         
-        # 读取 PAG 文件到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pag') as temp_input:
-            pag_file.save(temp_input.name)
-            temp_input_path = temp_input.name
+        log.debug("收到 %s 个修改项", len(modifications))
+        log.debug("FormData 字段: %s", list(request.files.keys()))
         
-        # 创建临时输出文件
-        temp_output = tempfile.NamedTemporaryFile(delete=False, suffix='.pag')
-        temp_output_path = temp_output.name
-        temp_output.close()
+        # 相同输入的导出结果相同：客户端已有则 412，缓存命中则不调用 pypag
+        etag = output_key(f'export:{image_fit.tag()}', template_hash, modifications, images)
+        if request.if_none_match.contains(etag):
+            return _export_precondition_failed(etag)
         
         try:
-            # 加载 PAG 文件
-            pag = libpag.PAGFile.Load(temp_input_path)
-            
-            if not pag:
-                return jsonify({'error': '无法加载 PAG 文件'}), 400
-            
-            print(f"[DEBUG] PAG 文件加载成功")
-            print(f"[DEBUG] - 图片层数量: {pag.numImages()}")
-            print(f"[DEBUG] - 文本层数量: {pag.numTexts()}")
-            
-            # 尝试获取可编辑的图片索引
-            try:
-                # 检查 LayerType 是否存在
-                if hasattr(libpag, 'LayerType') and hasattr(libpag.LayerType, 'Image'):
-                    image_editable_indices = pag.getEditableIndices(libpag.LayerType.Image)
-                    print(f"[DEBUG] - 可编辑图片索引 (Image类型): {image_editable_indices}")
-                else:
-                    print(f"[DEBUG] - LayerType.Image 不可用，跳过索引检查")
-            except Exception as e:
-                print(f"[DEBUG] - 获取可编辑索引失败: {e}")
-                print(f"[DEBUG] - 将直接使用 layerIndex 作为 editableImageIndex")
-            
-            # 应用修改
-            for mod in modifications:
-                layer_index = mod.get('layerIndex')
-                mod_type = mod.get('type')
-                value = mod.get('value')
-                
-                if mod_type == 'text':
-                    # 替换文本
-                    text_data = pag.getTextData(layer_index)
-                    if text_data:
-                        text_data.text = value
-                        pag.replaceText(layer_index, text_data)
-                    print(f"[DEBUG] 替换文本 - 图层 {layer_index}: {value}")
-                
-                elif mod_type == 'image':
-                    # 替换图片
-                    # ⚠️ 重要：pypag 的 replaceImage 需要 editableImageIndex，不是 layerIndex！
-                    # layer_index 是前端传来的可编辑图片的索引（0, 1, 2...）
-                    # 直接作为 editableImageIndex 使用
-                    
-                    editable_image_index = layer_index
-                    
-                    # value 可能是：
-                    # 1. FormData 字段名（如 "image_0"）- 优先
-                    # 2. base64 数据字符串
-                    # 3. 文件路径
-                    try:
-                        # 情况 1：从 FormData 中获取图片文件
-                        if value in request.files:
-                            image_file = request.files[value]
-                            print(f"[DEBUG] 从 FormData 获取图片 - EditableIndex {editable_image_index}: {image_file.filename}")
-                            
-                            # 保存到临时文件
-                            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_img:
-                                image_file.save(temp_img.name)
-                                temp_img_path = temp_img.name
-                            
-                            try:
-                                # ✨ 使用 libpag 新 API：从图层直接获取原始占位图的变换信息
-                                # 先获取原始图层信息
-                                original_layers = pag.getLayersByEditableIndex(editable_image_index, libpag.LayerType.Image)
-                                print(f"[DEBUG] - 找到 {len(original_layers) if original_layers else 0} 个对应的图层")
-                                
-                                # 获取原始图片的 matrix 和 scaleMode
-                                original_matrix = None
-                                original_scale_mode = None
-                                layer_name = None
-                                
-                                if original_layers and len(original_layers) > 0:
-                                    original_layer = original_layers[0]
-                                    if hasattr(original_layer, 'layerName'):
-                                        layer_name = original_layer.layerName()
-                                        print(f"[DEBUG] - 原始图层名称: {layer_name}")
-                                    
-                                    # ✅ 方案 1（优先）：使用 libpag 新 API - 从图层直接获取变换信息
-                                    # pypag 实际提供的 API（已实现）：
-                                    # - original_layer.getOriginalImageMatrix()  ✅ 获取原始图片矩阵
-                                    # - original_layer.getOriginalImageBounds()  ✅ 获取原始图片边界
-                                    # - original_layer.getOriginalScaleFactor()  ✅ 获取原始缩放因子
-                                    # - original_layer.getOriginalAnchorPoint()  ✅ 获取原始锚点
-                                    
-                                    # 尝试获取原始图片的 matrix
-                                    if hasattr(original_layer, 'getOriginalImageMatrix'):
-                                        try:
-                                            original_matrix = original_layer.getOriginalImageMatrix()
-                                            print(f"[DEBUG] - ✅ 从图层获取原始 matrix: {original_matrix}")
-                                        except Exception as e:
-                                            print(f"[DEBUG] - ⚠️ getOriginalImageMatrix() 调用失败: {e}")
-                                    
-                                    # 尝试获取原始图片的边界（可选，用于调试）
-                                    if hasattr(original_layer, 'getOriginalImageBounds'):
-                                        try:
-                                            original_bounds = original_layer.getOriginalImageBounds()
-                                            print(f"[DEBUG] - 原始图片边界: {original_bounds}")
-                                        except Exception as e:
-                                            print(f"[DEBUG] - ⚠️ getOriginalImageBounds() 调用失败: {e}")
-                                    
-                                    # 注意：pypag 没有提供 getOriginalScaleMode()
-                                    # scaleMode 需要从已替换的图片获取，或使用默认值
-                                    
-                                    # ⚠️ 方案 2（回退）：如果新 API 不可用，从已替换的图片获取（仅第二次替换时有效）
-                                    if original_matrix is None and hasattr(original_layer, 'getReplacedImage'):
-                                        try:
-                                            original_image = original_layer.getReplacedImage()
-                                            if original_image:
-                                                print(f"[DEBUG] - 回退方案：从已替换图片获取变换信息")
-                                                if hasattr(original_image, 'matrix'):
-                                                    original_matrix = original_image.matrix()
-                                                    print(f"[DEBUG] - 从已替换图片获取 matrix: {original_matrix}")
-                                                if hasattr(original_image, 'scaleMode') and original_scale_mode is None:
-                                                    original_scale_mode = original_image.scaleMode()
-                                                    print(f"[DEBUG] - 从已替换图片获取 scaleMode: {original_scale_mode}")
-                                            else:
-                                                print(f"[DEBUG] - ⚠️ getReplacedImage() 返回 None（首次替换且新 API 不可用）")
-                                        except Exception as e:
-                                            print(f"[DEBUG] - 回退方案失败: {e}")
-                                
-                                # 加载新图片
-                                new_image = libpag.PAGImage.FromPath(temp_img_path)
-                                if new_image:
-                                    print(f"[DEBUG] PAGImage 创建成功 - EditableIndex {editable_image_index}")
-                                    print(f"[DEBUG] - 新图片尺寸: {new_image.width()}x{new_image.height()}")
-                                    print(f"[DEBUG] - 新图片默认 matrix: {new_image.matrix()}")
-                                    print(f"[DEBUG] - 新图片默认 scaleMode: {new_image.scaleMode()}")
-                                    
-                                    # 🔑 关键：应用原始图层的变换信息到新图片
-                                    # ⚠️ 重要：必须先设置 scaleMode，再设置 matrix！
-                                    # 因为 setScaleMode 可能会重新计算 matrix
-                                    
-                                    # 步骤 1：设置 scaleMode
-                                    if original_scale_mode is not None:
-                                        try:
-                                            print(f"[DEBUG] ✨ 应用原始 scaleMode: {original_scale_mode}")
-                                            new_image.setScaleMode(original_scale_mode)
-                                            print(f"[DEBUG] ✅ ScaleMode 应用成功")
-                                        except Exception as e:
-                                            print(f"[DEBUG] ⚠️ 应用 scaleMode 失败: {e}")
-                                    else:
-                                        # 如果没有原始 scaleMode，但有 matrix，就不设置 scaleMode
-                                        # 让 matrix 完全控制变换
-                                        if original_matrix is None:
-                                            # 只有在没有 matrix 的情况下才使用默认 scaleMode
-                                            if hasattr(libpag, 'PAGScaleMode') and hasattr(libpag.PAGScaleMode, 'LetterBox'):
-                                                try:
-                                                    print(f"[DEBUG] ℹ️ 使用默认 scaleMode: LetterBox（保持宽高比）")
-                                                    new_image.setScaleMode(libpag.PAGScaleMode.LetterBox)
-                                                except Exception as e:
-                                                    print(f"[DEBUG] ⚠️ 设置默认 scaleMode 失败: {e}")
-                                        else:
-                                            print(f"[DEBUG] ℹ️ 跳过 scaleMode 设置（优先使用 matrix）")
-                                    
-                                    # 步骤 2：设置 matrix（必须在 scaleMode 之后）
-                                    if original_matrix is not None:
-                                        try:
-                                            print(f"[DEBUG] ✨ 应用原始 matrix: {original_matrix}")
-                                            new_image.setMatrix(original_matrix)
-                                            print(f"[DEBUG] ✅ Matrix 应用成功，新 matrix: {new_image.matrix()}")
-                                        except Exception as e:
-                                            print(f"[DEBUG] ⚠️ 应用 matrix 失败: {e}")
-                                    else:
-                                        print(f"[DEBUG] ℹ️ 未获取到原始 matrix，新图片将使用默认变换")
-                                    
-                                    # 执行替换
-                                    print(f"[DEBUG] 执行 replaceImage(editableImageIndex={editable_image_index}, ...)")
-                                    result = pag.replaceImage(editable_image_index, new_image)
-                                    print(f"[DEBUG] replaceImage 返回值: {result}")
-                                    
-                                    # 验证替换结果
-                                    if original_layers and len(original_layers) > 0 and hasattr(original_layer, 'getReplacedImage'):
-                                        try:
-                                            # 重用前面已定义的 original_layer 变量，保持一致性
-                                            replaced_img = original_layer.getReplacedImage()
-                                            print(f"[DEBUG] 替换后 getReplacedImage 类型: {type(replaced_img)} 是否为 None: {replaced_img is None}")
-                                        except Exception as e:
-                                            print(f"[DEBUG] 替换后 getReplacedImage 调用异常: {e}")
-                                    print(f"[DEBUG] 替换后图片层数量: {pag.numImages()}")
-                                else:
-                                    print(f"[ERROR] PAGImage.FromPath 返回 None - EditableIndex {editable_image_index}")
-                            
-                            except Exception as e:
-                                print(f"[ERROR] 图片替换过程出错: {e}")
-                                import traceback
-                                traceback.print_exc()
-                            
-                            # 清理临时文件
-                            try:
-                                os.unlink(temp_img_path)
-                            except:
-                                pass
-                                pass
-                        
-                        # 情况 2：base64 数据
-                        elif value.startswith('data:image/'):
-                            # 处理 base64 图片数据
-                            # 格式: data:image/png;base64,iVBORw0KGgo...
-                            base64_data = value.split(',', 1)[1] if ',' in value else value
-                            image_bytes = base64.b64decode(base64_data)
-                            
-                            # 保存到临时文件
-                            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_img:
-                                temp_img.write(image_bytes)
-                                temp_img_path = temp_img.name
-                            
-                            # 加载图片
-                            image = libpag.PAGImage.FromPath(temp_img_path)
-                            if image:
-                                result = pag.replaceImage(layer_index, image)
-                                print(f"[DEBUG] 替换图片 - 图层 {layer_index}: base64 数据 ({len(image_bytes)} 字节), 结果: {result}")
-                            else:
-                                print(f"[ERROR] 无法加载图片 - 图层 {layer_index}")
-                            
-                            # 清理临时文件
-                            try:
-                                os.unlink(temp_img_path)
-                            except:
-                                pass
-                                
-                        elif os.path.exists(value):
-                            # 如果是文件路径
-                            image = libpag.PAGImage.FromPath(value)
-                            if image:
-                                result = pag.replaceImage(layer_index, image)
-                                print(f"[DEBUG] 替换图片 - 图层 {layer_index}: 文件 {value}, 结果: {result}")
-                            else:
-                                print(f"[ERROR] 无法加载图片文件 - {value}")
-                        else:
-                            print(f"[WARNING] 无效的图片数据 - 图层 {layer_index}: {value[:50]}...")
-                            
-                    except Exception as e:
-                        print(f"[ERROR] 图片替换失败 - 图层 {layer_index}: {str(e)}")
-                        import traceback
-                        traceback.print_exc()
-                
-                elif mod_type == 'imageTransform':
-                    # 🆕 应用图层变换（位置、锚点、缩放、旋转、不透明度）
-                    # ⚠️ 注意：变换不会持久化到文件，需要在渲染时应用
-                    transform = mod.get('transform', {})
-                    print(f"[DEBUG] 记录图层变换 - 图层 {layer_index}: {transform}")
-                    print(f"[DEBUG] ⚠️ 变换将在渲染时应用（不会保存到文件）")
-                    
-                    # 不在这里应用变换，因为它们不会持久化
-                    # 变换会在渲染时由 apply_transforms_to_layers() 函数应用
-            
-            # 保存修改后的文件
-            # 注意：新版本的 pypag 支持 save() 方法
-            print(f"[DEBUG] ========================================")
-            print(f"[DEBUG] 准备保存文件")
-            print(f"[DEBUG] - 输出路径: {temp_output_path}")
-            print(f"[DEBUG] - 当前图片层数: {pag.numImages()}")
-            print(f"[DEBUG] ========================================")
-            
-            success = pag.save(temp_output_path)
-            
-            print(f"[DEBUG] save() 返回值: {success} (类型: {type(success)})")
-            
-            if not success:
-                return jsonify({'error': 'PAG 文件保存失败，save() 返回 False'}), 500
-            
-            # 检查输出文件是否存在
-            if not os.path.exists(temp_output_path):
-                return jsonify({'error': '输出文件未生成'}), 500
-            
-            # 对比文件大小
-            input_size = os.path.getsize(temp_input_path)
-            output_size = os.path.getsize(temp_output_path)
-            print(f"[DEBUG] 文件大小对比:")
-            print(f"[DEBUG] - 输入文件: {input_size} 字节")
-            print(f"[DEBUG] - 输出文件: {output_size} 字节")
-            print(f"[DEBUG] - 差异: {output_size - input_size:+d} 字节")
-            
-            # 读取输出文件并返回
-            with open(temp_output_path, 'rb') as f:
-                output_data = f.read()
-            
-            print(f"[DEBUG] 读取输出数据: {len(output_data)} 字节")
-            
-            # 清理临时文件
-            os.unlink(temp_input_path)
-            os.unlink(temp_output_path)
-            
-            # 返回文件
-            return send_file(
-                io.BytesIO(output_data),
-                mimetype='application/octet-stream',
-                as_attachment=True,
-                download_name=f'modified_{pag_file.filename}'
-            )
-            
-        except Exception as e:
-            # 清理临时文件
-            if os.path.exists(temp_input_path):
-                os.unlink(temp_input_path)
-            if os.path.exists(temp_output_path):
-                os.unlink(temp_output_path)
-            raise e
+            output_data, cache_status = _cached_export(etag, template_hash, lambda pipeline, failures: pipeline.export(
+                pag_bytes, modifications, images=images, template_hash=template_hash, failures=failures))
+        except ExportError as e:
+            return jsonify({'error': e.message}), e.status
+        
+        # 返回文件
+        response = send_file(
+            io.BytesIO(output_data),
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=f'modified_{pag_filename}'
+        )
+        return _export_cache_headers(response, etag, cache_status)
         
+    except (APIError, AdmissionRejected, ActorTimeout):
+        raise
     except Exception as e:
         import traceback
         return jsonify({
@@ -857,12 +1157,253 @@ def export_pag():
         }), 500
 
 
+def _variant_filename(variant, index, used):
+    """变体在 ZIP 中的文件名（去掉路径字符，重名时加序号）"""
+    name = variant.get('name') if isinstance(variant, dict) else None
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', str(name)).strip(' .') if name else ''
+    if not name:
+        name = f'variant_{index:04d}'
+    if not name.lower().endswith('.pag'):
+        name += '.pag'
+    if name in used:
+        stem = name[:-4]
+        name = f'{stem}_{index:04d}.pag'
+    used.add(name)
+    return name
+
+
+@app.route('/api/export-pag-batch', methods=['POST'])
+def export_pag_batch():
+    """
+    批量导出：一个模板 + 多组修改配置，结果以 ZIP 流式返回
+    
+    请求参数：
+        - pagFile 或 templateId: 模板（同 /api/export-pag）
+        - variants: JSON 数组，每个元素是 modifications 数组，
+                    或 {"name": "...", "modifications": [...]}
+        - 其他文件字段: 图片，各变体的 image 修改通过字段名引用
+    
+    返回：
+        - application/zip，变体按完成顺序写入；最后写入 manifest.json
+          记录每个变体的文件名和失败原因
+    
+    模板只上传 / 解析一次，变体在导出进程池中并行处理，同时在途的变体数有上限，
+    首字节时间和内存占用与变体数量无关。
+    """
+    if not PAG_AVAILABLE:
+        return jsonify({
+            'error': 'PAG SDK 未安装',
+            'message': '请运行: pip install libpag'
+        }), 500
+    
+    pag_bytes, template_hash, pag_filename = read_template_from_request()
+    if 'pagFile' in request.files:
+        template_hash, _ = template_store.put(pag_bytes)
+    del pag_bytes
+    
+    try:
+        variants = json.loads(request.form.get('variants', '[]'))
+    except json.JSONDecodeError:
+        return jsonify({'error': 'variants 必须是有效的 JSON'}), 400
+    if not isinstance(variants, list) or not variants:
+        return jsonify({'error': 'variants 必须是非空数组'}), 400
+    
+    used_names = set()
+    names = [_variant_filename(v, i, used_names) for i, v in enumerate(variants)]
+    images = {name: f.read() for name, f in request.files.items() if name != 'pagFile'}
+    
+    # 变体格式和模板在这里检查：响应头发出之后只能中断 ZIP 流，客户端拿到的是残缺的压缩包
+    try:
+        results = export_jobs.iter_variants(template_hash, variants, images=images)
+    except ExportError as e:
+        return jsonify({'error': e.message}), e.status
+    
+    log.debug("批量导出 %s 个变体 (模板 %s)", len(variants), template_hash[:12])
+    
+    def entries():
+        manifest = []
+        for index, output_data, error in results:
+            entry = {'index': index, 'name': names[index], 'success': error is None}
+            if error is None:
+                entry['size'] = len(output_data)
+                yield names[index], output_data
+            else:
+                entry['error'] = error
+                log.error("变体 %s 导出失败: %s", index, error)
+            manifest.append(entry)
+        manifest.sort(key=lambda e: e['index'])
+        yield 'manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+    
+    return Response(
+        stream_with_context(iter_zip(entries())),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{template_hash[:12]}_variants.zip"'}
+    )
+
+
+@app.route('/api/jobs/export', methods=['POST'])
+def submit_export_job():
+    """
+    提交后台导出任务
+    
+    请求参数与 /api/export-pag 相同（pagFile 或 templateId + modifications + 图片字段）。
+    上传的 pagFile 会先存入模板仓库，工作进程按模板 ID 读取。
+    
+    返回：
+        - 202 + jobId，之后轮询 GET /api/jobs/<jobId>
+        - 503 未完成任务已满
+    """
+    if not PAG_AVAILABLE:
+        return jsonify({
+            'error': 'PAG SDK 未安装',
+            'message': '请运行: pip install libpag'
+        }), 500
+    
+    pag_bytes, template_hash, pag_filename = read_template_from_request()
+    if 'pagFile' in request.files:
+        template_hash, _ = template_store.put(pag_bytes)
+    
+    try:
+        modifications = json.loads(request.form.get('modifications', '[]'))
+    except json.JSONDecodeError:
+        return jsonify({'error': 'modifications 必须是有效的 JSON'}), 400
+    
+    images = {name: f.read() for name, f in request.files.items() if name != 'pagFile'}
+    
+    try:
+        job = export_jobs.submit(template_hash, modifications, images=images, filename=pag_filename)
+    except JobQueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    log.debug("提交导出任务 %s (模板 %s, %s 个修改项)", job.job_id, template_hash[:12], len(modifications))
+    
+    response = jsonify(job.to_dict())
+    response.headers['Location'] = f'/api/jobs/{job.job_id}'
+    return response, 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """查询导出任务状态"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_export_job(job_id):
+    """取消导出任务并删除结果"""
+    if not export_jobs.cancel(job_id):
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+    return jsonify({'success': True})
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_export_job_result(job_id):
+    """下载导出任务结果"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'任务不存在: {job_id}'}), 404
+    
+    status = job.status
+    if status == 'failed':
+        return jsonify({'error': job.error, 'status': status}), job.error_status or 500
+    if status != 'done':
+        # 尚未完成：告诉客户端稍后再来
+        response = jsonify({'error': '任务尚未完成', 'status': status})
+        response.headers['Retry-After'] = '1'
+        return response, 409
+    
+    return send_file(
+        job.output_path,
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f'modified_{job.filename}'
+    )
+
+
+def _decode_data_url(value):
+    """JSON 版本的图片值：data:image/...;base64,... → 图片字节"""
+    if isinstance(value, str) and value.startswith('data:image'):
+        return base64.b64decode(value.split(',')[1])
+    return None
+
+
+def _export_simple(pipeline, pag_bytes, modifications, load_image, template_hash=None, failures=None):
+    """
+    简化版导出：替换文本和图片（不做变换处理）
+
+    Args:
+        pipeline: 当前 pypag 工作线程的导出流程（提供模板缓存、图片缓存和读写）
+        pag_bytes: 模板文件字节
+        modifications: 修改配置列表
+        load_image: image 修改项的 value → 图片字节（找不到时返回 None）
+        template_hash: 已计算好的模板内容哈希（可选）
+        failures: 传入列表时，未能应用的修改项以 (layerIndex, 原因) 追加到其中
+
+    Returns:
+        bytes: 修改后的 PAG 文件
+
+    Raises:
+        ExportError: 模板无法加载或保存失败
+    """
+    # 加载并修改（命中缓存时直接复制已解析的模板）
+    with stage('load'):
+        pag, _ = pipeline.template_cache.checkout(pag_bytes, key=template_hash)
+    if not pag:
+        raise ExportError('无法加载 PAG 文件', 400)
+    pag = traced(pag)
+    if failures is None:
+        failures = []
+    
+    for mod in modifications:
+        layer_index = mod.get('layerIndex')
+        mod_type = mod.get('type')
+        value = mod.get('value')
+        
+        if mod_type == 'text':
+            with stage('replace_text'):
+                text_data = pag.getTextData(layer_index)
+                if text_data:
+                    text_data.text = value
+                    pag.replaceText(layer_index, text_data)
+                else:
+                    failures.append((layer_index, '文本图层不存在'))
+        
+        elif mod_type == 'image':
+            image_bytes = load_image(value)
+            if not image_bytes:
+                failures.append((layer_index, '找不到图片数据'))
+                continue
+            # 加载图片（同一图片只解码一次）
+            with stage('image_decode'):
+                image = pipeline.image_cache.from_bytes(image_bytes)
+            if image:
+                with stage('replace_image'):
+                    pag.replaceImage(layer_index, image)
+            else:
+                failures.append((layer_index, '图片解码失败'))
+    
+    with stage('save'):
+        output_bytes = pipeline.io.save(pag)
+    if not output_bytes:
+        raise ExportError('PAG 文件保存失败', 500)
+    return output_bytes
+
+
 @app.route('/api/export-pag-simple', methods=['POST'])
 def export_pag_simple():
     """
-    简化版导出 - 使用 base64 编码的图片数据
+    简化版导出 - 模板和图片随请求一起发送
     
-    适用于前端直接发送图片数据的场景
+    适用于前端直接发送图片数据的场景。两种请求格式：
+        - application/json: {"pagFile": base64, "modifications": [...]}，
+          图片值为 data:image/...;base64,...，返回 {"success": true, "pagFile": base64}
+        - application/x-pag-wire: 二进制帧格式（见 pag_wire.py），图片值为图片帧名称，
+          直接返回修改后的 PAG 文件（application/octet-stream），没有 base64 膨胀
     """
     try:
         if not PAG_AVAILABLE:
@@ -871,79 +1412,67 @@ def export_pag_simple():
                 'message': '请运行: pip install libpag'
             }), 500
         
-        data = request.get_json()
-        
-        # 获取 base64 编码的 PAG 文件
-        pag_base64 = data.get('pagFile')
-        modifications = data.get('modifications', [])
-        
-        # 解码 PAG 文件
-        pag_bytes = base64.b64decode(pag_base64)
-        
-        # 保存到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pag') as temp_input:
-            temp_input.write(pag_bytes)
-            temp_input_path = temp_input.name
-        
-        temp_output = tempfile.NamedTemporaryFile(delete=False, suffix='.pag')
-        temp_output_path = temp_output.name
-        temp_output.close()
-        
-        try:
-            # 加载并修改
-            pag = libpag.PAGFile.Load(temp_input_path)
-            
-            for mod in modifications:
-                layer_index = mod.get('layerIndex')
-                mod_type = mod.get('type')
-                value = mod.get('value')
-                
-                if mod_type == 'text':
-                    text_data = pag.getTextData(layer_index)
-                    if text_data:
-                        text_data.text = value
-                        pag.replaceText(layer_index, text_data)
-                
-                elif mod_type == 'image':
-                    # value 是 base64 编码的图片
-                    if value.startswith('data:image'):
-                        # 提取 base64 数据
-                        image_data = value.split(',')[1]
-                        image_bytes = base64.b64decode(image_data)
-                        
-                        # 保存到临时文件
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_img:
-                            temp_img.write(image_bytes)
-                            image = libpag.PAGImage.FromPath(temp_img.name)
-                            if image:
-                                pag.replaceImage(layer_index, image)
-                            os.unlink(temp_img.name)
-            
-            # 保存
-            pag.save(temp_output_path)
+        if request.mimetype == WIRE_CONTENT_TYPE:
+            with stage('parse_upload'):
+                try:
+                    pag_bytes, pag_filename, modifications, images = read_wire_request(request.stream)
+                except WireFormatError as e:
+                    return jsonify({'error': str(e)}), 400
+                template_hash = template_key(pag_bytes)
             
-            # 读取并编码为 base64
-            with open(temp_output_path, 'rb') as f:
-                output_bytes = f.read()
+            etag = output_key('simple', template_hash, modifications, images)
+            if request.if_none_match.contains(etag):
+                return _export_precondition_failed(etag)
             
-            output_base64 = base64.b64encode(output_bytes).decode('utf-8')
+            try:
+                output_bytes, cache_status = _cached_export(etag, template_hash, lambda pipeline, failures: _export_simple(
+                    pipeline, pag_bytes, modifications, images.get, template_hash=template_hash, failures=failures))
+            except ExportError as e:
+                return jsonify({'error': e.message}), e.status
             
-            # 清理
-            os.unlink(temp_input_path)
-            os.unlink(temp_output_path)
+            response = send_file(
+                io.BytesIO(output_bytes),
+                mimetype='application/octet-stream',
+                as_attachment=True,
+                download_name=f'modified_{pag_filename or "output.pag"}'
+            )
+            return _export_cache_headers(response, etag, cache_status)
+        
+        with stage('parse_upload'):
+            data = request.get_json()
             
-            return jsonify({
-                'success': True,
-                'pagFile': output_base64
-            })
+            # 获取 base64 编码的 PAG 文件
+            pag_base64 = data.get('pagFile')
+            modifications = data.get('modifications', [])
             
-        except Exception as e:
-            if os.path.exists(temp_input_path):
-                os.unlink(temp_input_path)
-            if os.path.exists(temp_output_path):
-                os.unlink(temp_output_path)
-            raise e
+            # 解码 PAG 文件
+            pag_bytes = base64.b64decode(pag_base64)
+            template_hash = template_key(pag_bytes)
+        
+        # JSON 响应与二进制响应是同一结果的不同表示，ETag 加后缀区分
+        key = output_key('simple', template_hash, modifications)
+        etag = f'{key}-json'
+        if request.if_none_match.contains(etag):
+            return _export_precondition_failed(etag)
+        
+        try:
+            output_bytes, cache_status = _cached_export(key, template_hash, lambda pipeline, failures: _export_simple(
+                pipeline, pag_bytes, modifications, _decode_data_url, template_hash=template_hash, failures=failures))
+        except ExportError as e:
+            return jsonify({'error': e.message}), e.status
+        
+        # 编码为 base64
+        output_base64 = base64.b64encode(output_bytes).decode('utf-8')
+        
+        response = jsonify({
+            'success': True,
+            'pagFile': output_base64
+        })
+        # GET /api/exports/<key> 返回的是二进制表示，JSON 响应不带 Content-Location
+        return _export_cache_headers(response, etag, cache_status, location=False)
         
+    except (APIError, AdmissionRejected, ActorTimeout):
+        raise
     except Exception as e:
         import traceback
         return jsonify({
@@ -953,6 +1482,7 @@ def export_pag_simple():
 
 
 if __name__ == '__main__':
+    print_pag_sdk_status()
     print("""
     ╔═══════════════════════════════════════╗
     ║   🚀 PAG 导出服务器                    ║
@@ -971,5 +1501,7 @@ if __name__ == '__main__':
         error_info="" if PAG_AVAILABLE else f"\n    错误信息: {IMPORT_ERROR_MSG}\n    解决方法: 设置 PYTHONPATH 或安装 libpag"
     ))
     
-    # 运行服务器，配置允许大文件上传
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
+    # 开发服务器（单进程）。生产环境请使用 gunicorn：
+    #   gunicorn -c gunicorn.conf.py wsgi:app
+    debug = os.environ.get('PAG_SERVER_DEBUG', '0') == '1'
+    app.run(debug=debug, host='0.0.0.0', port=5000, threaded=True)
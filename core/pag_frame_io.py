@@ -0,0 +1,170 @@
+"""
+渲染帧的像素缓冲与图片编码
+
+逐帧渲染时，surface.readPixels() 每帧都会分配一块 宽 × 高 × 4 的新内存，
+PNG 编码又在渲染线程里同步进行，渲染和编码互相等待。这里：
+    - FrameBufferPool 预先分配固定数量的像素缓冲区，帧数据读进空闲的缓冲区，
+      编码完成后归还复用；没有空闲缓冲区时渲染线程等待，长视频的内存占用保持不变
+    - pixels_view() 把缓冲区零拷贝地视为 (高, 宽, 4) 的 NumPy 数组（未安装 NumPy 时返回 memoryview）
+    - FrameEncoder 在线程池中编码 PNG / WebP（Pillow 编码时释放 GIL），
+      渲染下一帧和编码上一帧同时进行
+
+依赖 Pillow 编码图片，NumPy 可选；两者都在第一次使用时才导入。
+"""
+
+import queue
+import threading
+
+# 输出格式 -> (Pillow 格式名, 保存参数)
+IMAGE_FORMATS = {
+    'png': ('PNG', {'compress_level': 1}),
+    'webp': ('WEBP', {'lossless': True, 'method': 0}),
+}
+
+
+def _load_pillow_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("保存帧图片需要 Pillow：pip install pillow")
+    return Image
+
+
+def pixels_view(buffer, width, height):
+    """
+    像素缓冲区的零拷贝视图
+
+    Returns:
+        numpy.ndarray (高, 宽, 4)，未安装 NumPy 时返回 memoryview
+    """
+    try:
+        import numpy
+    except ImportError:
+        return memoryview(buffer)
+    return numpy.frombuffer(buffer, dtype=numpy.uint8, count=width * height * 4).reshape(height, width, 4)
+
+
+class FrameBufferPool:
+    """固定数量、固定大小的像素缓冲区"""
+
+    def __init__(self, width, height, count):
+        """
+        Args:
+            width: 帧宽度
+            height: 帧高度
+            count: 缓冲区数量（同时在编码中的帧数上限）
+        """
+        self.width = width
+        self.height = height
+        self.row_bytes = width * 4
+        self.size = self.row_bytes * height
+        self.count = count
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(self.size))
+
+    def acquire(self):
+        """取出一个空闲缓冲区（全部在使用中时等待）"""
+        return self._free.get()
+
+    def release(self, buffer):
+        """归还缓冲区"""
+        self._free.put(buffer)
+
+
+def encode_image(buffer, width, height, output_path, fmt='png', raw_mode='RGBA'):
+    """
+    把 RGBA 像素缓冲区保存为图片（不复制像素数据）
+
+    Args:
+        buffer: 像素缓冲区（bytearray / memoryview）
+        width: 帧宽度
+        height: 帧高度
+        output_path: 输出文件路径
+        fmt: 'png' 或 'webp'
+        raw_mode: 缓冲区的像素排列（'RGBA' 或 'BGRA'）
+    """
+    Image = _load_pillow_image()
+    pillow_format, options = IMAGE_FORMATS[fmt]
+    image = Image.frombuffer('RGBA', (width, height), buffer, 'raw', raw_mode, 0, 1)
+    image.save(output_path, pillow_format, **options)
+
+
+class FrameEncoder:
+    """在线程池中编码帧图片，编码完成后把缓冲区还给 FrameBufferPool"""
+
+    def __init__(self, pool, workers=2, fmt='png', raw_mode='RGBA'):
+        """
+        Args:
+            pool: FrameBufferPool（缓冲区数量即排队上限）
+            workers: 编码线程数
+            fmt: 'png' 或 'webp'
+            raw_mode: 缓冲区的像素排列
+        """
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图片格式: {fmt}（可选: {', '.join(IMAGE_FORMATS)}）")
+        _load_pillow_image()
+        # 线程池只在真正保存帧时才需要
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.pool = pool
+        self.fmt = fmt
+        self.raw_mode = raw_mode
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pag-encode')
+        # 只记录在途帧数和尚未取走的结果，Future 完成后即丢弃，长视频的记账开销不随帧数增长
+        self._in_flight = 0
+        self._finished = []
+        self._cond = threading.Condition()
+
+    def submit(self, buffer, output_path, tag=None):
+        """
+        提交一帧（buffer 来自 pool.acquire()，编码结束后自动归还）
+
+        Args:
+            tag: 附带的标识（例如帧号），collect() / results() 中原样返回
+        """
+        with self._cond:
+            self._in_flight += 1
+        future = self._executor.submit(self._encode, buffer, output_path)
+        future.add_done_callback(lambda future: self._on_done(tag, output_path, future))
+        return future
+
+    def _on_done(self, tag, output_path, future):
+        error = future.exception() if not future.cancelled() else RuntimeError("编码已取消")
+        with self._cond:
+            self._finished.append((tag, output_path, error))
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _encode(self, buffer, output_path):
+        try:
+            encode_image(buffer, self.pool.width, self.pool.height, output_path, self.fmt, self.raw_mode)
+        finally:
+            self.pool.release(buffer)
+        return output_path
+
+    def collect(self):
+        """
+        取走已编码完成的帧（不等待），渲染过程中定期调用，结果不会在编码器中积累
+
+        Returns:
+            list: [(tag, 输出路径, 异常或 None), ...]，按完成顺序
+        """
+        with self._cond:
+            finished, self._finished = self._finished, []
+        return finished
+
+    def results(self):
+        """
+        等待剩余的帧编码完成
+
+        Returns:
+            list: 尚未被 collect() 取走的 [(tag, 输出路径, 异常或 None), ...]，按完成顺序
+        """
+        with self._cond:
+            while self._in_flight:
+                self._cond.wait()
+        return self.collect()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
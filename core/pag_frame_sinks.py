@@ -0,0 +1,333 @@
+"""
+视频帧输出（sink） - 渲染出的原始 RGBA 帧直接送进编码器，不落地成图片
+
+先渲染几千张 PNG 再交给 ffmpeg 编码，PNG 的压缩 / 解压和磁盘读写都是白做的。
+PAGRuntimeRenderer.render_to_stream() 把每帧像素交给一个 sink：
+    - EncoderProcessSink  外部编码器子进程（默认 ffmpeg），原始帧写入其 stdin
+    - RawFrameSink        原始 RGBA 帧依次写入文件 / 流
+    - Y4MFrameSink        YUV4MPEG2（4:4:4）文件 / 流，大多数编码器可以直接读取
+    - CallbackFrameSink   每帧回调 fn(帧号, 像素)，在内存中处理
+
+FrameStreamWriter 在单独的线程中调用 sink.write()（写管道 / 文件时释放 GIL），
+渲染下一帧和写出上一帧同时进行；排队的帧数受 FrameBufferPool 的缓冲区数量限制。
+
+    sink = EncoderProcessSink('output.mp4')
+    renderer.render_to_stream(sink)
+"""
+
+import collections
+import queue
+import subprocess
+import threading
+
+
+class FrameSink:
+    """
+    帧输出的接口
+
+    open() 在第一帧之前调用一次，write() 按帧号顺序调用，
+    全部写完后调用 close()，渲染失败时调用 abort()
+    """
+
+    def open(self, width, height, fps, pixel_format='rgba'):
+        """
+        Args:
+            width: 帧宽度
+            height: 帧高度
+            fps: 帧率
+            pixel_format: 像素排列 'rgba' / 'bgra'
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pixel_format = pixel_format
+
+    def write(self, frame_index, buffer):
+        """写出一帧（buffer 在返回后会被复用，需要保留时请自行复制）"""
+        raise NotImplementedError
+
+    def close(self):
+        """全部帧写完，返回 sink 的结果（输出路径等）"""
+        return None
+
+    def abort(self):
+        """渲染失败，丢弃未完成的输出"""
+        self.close()
+
+
+def _open_output(target):
+    """target 为路径时以二进制写方式打开，否则视为已打开的流"""
+    if isinstance(target, (str, bytes)) or hasattr(target, '__fspath__'):
+        return open(target, 'wb'), True
+    return target, False
+
+
+class RawFrameSink(FrameSink):
+    """原始像素依次写入文件 / 流（ffmpeg -f rawvideo 可直接读取）"""
+
+    def __init__(self, target):
+        """
+        Args:
+            target: 输出路径或可写的二进制流
+        """
+        self.target = target
+        self._stream = None
+        self._owns_stream = False
+
+    def open(self, width, height, fps, pixel_format='rgba'):
+        super().open(width, height, fps, pixel_format)
+        self._stream, self._owns_stream = _open_output(self.target)
+
+    def write(self, frame_index, buffer):
+        self._stream.write(buffer)
+
+    def close(self):
+        if self._stream is not None:
+            if self._owns_stream:
+                self._stream.close()
+            else:
+                self._stream.flush()
+            self._stream = None
+        return self.target
+
+
+class Y4MFrameSink(RawFrameSink):
+    """
+    YUV4MPEG2 输出（4:4:4，全范围 BT.601，丢弃透明通道）
+
+    颜色转换由 Pillow 完成（convert('YCbCr')，C 实现）
+    """
+
+    def open(self, width, height, fps, pixel_format='rgba'):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise RuntimeError("Y4M 输出需要 Pillow：pip install pillow")
+        self._image = Image
+        super().open(width, height, fps, pixel_format)
+        rate = _fps_fraction(fps)
+        header = f'YUV4MPEG2 W{width} H{height} F{rate[0]}:{rate[1]} Ip A1:1 C444 XCOLORRANGE=FULL\n'
+        self._stream.write(header.encode('ascii'))
+
+    def write(self, frame_index, buffer):
+        image = self._image.frombuffer('RGBA', (self.width, self.height), buffer,
+                                       'raw', self.pixel_format.upper(), 0, 1)
+        ycbcr = image.convert('RGB').convert('YCbCr')
+        self._stream.write(b'FRAME\n')
+        for plane in ycbcr.split():
+            self._stream.write(plane.tobytes())
+
+
+def _fps_fraction(fps):
+    """帧率转为 Y4M 的分数形式（29.97 -> 30000:1001）"""
+    if float(fps).is_integer():
+        return int(fps), 1
+    # NTSC 帧率（23.976、29.97、59.94）通常只写到两三位小数，按 N × 1000 / 1001 识别
+    ntsc = fps * 1.001
+    if abs(ntsc - round(ntsc)) < 1e-3:
+        return int(round(ntsc)) * 1000, 1001
+    for denominator in (100, 1000):
+        numerator = fps * denominator
+        if abs(numerator - round(numerator)) < 1e-3:
+            return int(round(numerator)), denominator
+    return int(round(fps * 1000)), 1000
+
+
+class CallbackFrameSink(FrameSink):
+    """每帧调用 fn(帧号, 像素视图)，像素视图只在回调期间有效"""
+
+    def __init__(self, fn, as_array=True):
+        """
+        Args:
+            fn: 回调函数
+            as_array: True 时传入 (高, 宽, 4) NumPy 视图（未安装 NumPy 时为 memoryview）
+        """
+        self.fn = fn
+        self.as_array = as_array
+        self.frames = 0
+
+    def write(self, frame_index, buffer):
+        if self.as_array:
+            try:
+                from .pag_frame_io import pixels_view
+            except ImportError:
+                from pag_frame_io import pixels_view
+            pixels = pixels_view(buffer, self.width, self.height)
+        else:
+            pixels = memoryview(buffer)
+        self.fn(frame_index, pixels)
+        self.frames += 1
+
+    def close(self):
+        return self.frames
+
+
+def ffmpeg_command(output_path, width, height, fps, pixel_format='rgba',
+                   codec='libx264', preset='veryfast', crf=18, extra_args=None, ffmpeg='ffmpeg'):
+    """
+    从 stdin 读取原始帧并编码为视频文件的 ffmpeg 命令
+
+    Returns:
+        list: 命令参数列表
+    """
+    command = [
+        ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'rawvideo', '-pix_fmt', pixel_format,
+        '-s', f'{width}x{height}', '-r', str(fps),
+        '-i', '-',
+        '-c:v', codec,
+    ]
+    if codec in ('libx264', 'libx265'):
+        command += ['-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
+    if extra_args:
+        command += list(extra_args)
+    command.append(output_path)
+    return command
+
+
+class EncoderProcessSink(FrameSink):
+    """原始帧写入外部编码器子进程的 stdin"""
+
+    def __init__(self, output_path=None, command=None, **ffmpeg_options):
+        """
+        Args:
+            output_path: 输出视频路径（使用默认 ffmpeg 命令时）
+            command: 自定义命令，可以是列表，也可以是 fn(width, height, fps, pixel_format) -> 列表
+            **ffmpeg_options: 传给 ffmpeg_command() 的参数（codec、crf、extra_args 等）
+        """
+        if output_path is None and command is None:
+            raise ValueError("需要 output_path 或 command")
+        self.output_path = output_path
+        self.command = command
+        self.ffmpeg_options = ffmpeg_options
+        self._process = None
+        self._stderr_tail = collections.deque(maxlen=20)
+        self._stderr_thread = None
+
+    def _build_command(self):
+        if self.command is None:
+            return ffmpeg_command(self.output_path, self.width, self.height, self.fps,
+                                  self.pixel_format, **self.ffmpeg_options)
+        if callable(self.command):
+            return self.command(self.width, self.height, self.fps, self.pixel_format)
+        return list(self.command)
+
+    def open(self, width, height, fps, pixel_format='rgba'):
+        super().open(width, height, fps, pixel_format)
+        command = self._build_command()
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError(f"找不到编码器: {command[0]}")
+        # 持续读取 stderr，避免管道写满阻塞编码器；保留最后几行用于报错
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, name='pag-encoder-stderr', daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        for line in self._process.stderr:
+            self._stderr_tail.append(line.decode('utf-8', 'replace').rstrip())
+
+    def write(self, frame_index, buffer):
+        try:
+            self._process.stdin.write(buffer)
+        except (BrokenPipeError, OSError):
+            # 编码器提前退出，等它结束并读完 stderr 后再报错
+            self._process.wait()
+            self._stderr_thread.join()
+            raise RuntimeError(self._error_message())
+
+    def _error_message(self):
+        detail = '\n'.join(self._stderr_tail)
+        return f"编码器退出（返回码 {self._process.returncode}）" + (f":\n{detail}" if detail else '')
+
+    def _finish(self):
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.wait()
+        self._stderr_thread.join()
+
+    def close(self):
+        if self._process is None:
+            return self.output_path
+        self._finish()
+        returncode = self._process.returncode
+        if returncode != 0:
+            raise RuntimeError(self._error_message())
+        self._process = None
+        return self.output_path
+
+    def abort(self):
+        if self._process is None:
+            return
+        self._process.kill()
+        self._finish()
+        self._process = None
+
+
+class FrameStreamWriter:
+    """在单独的线程中把帧依次交给 sink，写完后把缓冲区还给 FrameBufferPool"""
+
+    def __init__(self, sink, pool):
+        """
+        Args:
+            sink: FrameSink（已 open）
+            pool: FrameBufferPool（缓冲区数量即排队上限）
+        """
+        self.sink = sink
+        self.pool = pool
+        self.frames = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='pag-frame-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame_index, buffer):
+        """
+        提交一帧（buffer 来自 pool.acquire()）
+
+        Raises:
+            sink.write() 之前抛出的异常（写出失败后不再接受新帧）
+        """
+        if self.error is not None:
+            self.pool.release(buffer)
+            raise self.error
+        self._queue.put((frame_index, buffer))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame_index, buffer = item
+            try:
+                if self.error is None:
+                    self.sink.write(frame_index, buffer)
+                    self.frames += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                self.pool.release(buffer)
+
+    def finish(self):
+        """
+        等待排队的帧全部写完
+
+        Raises:
+            写出过程中的异常
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.frames
+
+    def finish_quietly(self):
+        """渲染失败时停止写出线程（已在写出过程中的异常不再抛出）"""
+        if self._thread.is_alive():
+            if self.error is None:
+                self.error = RuntimeError("渲染已中止")
+            self._queue.put(None)
+            self._thread.join()
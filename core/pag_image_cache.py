@@ -0,0 +1,159 @@
+"""
+替换图片缓存 - 同一张图片在一个进程内只解码一次
+
+批量生成和服务端导出中，公司 Logo、公共背景等图片会被反复使用，
+每次都 PAGImage.FromPath 重新解码很浪费。这里缓存解码后的 PAGImage：
+文件按 路径 + mtime + 大小 作为键，上传的字节按 SHA-256 作为键，
+按估算的解码内存（宽 × 高 × 4）做 LRU 淘汰。
+
+注意：缓存的 PAGImage 会被多次使用，调用方如果要 setMatrix / setScaleMode，
+需要通过 variant 区分（例如 模板哈希 + 图层索引），避免互相覆盖。
+
+传入 fit（pag_image_resize.ImageFit）时，解码前先把图片缩小到图层需要的尺寸，
+缩小只在缓存未命中时做一次，fit 同时作为缓存键的一部分。
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from .pag_io import PAGBufferIO
+    from .pag_image_resize import fit_image_bytes
+except ImportError:
+    from pag_io import PAGBufferIO
+    from pag_image_resize import fit_image_bytes
+
+
+# 没有缩小的图片
+_UNSCALED = (1.0, 1.0)
+
+
+class PAGImageCache:
+    """解码后 PAGImage 的 LRU 缓存（按估算内存限制容量）"""
+
+    def __init__(self, pag_module, max_bytes=256 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            pag_module: pypag / libpag 模块
+            max_bytes: 缓存图片估算解码内存的总上限
+        """
+        self.pag_module = pag_module
+        self.io = PAGBufferIO(pag_module)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def from_path(self, path, variant=None, fit=None):
+        """
+        按文件路径获取图片
+
+        Args:
+            path: 图片文件路径
+            variant: 区分同一图片不同用法的附加键（可选）
+            fit: 目标尺寸 ImageFit（可选，超出时先缩小再解码）
+
+        Returns:
+            PAGImage，解码失败时返回 None
+        """
+        st = os.stat(path)
+        key = ('path', os.path.abspath(path), st.st_mtime_ns, st.st_size, variant, fit)
+
+        def decode():
+            if fit is not None:
+                with open(path, 'rb') as f:
+                    fitted = fit_image_bytes(f.read(), fit)
+                if fitted is not None:
+                    return self.io.image_from_bytes(fitted.data, fitted.suffix), fitted.scale
+            return self.pag_module.PAGImage.FromPath(path), _UNSCALED
+        return self._get_or_decode(key, decode)[0]
+
+    def from_bytes(self, data, variant=None, suffix='.png', fit=None):
+        """
+        按图片字节获取图片（参数同 from_bytes_fitted）
+
+        Returns:
+            PAGImage，解码失败时返回 None
+        """
+        return self.from_bytes_fitted(data, variant, suffix, fit)[0]
+
+    def from_bytes_fitted(self, data, variant=None, suffix='.png', fit=None):
+        """
+        按图片字节获取图片，同时返回缩小的倍数
+
+        Args:
+            data: 图片文件字节
+            variant: 区分同一图片不同用法的附加键（可选）
+            suffix: 绑定不支持从字节解码时，临时文件的扩展名
+            fit: 目标尺寸 ImageFit（可选，超出时先缩小再解码）
+
+        Returns:
+            tuple: (PAGImage, (sx, sy))；倍数是原图相对解码图片的尺寸，与图片一起缓存，
+            命中时不需要重新读取原图；解码失败时为 (None, (1.0, 1.0))
+        """
+        key = ('sha256', hashlib.sha256(data).hexdigest(), variant, fit)
+
+        def decode():
+            fitted = fit_image_bytes(data, fit) if fit is not None else None
+            if fitted is not None:
+                return self.io.image_from_bytes(fitted.data, fitted.suffix), fitted.scale
+            return self.io.image_from_bytes(data, suffix), _UNSCALED
+        return self._get_or_decode(key, decode)
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _get_or_decode(self, key, decode):
+        """返回 (PAGImage, 缩小倍数)，decode() 同样返回这个二元组"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[2]
+            self.misses += 1
+
+        image, scale = decode()
+        if not image:
+            return None, _UNSCALED
+
+        size = self._estimate_size(image)
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (image, size, scale)
+                self._total_bytes += size
+                while self._total_bytes > self.max_bytes:
+                    _, (_, old_size, _) = self._entries.popitem(last=False)
+                    self._total_bytes -= old_size
+                    self.evictions += 1
+        return image, scale
+
+    @staticmethod
+    def _estimate_size(image):
+        """估算解码后占用的内存（RGBA）"""
+        try:
+            return max(int(image.width()) * int(image.height()) * 4, 1)
+        except Exception:
+            return 1
@@ -0,0 +1,190 @@
+"""
+替换图片预处理 - 按图层实际需要的尺寸缩小（并可转码）后再交给 replaceImage
+
+用户经常给 400×400 的图片层上传 2400 万像素的手机照片，每次导出都要解码、
+嵌入、传输整张原图。图层的占位图尺寸（getOriginalImageBounds）和缩放因子
+（getOriginalScaleFactor）决定了实际需要的像素数，超出部分只是浪费：
+    - 目标尺寸 = 占位图尺寸 × max(缩放因子, 1) × oversample
+    - 按"铺满"计算缩放比例（缩放后宽高都不小于目标），只缩小不放大
+    - 先按 EXIF 方向旋转（重新编码会丢掉 EXIF），带透明通道的图片保持 PNG
+    - format='jpeg' 时不透明图片转为 JPEG，进一步减小体积
+
+依赖 Pillow（可选）。未安装时原样使用上传的图片，不影响导出。
+"""
+
+import io
+import math
+import threading
+from collections import namedtuple
+
+# 一次缩放的目标：宽、高、输出格式（None 表示保持原格式）、JPEG 质量
+ImageFit = namedtuple('ImageFit', 'width height format quality')
+
+# 处理后的图片：字节、扩展名、原图相对新图的倍数 (sx, sy)（未缩小时为 (1.0, 1.0)）
+FittedImage = namedtuple('FittedImage', 'data suffix scale')
+
+_pillow = None
+_pillow_checked = False
+_pillow_lock = threading.Lock()
+
+
+def _load_pillow():
+    """第一次需要时才导入 Pillow（未安装时返回 None）"""
+    global _pillow, _pillow_checked
+    if _pillow_checked:
+        return _pillow
+    with _pillow_lock:
+        if not _pillow_checked:
+            try:
+                from PIL import Image, ImageOps
+                _pillow = (Image, ImageOps)
+            except ImportError:
+                _pillow = None
+            _pillow_checked = True
+    return _pillow
+
+
+def pillow_available():
+    """是否可以进行图片缩放"""
+    return _load_pillow() is not None
+
+
+def _call_or_value(obj, name):
+    value = getattr(obj, name, None)
+    return value() if callable(value) else value
+
+
+def layer_image_size(layer):
+    """
+    图层占位图的尺寸和缩放因子
+
+    Returns:
+        tuple: (宽, 高, 缩放因子)，绑定不支持或调用失败时返回 None
+    """
+    if not hasattr(layer, 'getOriginalImageBounds'):
+        return None
+    try:
+        bounds = layer.getOriginalImageBounds()
+        width = float(_call_or_value(bounds, 'width'))
+        height = float(_call_or_value(bounds, 'height'))
+    except Exception:
+        return None
+    if width <= 0 or height <= 0:
+        return None
+
+    scale = 1.0
+    if hasattr(layer, 'getOriginalScaleFactor'):
+        try:
+            scale = float(layer.getOriginalScaleFactor())
+        except Exception:
+            scale = 1.0
+    return width, height, scale
+
+
+class ImageFitPolicy:
+    """根据图层计算替换图片的目标尺寸"""
+
+    def __init__(self, enabled=True, oversample=1.0, format=None, quality=90):
+        """
+        Args:
+            enabled: 是否缩放（未安装 Pillow 时自动关闭）
+            oversample: 在图层所需尺寸基础上额外保留的倍数（高分屏渲染可设为 2）
+            format: None 保持原格式，'jpeg' 把不透明图片转为 JPEG，'png' 一律转为 PNG
+            quality: JPEG 质量
+        """
+        self.enabled = enabled
+        self.oversample = oversample
+        self.format = format.lower() if format else None
+        self.quality = quality
+
+    @property
+    def active(self):
+        return self.enabled and pillow_available()
+
+    def tag(self):
+        """参与导出结果缓存键的设置摘要（设置变化时旧的缓存结果自动失效）"""
+        if not self.active:
+            return 'original'
+        return f'fit-{self.oversample:g}-{self.format or "keep"}-{self.quality}'
+
+    def target_for_layer(self, layer):
+        """
+        图层需要的图片尺寸
+
+        Returns:
+            ImageFit: 目标尺寸，无法获取或未启用时返回 None
+        """
+        if not self.active:
+            return None
+        size = layer_image_size(layer)
+        if size is None:
+            return None
+        width, height, scale = size
+        factor = max(scale, 1.0) * self.oversample
+        return ImageFit(int(round(width * factor)), int(round(height * factor)),
+                        self.format, self.quality)
+
+
+def _display_size(image):
+    """按 EXIF 方向旋转后的宽高（只读取头部）"""
+    width, height = image.size
+    orientation = image.getexif().get(0x0112, 1) if hasattr(image, 'getexif') else 1
+    return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+
+
+def fit_image_bytes(data, fit):
+    """
+    把图片缩小到目标尺寸（必要时转码）
+
+    Args:
+        data: 图片文件字节
+        fit: ImageFit
+
+    Returns:
+        FittedImage：scale 用于调整针对原图尺寸设置的 matrix；
+        不需要处理、未安装 Pillow 或无法解码时返回 None
+    """
+    pillow = _load_pillow()
+    if pillow is None or fit is None:
+        return None
+    Image, ImageOps = pillow
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_format = (image.format or '').upper()
+        # 打开时只读取了头部，不需要缩小且不转码时不做完整解码
+        width, height = image.size
+        display_width, display_height = _display_size(image)
+        scale = max(fit.width / display_width, fit.height / display_height)
+        if scale >= 1.0 and fit.format is None:
+            return None
+
+        if scale < 1.0:
+            # draft 让 JPEG 解码时直接按 1/2、1/4、1/8 缩小，大照片不需要完整解码
+            image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+        image = ImageOps.exif_transpose(image)
+        resized = (1.0, 1.0)
+        if scale < 1.0:
+            size = (max(1, round(display_width * scale)), max(1, round(display_height * scale)))
+            image = image.resize(size, Image.LANCZOS)
+            resized = (display_width / size[0], display_height / size[1])
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        target_format = (fit.format or ('JPEG' if source_format == 'JPEG' else 'PNG')).upper()
+        out = io.BytesIO()
+        if target_format in ('JPEG', 'JPG') and not has_alpha:
+            image.convert('RGB').save(out, 'JPEG', quality=fit.quality, optimize=True)
+            suffix = '.jpg'
+        else:
+            if image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            image.save(out, 'PNG')
+            suffix = '.png'
+        result = out.getvalue()
+    except Exception:
+        return None
+
+    # 只转码不缩小时，结果没有变小就继续用原图
+    if scale >= 1.0 and len(result) >= len(data):
+        return None
+    return FittedImage(result, suffix, resized)
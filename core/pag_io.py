@@ -0,0 +1,131 @@
+"""
+PAG 内存读写 - 直接从字节加载模板 / 图片，保存为字节
+
+导出流程原先要把模板、每张图片、输出结果都落到临时文件再读回来，
+在没有 tmpfs 的容器里磁盘 I/O 是延迟的大头。绑定提供了缓冲区接口时
+全程在内存中完成；不提供时自动退回到临时文件方式，调用方无需关心。
+
+探测的绑定接口：
+    PAGFile.LoadFromBytes(data) 或 PAGFile.Load(data)   - 从字节加载模板
+    PAGImage.FromBytes(data)                             - 从字节解码图片
+    pag.saveToBytes()                                    - 保存为字节
+"""
+
+import os
+import tempfile
+
+
+class PAGBufferIO:
+    """PAG 字节读写，缓冲区接口不可用时退回临时文件"""
+
+    def __init__(self, pag_module):
+        """
+        Args:
+            pag_module: pypag / libpag 模块
+        """
+        self.pag_module = pag_module
+        # None 表示尚未探测；探测一次后记住结果，避免每次请求都抛 TypeError
+        self._buffer_load = None
+        self._buffer_image = None
+
+    def capabilities(self):
+        """当前绑定支持的缓冲区接口"""
+        return {
+            'load_from_bytes': self._buffer_load,
+            'image_from_bytes': self._buffer_image,
+            'save_to_bytes': hasattr(getattr(self.pag_module, 'PAGFile', None), 'saveToBytes'),
+        }
+
+    def load(self, data):
+        """
+        从字节加载 PAG 模板
+
+        Returns:
+            PAGFile，加载失败时返回 None
+        """
+        pag_file_cls = self.pag_module.PAGFile
+        if hasattr(pag_file_cls, 'LoadFromBytes'):
+            # 明确的缓冲区接口，返回 None 说明数据本身无效
+            self._buffer_load = True
+            return pag_file_cls.LoadFromBytes(data)
+
+        if self._buffer_load is not False:
+            try:
+                pag = pag_file_cls.Load(data)
+            except TypeError:
+                # 绑定只接受文件路径
+                pag = None
+            if pag is not None:
+                self._buffer_load = True
+                return pag
+            if self._buffer_load is None:
+                # 首次探测返回 None：只接受路径的绑定会把字节当作路径（不抛异常），
+                # 视为不支持，之后一律走临时文件
+                self._buffer_load = False
+            else:
+                return None
+
+        path = self._write_temp(data, '.pag')
+        try:
+            return self.pag_module.PAGFile.Load(path)
+        finally:
+            self._remove(path)
+
+    def image_from_bytes(self, data, suffix='.png'):
+        """
+        从字节解码图片
+
+        Returns:
+            PAGImage，解码失败时返回 None
+        """
+        image_cls = self.pag_module.PAGImage
+        if self._buffer_image is not False:
+            if hasattr(image_cls, 'FromBytes'):
+                try:
+                    image = image_cls.FromBytes(data)
+                    self._buffer_image = True
+                    return image
+                except TypeError:
+                    pass
+            self._buffer_image = False
+
+        path = self._write_temp(data, suffix)
+        try:
+            return image_cls.FromPath(path)
+        finally:
+            self._remove(path)
+
+    def save(self, pag):
+        """
+        把 PAG 文件保存为字节
+
+        Returns:
+            bytes，保存失败时返回 None
+        """
+        if hasattr(pag, 'saveToBytes'):
+            data = pag.saveToBytes()
+            return bytes(data) if data else None
+
+        temp_output = tempfile.NamedTemporaryFile(delete=False, suffix='.pag')
+        path = temp_output.name
+        temp_output.close()
+        try:
+            if not pag.save(path) or not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            self._remove(path)
+
+    @staticmethod
+    def _write_temp(data, suffix):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+            temp_file.write(data)
+            return temp_file.name
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
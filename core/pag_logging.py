@@ -0,0 +1,119 @@
+"""
+日志配置 - 分级日志 + 可选 JSON 结构化输出
+
+导出热路径原先全是 print(f"[DEBUG] ...")，每个请求都无条件格式化并写 stdout。
+现在统一走 logging：
+    - 默认 INFO 级别，DEBUG 日志不格式化、不输出（参数延迟求值）
+    - 每条日志自动带上当前请求的 request_id 和 endpoint
+    - PAG_LOG_FORMAT=json 时每行输出一个 JSON 对象，方便日志系统检索
+
+环境变量：
+    PAG_LOG_LEVEL    日志级别（DEBUG / INFO / WARNING / ERROR，默认 INFO）
+    PAG_LOG_FORMAT   text（默认）或 json
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+ROOT_LOGGER = 'pag'
+
+_context = threading.local()
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def get_logger(name):
+    """获取 pag 命名空间下的 logger（例如 get_logger('export') -> pag.export）"""
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+def set_request_context(request_id=None, endpoint=None):
+    """设置当前线程的请求上下文（由服务器的 before_request 调用）"""
+    _context.request_id = request_id
+    _context.endpoint = endpoint
+
+
+def get_request_context():
+    """
+    当前线程的请求上下文
+
+    Returns:
+        tuple: (request_id, endpoint)
+    """
+    return getattr(_context, 'request_id', None), getattr(_context, 'endpoint', None)
+
+
+def clear_request_context():
+    """清除当前线程的请求上下文"""
+    _context.request_id = None
+    _context.endpoint = None
+
+
+class _ContextFilter(logging.Filter):
+    """给每条日志附加 request_id / endpoint"""
+
+    def filter(self, record):
+        record.request_id = getattr(_context, 'request_id', None) or '-'
+        record.endpoint = getattr(_context, 'endpoint', None) or '-'
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                    + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'endpoint': getattr(record, 'endpoint', '-'),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        # logger.info(..., extra={'fields': {...}}) 附加的结构化字段
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """
+    配置 pag 命名空间的日志输出（只配置一次，不影响 root logger）
+
+    Args:
+        level: 日志级别，默认读取 PAG_LOG_LEVEL
+        fmt: 'text' 或 'json'，默认读取 PAG_LOG_FORMAT
+        stream: 输出流，默认 stderr
+    """
+    global _configured
+
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+
+    level = (level or os.environ.get('PAG_LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.environ.get('PAG_LOG_FORMAT', 'text')).lower()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.addFilter(_ContextFilter())
+    if fmt == 'json':
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s'))
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    logger.addHandler(handler)
+    logger.propagate = False
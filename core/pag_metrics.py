@@ -0,0 +1,268 @@
+"""
+导出服务器指标 - 分阶段耗时直方图 + 并发 / 队列计量，Prometheus 文本格式输出
+
+导出一次要经过：解析上传、加载模板、查找图层、解码图片、replaceImage、
+save、发送响应。每个阶段用 stage() 计时，请求结束时按
+端点 × 阶段 × 状态码 记入直方图，可以看出时间到底花在哪里。
+
+实现要点（常开也足够便宜）：
+    - 不依赖 prometheus_client，一个直方图观测 = 一次 bisect + 一次加锁累加
+    - 阶段计时器挂在线程局部变量上，没有绑定计时器的线程中 stage() 直接跳过
+    - 缓存命中数、任务队列等已有统计在抓取时通过回调读取，平时没有额外开销
+
+注意：指标按进程统计。gunicorn 多进程部署时每个工作进程各自一份，
+/metrics 返回的是处理该请求的那个进程的数据。
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 默认桶（秒）：覆盖几毫秒的查表到几十秒的大模板导出
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """带标签的直方图"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        """记录一次观测值（标签值按 labelnames 顺序传入）"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # 最后一格是 +Inf
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count)
+                        for labels, (counts, total, count) in self._series.items()]
+        lines = []
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """带标签的瞬时值"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def samples(self):
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in snapshot]
+
+
+class CallbackMetric:
+    """抓取时才读取的指标（例如缓存命中数、任务队列长度）"""
+
+    def __init__(self, name, documentation, type_name, labelnames, callback):
+        """
+        Args:
+            callback: 无参函数，返回 [(标签值元组, 数值), ...]
+        """
+        self.name = name
+        self.documentation = documentation
+        self.type_name = type_name
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logging.getLogger('pag.metrics').warning("读取指标 %s 失败: %s", self.name, e)
+            return []
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in values]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def callback(self, name, documentation, callback, labelnames=(), type_name='gauge'):
+        return self._register(CallbackMetric(name, documentation, type_name, labelnames, callback))
+
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'pag_export_stage_seconds',
+    '导出各阶段耗时（秒）：parse_upload / load / layer_lookup / image_decode / '
+    'replace_image / replace_text / save / send 等',
+    ('endpoint', 'stage', 'status'))
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'pag_http_request_duration_seconds',
+    'HTTP 请求总耗时（秒，不含响应发送）',
+    ('endpoint', 'method', 'status'))
+
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    'pag_admission_queue_wait_seconds',
+    '等待 pypag 执行名额的时间（秒）：outcome=admitted / queue_full / timeout',
+    ('endpoint', 'outcome'))
+
+IN_FLIGHT = REGISTRY.gauge(
+    'pag_http_requests_in_flight',
+    '正在处理（含正在发送响应）的请求数',
+    ('endpoint',))
+
+
+class StageTimer:
+    """一次请求（或一个任务）内各阶段的累计耗时"""
+
+    __slots__ = ('stages', '_previous')
+
+    def __init__(self):
+        self.stages = {}
+        self._previous = None
+
+    def add(self, stage_name, seconds):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def activate(self):
+        """绑定到当前线程，之后 stage() 的耗时记到这里"""
+        self._previous = getattr(_local, 'timer', None)
+        _local.timer = self
+
+    def deactivate(self):
+        """解除绑定，恢复之前的计时器"""
+        _local.timer = self._previous
+        self._previous = None
+
+    @contextmanager
+    def bind(self):
+        """在 with 块内绑定到当前线程"""
+        self.activate()
+        try:
+            yield self
+        finally:
+            self.deactivate()
+
+    def observe(self, endpoint, status):
+        """把累计的阶段耗时记入直方图"""
+        observe_stages(endpoint, self.stages, status)
+
+
+def current_timer():
+    """当前线程绑定的计时器，没有时返回 None"""
+    return getattr(_local, 'timer', None)
+
+
+@contextmanager
+def stage(stage_name):
+    """
+    阶段计时
+
+        with stage('save'):
+            output_data = self.io.save(pag)
+
+    当前线程没有绑定计时器时不做任何计时。同一阶段多次进入（例如多张图片）耗时累加。
+    """
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage_name, time.perf_counter() - started)
+
+
+def observe_stages(endpoint, stages, status):
+    """记录在其他进程中累计的阶段耗时（导出任务工作进程返回的 StageTimer.stages）"""
+    status = str(status)
+    for stage_name, seconds in stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint, stage_name, status)
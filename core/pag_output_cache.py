@@ -0,0 +1,208 @@
+"""
+导出结果缓存 - 相同的 (模板, 修改配置, 图片) 直接返回上次导出的 PAG 字节
+
+用户重新下载、重试或分享链接时，同一组输入会被反复导出。导出结果完全由
+输入决定，因此对输入计算一个规范化哈希：
+    - 模板：内容 SHA-256（与模板 ID 相同）
+    - 修改配置：按 JSON 规范化（键排序、紧凑分隔符），列表顺序保留
+    - 图片：image 修改项引用的图片替换为内容 SHA-256，字段名不同但内容相同也能命中；
+      服务器本地的图片路径按 路径 + mtime + 大小 计算，文件被替换后不会命中旧结果
+结果按哈希保存在磁盘上（按前两位分目录），超过容量时按最近访问时间淘汰。
+命中时不需要加载模板，也不调用 pypag。
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+try:
+    from .pag_template_cache import template_key
+except ImportError:
+    from pag_template_cache import template_key
+
+
+# 导出结果的格式版本，修改导出逻辑后递增，旧的缓存结果和 ETag 自动失效
+OUTPUT_VERSION = 3
+
+
+def _normalize_modifications(modifications, image_hashes):
+    """image 修改项的 value 替换为图片内容哈希"""
+    normalized = []
+    for mod in modifications:
+        if isinstance(mod, dict) and mod.get('type') == 'image':
+            value = mod.get('value')
+            if isinstance(value, str):
+                if value in image_hashes:
+                    digest = image_hashes[value]
+                else:
+                    # data URL 等内联值：直接对字符串取哈希，避免把几 MB 的 base64 写进规范化 JSON；
+                    # 文件路径：同一路径的文件内容可能变化，带上 mtime 和大小
+                    digest = hashlib.sha256(_inline_image_identity(value).encode('utf-8')).hexdigest()
+                mod = dict(mod, value=f'sha256:{digest}')
+        normalized.append(mod)
+    return normalized
+
+
+def _inline_image_identity(value):
+    """内联图片值的标识：文件路径为 路径 + mtime + 大小，其他值为字符串本身"""
+    if value.startswith('data:'):
+        return value
+    try:
+        st = os.stat(value)
+    except (OSError, ValueError):
+        return value
+    return f'file:{os.path.abspath(value)}:{st.st_mtime_ns}:{st.st_size}'
+
+
+def output_key(kind, template_hash, modifications, images=None):
+    """
+    计算导出结果的规范化哈希
+
+    Args:
+        kind: 导出方式（'export' / 'simple'，不同接口的处理逻辑不同，结果分开缓存）
+        template_hash: 模板内容哈希
+        modifications: 修改配置列表
+        images: 图片名 -> 图片字节（可选，只有被 image 修改项引用的图片参与计算）
+
+    Returns:
+        str: SHA-256 十六进制字符串
+    """
+    images = images or {}
+    image_hashes = {}
+    for mod in modifications:
+        if isinstance(mod, dict) and mod.get('type') == 'image':
+            value = mod.get('value')
+            if isinstance(value, str) and value in images and value not in image_hashes:
+                image_hashes[value] = template_key(images[value])
+
+    canonical = json.dumps({
+        'version': OUTPUT_VERSION,
+        'kind': kind,
+        'template': template_hash,
+        'modifications': _normalize_modifications(modifications, image_hashes),
+    }, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class PAGOutputCache:
+    """按规范化哈希寻址的导出结果磁盘缓存"""
+
+    def __init__(self, root_dir, max_bytes=1024 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            root_dir: 结果文件保存目录
+            max_bytes: 总字节数上限，超过后淘汰最久未使用的结果
+        """
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 当前总字节数，第一次写入时扫描目录得到，之后增量维护
+        self._total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root_dir, exist_ok=True)
+
+    def path_for(self, key):
+        """结果哈希对应的文件路径"""
+        return os.path.join(self.root_dir, key[:2], f'{key}.pag')
+
+    def get(self, key):
+        """
+        读取导出结果
+
+        Returns:
+            bytes: PAG 文件字节，不存在时返回 None
+        """
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """保存导出结果"""
+        if len(data) > self.max_bytes:
+            return
+        path = self.path_for(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子重命名，并发请求不会读到半个文件
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._prune(keep=path)
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self._total_bytes or 0,
+            }
+
+    def _scan(self):
+        """列出所有结果文件：([(mtime, size, path), ...], 总字节数)"""
+        files = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root_dir):
+            for name in filenames:
+                if not name.endswith('.pag'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return files, total
+
+    def _prune(self, keep=None):
+        """总容量超限时删除最久未使用的结果（调用方持有锁）"""
+        files, total = self._scan()
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+        self._total_bytes = total
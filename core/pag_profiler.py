@@ -0,0 +1,305 @@
+"""
+按需请求剖析 - 单个请求的采样剖析 + pypag 绑定调用计数
+
+生产环境排查慢导出时不需要重新部署：请求带上剖析标记（见服务器
+PAG_PROFILE_TOKEN 配置），这个请求就会：
+    - 在后台线程中每隔几毫秒采样一次请求线程的调用栈（sys._current_frames）；
+      请求的 pypag 工作交给 actor 线程执行时，该线程在执行期间同样被采样
+    - 通过代理对象统计每个 pypag 绑定方法的调用次数
+结果保存在内存中（只保留最近若干个），按剖析 ID 查询，
+调用栈输出为 collapsed 格式，可以直接交给 flamegraph.pl / speedscope。
+
+未开启剖析的请求只多一次线程局部变量读取（traced() 原样返回对象）。
+"""
+
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import Counter, OrderedDict
+
+_local = threading.local()
+
+
+class SamplingProfiler:
+    """对一个线程（以及临时加入的工作线程）做定时调用栈采样"""
+
+    def __init__(self, thread_id, interval=0.005, max_depth=64):
+        """
+        Args:
+            thread_id: 被采样线程的 ident
+            interval: 采样间隔（秒）
+            max_depth: 每个调用栈最多记录的层数
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        # 代替请求线程执行工作的其他线程：ident -> 线程名（调用栈以线程名为根）
+        self._extra_threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_thread(self, thread_id, name):
+        """开始同时采样另一个线程（例如执行本请求 pypag 工作的 actor 线程）"""
+        with self._lock:
+            self._extra_threads[thread_id] = name
+
+    def remove_thread(self, thread_id):
+        with self._lock:
+            self._extra_threads.pop(thread_id, None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='pag-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                targets = [(self.thread_id, None)] + list(self._extra_threads.items())
+            for thread_id, root in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._record(frame, root)
+
+    def _record(self, frame, root=None):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        if root is not None:
+            stack.append(root)
+        stack.reverse()
+        self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """collapsed 格式：每行 "根;...;叶 次数" """
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit=20):
+        """
+        按采样次数排序的函数
+
+        Returns:
+            list: [{'function', 'self', 'total'}, ...]
+        """
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                total_counts[name] += count
+        return [{'function': name, 'self': self_counts[name], 'total': total}
+                for name, total in total_counts.most_common(limit)]
+
+
+class CallCounter:
+    """统计 pypag 绑定方法调用次数"""
+
+    def __init__(self, module_names=('pypag', 'libpag')):
+        self.module_names = tuple(module_names)
+        self.counts = Counter()
+
+    def is_binding_object(self, value):
+        module = getattr(type(value), '__module__', '') or ''
+        return module.split('.')[0] in self.module_names
+
+    def wrap(self, obj):
+        if obj is None or isinstance(obj, _CountingProxy):
+            return obj
+        return _CountingProxy(obj, self)
+
+    def wrap_result(self, value):
+        if isinstance(value, (list, tuple)):
+            return type(value)(self.wrap(v) if self.is_binding_object(v) else v for v in value)
+        if isinstance(value, type) or self.is_binding_object(value):
+            return self.wrap(value)
+        return value
+
+    def activate(self):
+        """绑定到当前线程，之后 traced() 返回计数代理"""
+        _local.counter = self
+
+    def deactivate(self):
+        _local.counter = None
+
+
+def _unwrap(value):
+    return object.__getattribute__(value, '_target') if isinstance(value, _CountingProxy) else value
+
+
+class _CountingProxy:
+    """转发属性访问，调用绑定方法时计数；返回的绑定对象继续包装"""
+
+    __slots__ = ('_target', '_counter', '_owner')
+
+    def __init__(self, target, counter):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_counter', counter)
+        if isinstance(target, (type, types.ModuleType)):
+            owner = target.__name__
+        else:
+            owner = type(target).__name__
+        object.__setattr__(self, '_owner', owner)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if isinstance(value, type):
+            # 类（PAGImage、LayerType 等）：包装后其静态方法 / 枚举值同样计数
+            return self._counter.wrap(value)
+        if callable(value):
+            counter = self._counter
+            label = f'{self._owner}.{name}'
+
+            def call(*args, **kwargs):
+                counter.counts[label] += 1
+                result = value(*[_unwrap(a) for a in args],
+                               **{k: _unwrap(v) for k, v in kwargs.items()})
+                return counter.wrap_result(result)
+            return call
+        return self._counter.wrap_result(value)
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, _unwrap(value))
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __len__(self):
+        return len(self._target)
+
+    def __iter__(self):
+        return iter(self._counter.wrap_result(list(self._target)))
+
+    def __getitem__(self, key):
+        return self._counter.wrap_result(self._target[key])
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return repr(self._target)
+
+    def __str__(self):
+        return str(self._target)
+
+
+def current_counter():
+    """当前线程绑定的调用计数器，没有时返回 None"""
+    return getattr(_local, 'counter', None)
+
+
+def current_profile():
+    """当前线程正在进行的请求剖析，没有时返回 None"""
+    return getattr(_local, 'profile', None)
+
+
+def traced(obj):
+    """当前线程正在剖析时返回计数代理，否则原样返回"""
+    counter = getattr(_local, 'counter', None)
+    if counter is None:
+        return obj
+    return counter.wrap(obj)
+
+
+class RequestProfile:
+    """一次请求的剖析：采样 + 绑定调用计数"""
+
+    def __init__(self, interval=0.005):
+        self.profile_id = uuid.uuid4().hex[:16]
+        self.sampler = SamplingProfiler(threading.get_ident(), interval=interval)
+        self.calls = CallCounter()
+        self.started_at = time.time()
+        self._started = None
+        self.duration = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self.calls.activate()
+        _local.profile = self
+        self.sampler.start()
+
+    def stop(self):
+        if self.duration is not None:
+            return
+        self.sampler.stop()
+        self.calls.deactivate()
+        _local.profile = None
+        self.duration = time.perf_counter() - self._started
+
+    def attach_current_thread(self):
+        """
+        本请求的工作转到当前线程执行（actor 线程），执行期间采样并统计当前线程
+
+        Returns:
+            callable: 工作结束时调用，停止采样当前线程
+        """
+        thread = threading.current_thread()
+        self.sampler.add_thread(thread.ident, thread.name)
+        self.calls.activate()
+
+        def detach():
+            self.calls.deactivate()
+            self.sampler.remove_thread(thread.ident)
+        return detach
+
+    def to_dict(self, **extra):
+        info = {
+            'profileId': self.profile_id,
+            'startedAt': self.started_at,
+            'duration': round(self.duration or 0.0, 6),
+            'interval': self.sampler.interval,
+            'samples': self.sampler.samples,
+            'bindingCalls': dict(self.calls.counts.most_common()),
+            'bindingCallsTotal': sum(self.calls.counts.values()),
+            'topFunctions': self.sampler.top_functions(),
+        }
+        info.update(extra)
+        return info
+
+
+class ProfileStore:
+    """最近的剖析结果（内存中，按数量淘汰）"""
+
+    def __init__(self, max_entries=50):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, profile_id, summary, collapsed):
+        with self._lock:
+            self._entries[profile_id] = (summary, collapsed)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, profile_id):
+        """
+        Returns:
+            tuple: (摘要字典, collapsed 文本)，不存在时返回 None
+        """
+        with self._lock:
+            return self._entries.get(profile_id)
+
+    def list(self):
+        """最近的剖析摘要（不含调用栈），从新到旧"""
+        with self._lock:
+            summaries = [summary for summary, _ in self._entries.values()]
+        summaries.reverse()
+        return [{k: v for k, v in s.items() if k != 'topFunctions'} for s in summaries]
@@ -12,11 +12,15 @@ import os
 import json
 
 try:
-    import pypag
-    print("✅ pypag 导入成功")
-except ImportError as e:
-    print(f"❌ 导入 pypag 失败: {e}")
-    sys.exit(1)
+    from .pag_sdk import load_pag_module, import_error_message
+    from .pag_transforms import LayerTransformCache
+    from .pag_frame_io import FrameBufferPool, FrameEncoder, encode_image, pixels_view
+    from .pag_frame_sinks import FrameStreamWriter
+except ImportError:
+    from pag_sdk import load_pag_module, import_error_message
+    from pag_transforms import LayerTransformCache
+    from pag_frame_io import FrameBufferPool, FrameEncoder, encode_image, pixels_view
+    from pag_frame_sinks import FrameStreamWriter
 
 
 class PAGRuntimeRenderer:
@@ -31,17 +35,47 @@ class PAGRuntimeRenderer:
         """
         self.pag_file_path = pag_file_path
         self.pag = None
+        # pypag 在 load() 时才导入，导入本模块不依赖 SDK
+        self.pag_module = None
         self.modifications = []
         
+        # 离屏 Surface 和 Player 按合成 + 尺寸复用，尺寸变化时才重建
+        self._surface = None
+        self._player = None
+        self._surface_size = None
+        
+        # 单帧读取用的像素缓冲区（按 Surface 尺寸预分配，尺寸变化时重建）
+        self._frame_buffer = None
+        # readPixels 的调用方式：'into' 直接写入缓冲区，'bytes' 返回新字节再拷入（首次读取时探测）
+        self._read_mode = None
+        # 缓冲区中像素的排列（传给 Pillow 的 raw mode）
+        self.raw_mode = 'RGBA'
+        
+        # 是否应用过图片替换（多进程渲染时每个工作进程需要重新应用）
+        self._images_replaced = False
+        
+        # 图层对象缓存 + 变换脏检查，没有变化的帧不产生绑定调用
+        self._transforms = None
+        
     def load(self):
         """加载 PAG 文件"""
         if not os.path.exists(self.pag_file_path):
             raise FileNotFoundError(f"PAG 文件不存在: {self.pag_file_path}")
         
-        self.pag = pypag.PAGFile.Load(self.pag_file_path)
+        if self.pag_module is None:
+            self.pag_module = load_pag_module()
+            if self.pag_module is None:
+                raise RuntimeError(f"导入 pypag 失败: {import_error_message()}")
+        
+        self.pag = self.pag_module.PAGFile.Load(self.pag_file_path)
         if not self.pag:
             raise RuntimeError("加载 PAG 文件失败")
         
+        # 合成已更换，旧的 Player 和图层缓存不能再用
+        self.release()
+        self._transforms = LayerTransformCache(self.pag_module, self.pag)
+        self._images_replaced = False
+        
         print(f"✅ PAG 文件加载成功")
         print(f"   - 尺寸: {self.pag.width()} × {self.pag.height()}")
         print(f"   - 时长: {self.pag.duration() / 1000000:.2f} 秒")
@@ -100,7 +134,7 @@ class PAGRuntimeRenderer:
             
             try:
                 # 获取图层
-                layers = self.pag.getLayersByEditableIndex(layer_index, pypag.LayerType.Image)
+                layers = self.pag.getLayersByEditableIndex(layer_index, self.pag_module.LayerType.Image)
                 if not layers or len(layers) == 0:
                     print(f"⚠️  未找到图层索引 {layer_index}")
                     continue
@@ -108,7 +142,7 @@ class PAGRuntimeRenderer:
                 layer = layers[0]
                 
                 # 替换图片
-                pag_image = pypag.PAGImage.FromPath(image_path)
+                pag_image = self.pag_module.PAGImage.FromPath(image_path)
                 if pag_image:
                     layer.replaceImage(pag_image)
                     replaced_count += 1
@@ -119,64 +153,71 @@ class PAGRuntimeRenderer:
             except Exception as e:
                 print(f"❌ 替换图片失败 - 图层 {layer_index}: {e}")
         
+        self._images_replaced = True
+        
+        # 图层被修改过，下次应用变换时全部重新下发
+        if self._transforms is not None:
+            self._transforms.invalidate()
+        
         print(f"\n✅ 图片替换完成，成功 {replaced_count} 项")
         return replaced_count
     
-    def apply_transforms(self):
+    def apply_transforms(self, force=False):
         """
-        应用所有图层变换（运行时，需要每帧调用）
+        应用所有图层变换（运行时，需要在渲染每一帧之前调用）
+        
+        图层对象和上次下发的值会被缓存，只有变化的属性才会调用 set*，
+        变换没有变化的帧不产生任何绑定调用
         
-        这个方法需要在渲染每一帧之前调用
+        Args:
+            force: 为 True 时忽略缓存，全部重新下发
+        
+        Returns:
+            int: 处理的变换数量
         """
-        for mod in self.modifications:
-            if mod.get('type') != 'imageTransform':
-                continue
-            
-            layer_index = mod.get('layerIndex', mod.get('editableIndex', 0))
-            transform = mod.get('transform', {})
-            
-            try:
-                # 获取图层
-                layers = self.pag.getLayersByEditableIndex(layer_index, pypag.LayerType.Image)
-                if not layers or len(layers) == 0:
-                    continue
-                
-                layer = layers[0]
-                
-                # 应用位置
-                if 'position' in transform:
-                    pos = transform['position']
-                    layer.setPosition(pos.get('x', 0), pos.get('y', 0))
-                
-                # 应用锚点
-                if 'anchorPoint' in transform:
-                    anchor = transform['anchorPoint']
-                    layer.setAnchorPoint(anchor.get('x', 0), anchor.get('y', 0))
-                
-                # 应用缩放
-                if 'scale' in transform:
-                    scale = transform['scale']
-                    layer.setScale(scale.get('x', 1.0), scale.get('y', 1.0))
-                
-                # 应用旋转
-                if 'rotation' in transform:
-                    layer.setRotation(transform['rotation'])
-                
-                # 应用透明度
-                if 'opacity' in transform:
-                    alpha = int(transform['opacity'] * 255)
-                    layer.setAlpha(alpha)
-            
-            except Exception as e:
-                print(f"❌ 应用变换失败 - 图层 {layer_index}: {e}")
+        if self._transforms is None:
+            raise RuntimeError("PAG 文件未加载")
+        return self._transforms.apply(self.modifications, force=force)
     
-    def render_frame(self, progress, output_path=None):
+    def render_frame(self, progress, output_path=None, fmt=None):
         """
         渲染单帧
         
         Args:
             progress: 进度 (0.0 - 1.0)
             output_path: 输出文件路径（可选）
+            fmt: 图片格式 'png' / 'webp'（默认按扩展名）
+        
+        Returns:
+            bool: 是否成功
+        """
+        if not output_path:
+            return self._render(progress)
+        
+        buffer = self._ensure_frame_buffer()
+        if buffer is None or not self._render(progress, buffer):
+            return False
+        width, height = self._surface_size
+        encode_image(buffer, width, height, output_path, fmt or _format_for(output_path), self.raw_mode)
+        return True
+    
+    def read_frame(self, progress):
+        """
+        渲染单帧并返回像素
+        
+        Returns:
+            numpy.ndarray (高, 宽, 4) 像素视图（未安装 NumPy 时为 memoryview），失败时返回 None。
+            视图指向复用的缓冲区，下一次 read_frame / render_frame 会覆盖其内容，需要保留时请自行复制
+        """
+        buffer = self._ensure_frame_buffer()
+        if buffer is None or not self._render(progress, buffer):
+            return None
+        width, height = self._surface_size
+        return pixels_view(buffer, width, height)
+    
+    def _render(self, progress, buffer=None):
+        """
+        渲染一帧，buffer 不为 None 时把像素读入 buffer
         
         Returns:
             bool: 是否成功
@@ -184,52 +225,128 @@ class PAGRuntimeRenderer:
         if not self.pag:
             raise RuntimeError("PAG 文件未加载")
         
-        # 应用变换（关键！每帧都要应用）
+        # 应用变换（每帧调用，只下发有变化的属性）
         self.apply_transforms()
         
-        # 创建 Surface 进行渲染
-        surface = pypag.PAGSurface.MakeOffscreen(self.pag.width(), self.pag.height())
-        if not surface:
-            print("❌ 创建 Surface 失败")
+        # 获取（或按需重建）Surface 和 Player
+        player = self._ensure_player()
+        if not player:
             return False
         
-        # 创建 Player
-        player = pypag.PAGPlayer()
-        player.setSurface(surface)
-        player.setComposition(self.pag)
-        
         # 设置进度（通过 Player 设置，不是 PAGFile）
         player.setProgress(progress)
         
         # 刷新渲染
         player.flush()
         
-        # 如果指定了输出路径，保存图片
-        if output_path:
-            # 从 Surface 读取像素数据
-            pixels = surface.readPixels()
-            if pixels:
-                # 这里需要将像素数据保存为图片
-                # 实际使用时可能需要 PIL 或其他库
-                print(f"✅ 渲染完成: {output_path}")
-                # TODO: 保存像素数据为图片
-            else:
-                print("❌ 读取像素数据失败")
-                return False
+        if buffer is None:
+            return True
+        if not self._read_pixels_into(buffer):
+            print("❌ 读取像素数据失败")
+            return False
+        return True
+    
+    def _read_pixels_into(self, buffer):
+        """
+        从 Surface 读取像素到预分配的缓冲区
         
+        绑定支持 readPixels(colorType, alphaType, buffer, rowBytes) 时直接写入缓冲区，
+        否则退回 readPixels() 返回字节后拷入缓冲区
+        """
+        surface = self._surface
+        row_bytes = self._surface_size[0] * 4
+        
+        if self._read_mode is None:
+            module = self.pag_module
+            self._read_mode = 'bytes'
+            if hasattr(module, 'ColorType') and hasattr(module, 'AlphaType'):
+                try:
+                    ok = surface.readPixels(module.ColorType.RGBA_8888, module.AlphaType.Unpremultiplied,
+                                            buffer, row_bytes)
+                except (TypeError, AttributeError):
+                    ok = None
+                if ok is not None:
+                    self._read_mode = 'into'
+                    return bool(ok)
+        
+        if self._read_mode == 'into':
+            module = self.pag_module
+            return bool(surface.readPixels(module.ColorType.RGBA_8888, module.AlphaType.Unpremultiplied,
+                                           buffer, row_bytes))
+        
+        pixels = surface.readPixels()
+        if not pixels or len(pixels) < len(buffer):
+            return False
+        memoryview(buffer)[:] = memoryview(pixels)[:len(buffer)]
         return True
     
-    def render_video(self, output_dir, fps=None, prefix="frame"):
+    def _ensure_frame_buffer(self):
+        """单帧读取用的缓冲区（Surface 尺寸变化时重建）"""
+        if not self.pag:
+            raise RuntimeError("PAG 文件未加载")
+        if not self._ensure_player():
+            return None
+        width, height = self._surface_size
+        if self._frame_buffer is None or len(self._frame_buffer) != width * height * 4:
+            self._frame_buffer = bytearray(width * height * 4)
+        return self._frame_buffer
+    
+    def _ensure_player(self):
+        """
+        返回可复用的 Player，首次调用或合成尺寸变化时重建 Surface 和 Player
+        
+        Returns:
+            PAGPlayer，创建 Surface 失败时返回 None
+        """
+        size = (self.pag.width(), self.pag.height())
+        if self._player is not None and self._surface_size == size:
+            return self._player
+        
+        # 创建 Surface 进行渲染
+        surface = self.pag_module.PAGSurface.MakeOffscreen(size[0], size[1])
+        if not surface:
+            print("❌ 创建 Surface 失败")
+            return None
+        
+        # 创建 Player
+        player = self.pag_module.PAGPlayer()
+        player.setSurface(surface)
+        player.setComposition(self.pag)
+        
+        self._surface = surface
+        self._player = player
+        self._surface_size = size
+        return player
+    
+    def release(self):
+        """释放复用的 Surface、Player 和像素缓冲区（下次渲染时重建）"""
+        self._player = None
+        self._surface = None
+        self._surface_size = None
+        self._frame_buffer = None
+    
+    def render_video(self, output_dir, fps=None, prefix="frame", fmt="png",
+                     encode_workers=2, max_pending=None, processes=1):
         """
         渲染完整视频的所有帧
         
+        渲染线程把像素读入预分配的缓冲区后交给编码线程池，渲染下一帧和编码上一帧同时进行；
+        最多 max_pending 帧在等待编码，超过时渲染等待，内存占用与视频长度无关
+        
+        processes > 1 时按帧号切分为连续的区间，每个区间在单独的进程中渲染
+        （各自加载 PAG 文件、应用配置、创建 Player），各帧只取决于进度值，结果按帧号合并
+        
         Args:
             output_dir: 输出目录
             fps: 帧率（默认使用 PAG 文件的帧率）
             prefix: 文件名前缀
+            fmt: 图片格式 'png' / 'webp'
+            encode_workers: 编码线程数（多进程时为每个进程的线程数）
+            max_pending: 同时在编码中的帧数上限（默认 encode_workers × 2）
+            processes: 渲染进程数（1 表示在当前进程中渲染，0 表示 CPU 核数）
         
         Returns:
-            list: 生成的帧文件路径列表
+            list: 生成的帧文件路径列表（按帧号排序）
         """
         if not self.pag:
             raise RuntimeError("PAG 文件未加载")
@@ -237,43 +354,217 @@ class PAGRuntimeRenderer:
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
         
-        # 使用 PAG 文件的帧率
-        if fps is None:
-            fps = self.pag.frameRate()
-        
-        # 计算总帧数
-        duration_seconds = self.pag.duration() / 1000000.0  # 微秒转秒
-        total_frames = int(duration_seconds * fps)
+        fps, total_frames = self._timeline(fps)
+        if processes == 0:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, total_frames))
         
         print(f"\n🎬 开始渲染视频")
         print(f"   - 总帧数: {total_frames}")
         print(f"   - 帧率: {fps} fps")
         print(f"   - 输出目录: {output_dir}")
+        if processes > 1:
+            print(f"   - 渲染进程: {processes}")
+        
+        options = (output_dir, prefix, fmt, encode_workers, max_pending)
+        if processes > 1:
+            frame_paths = self._render_frames_sharded(total_frames, processes, options)
+        else:
+            frame_paths = self._render_frames(0, total_frames, total_frames, *options, show_progress=True)
         
+        print(f"\n✅ 渲染完成！共 {len(frame_paths)} 帧")
+        return frame_paths
+    
+    def _render_frames(self, start, end, total_frames, output_dir, prefix, fmt,
+                       encode_workers, max_pending, show_progress=False):
+        """
+        渲染 [start, end) 区间的帧并保存为图片
+        
+        Returns:
+            list: 成功的帧文件路径（按帧号排序）
+        """
+        if not self._ensure_player():
+            return []
+        width, height = self._surface_size
+        if max_pending is None:
+            max_pending = encode_workers * 2
+        pool = FrameBufferPool(width, height, max(max_pending, 1))
+        encoder = FrameEncoder(pool, workers=encode_workers, fmt=fmt, raw_mode=self.raw_mode)
         frame_paths = []
         
-        for frame_num in range(total_frames):
-            # 计算进度
-            progress = frame_num / max(total_frames - 1, 1)
-            
-            # 输出路径
-            output_path = os.path.join(output_dir, f"{prefix}_{frame_num:04d}.png")
-            
-            # 渲染帧
-            success = self.render_frame(progress, output_path)
+        def collect(results):
+            for frame_num, output_path, error in results:
+                if error is None:
+                    frame_paths.append((frame_num, output_path))
+                else:
+                    print(f"❌ 编码帧 {frame_num} 失败: {error}")
+        
+        try:
+            for frame_num in range(start, end):
+                # 计算进度
+                progress = _frame_progress(frame_num, total_frames)
+                
+                # 输出路径
+                output_path = os.path.join(output_dir, f"{prefix}_{frame_num:04d}.{fmt}")
+                
+                # 渲染帧（没有空闲缓冲区时等待编码线程归还）
+                buffer = pool.acquire()
+                if self._render(progress, buffer):
+                    encoder.submit(buffer, output_path, tag=frame_num)
+                else:
+                    pool.release(buffer)
+                    print(f"❌ 渲染帧 {frame_num} 失败")
+                # 边渲染边取走已编码的帧，编码失败及时报告
+                collect(encoder.collect())
+                
+                # 显示进度
+                if show_progress and ((frame_num + 1) % 10 == 0 or frame_num == total_frames - 1):
+                    percent = ((frame_num + 1) / total_frames) * 100
+                    print(f"   渲染进度: {frame_num + 1}/{total_frames} ({percent:.1f}%)")
             
-            if success:
-                frame_paths.append(output_path)
+            collect(encoder.results())
+        finally:
+            encoder.close()
+        return [output_path for _, output_path in sorted(frame_paths)]
+    
+    def _render_frames_sharded(self, total_frames, processes, options):
+        """按连续帧区间分给多个进程渲染，结果按区间顺序拼接"""
+        # 进程池相关模块导入较慢（multiprocessing），只在多进程模式下导入
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        
+        ranges = _frame_ranges(total_frames, processes)
+        state = (self.pag_file_path, self.modifications, self._images_replaced, self.raw_mode)
+        results = [None] * len(ranges)
+        # 使用 spawn：当前进程已加载 pypag 并持有渲染线程（编码线程池等），
+        # fork 出的子进程会继承绑定层 / GPU 上下文的状态和其他线程持有的锁
+        with ProcessPoolExecutor(max_workers=processes,
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_render_worker) as executor:
+            futures = {
+                executor.submit(_render_range_in_worker, state, start, end, total_frames, options): index
+                for index, (start, end) in enumerate(ranges)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                results[index] = future.result()
+                start, end = ranges[index]
+                print(f"   分片完成: {done}/{len(ranges)}（帧 {start}-{end - 1}）")
+        
+        return [path for paths in results for path in paths]
+    
+    def render_to_stream(self, sink, fps=None, max_pending=4):
+        """
+        渲染所有帧并直接交给 sink（编码器子进程、Y4M / 原始帧文件、内存回调），不生成中间图片
+        
+        写出在单独的线程中进行，渲染下一帧和写出上一帧同时进行；
+        最多 max_pending 帧在等待写出，超过时渲染等待
+        
+            renderer.render_to_stream(EncoderProcessSink('output.mp4'))
+        
+        Args:
+            sink: FrameSink（见 pag_frame_sinks）
+            fps: 帧率（默认使用 PAG 文件的帧率）
+            max_pending: 同时等待写出的帧数上限
+        
+        Returns:
+            sink.close() 的返回值（例如输出文件路径）
+        """
+        if not self.pag:
+            raise RuntimeError("PAG 文件未加载")
+        
+        fps, total_frames = self._timeline(fps)
+        if not self._ensure_player():
+            raise RuntimeError("创建 Surface 失败")
+        width, height = self._surface_size
+        
+        print(f"\n🎬 开始渲染视频流")
+        print(f"   - 总帧数: {total_frames}")
+        print(f"   - 帧率: {fps} fps")
+        print(f"   - 输出: {type(sink).__name__}")
+        
+        pool = FrameBufferPool(width, height, max(max_pending, 1))
+        sink.open(width, height, fps, self.raw_mode.lower())
+        writer = FrameStreamWriter(sink, pool)
+        try:
+            for frame_num in range(total_frames):
+                # 没有空闲缓冲区时等待写出线程归还
+                buffer = pool.acquire()
+                if not self._render(_frame_progress(frame_num, total_frames), buffer):
+                    pool.release(buffer)
+                    # 视频流不能跳帧
+                    raise RuntimeError(f"渲染帧 {frame_num} 失败")
+                writer.submit(frame_num, buffer)
                 
                 # 显示进度
                 if (frame_num + 1) % 10 == 0 or frame_num == total_frames - 1:
                     percent = ((frame_num + 1) / total_frames) * 100
                     print(f"   渲染进度: {frame_num + 1}/{total_frames} ({percent:.1f}%)")
-            else:
-                print(f"❌ 渲染帧 {frame_num} 失败")
-        
-        print(f"\n✅ 渲染完成！共 {len(frame_paths)} 帧")
-        return frame_paths
+            
+            writer.finish()
+        except BaseException:
+            writer.finish_quietly()
+            sink.abort()
+            raise
+        
+        result = sink.close()
+        print(f"\n✅ 渲染完成！共 {writer.frames} 帧")
+        return result
+    
+    def _timeline(self, fps=None):
+        """
+        Returns:
+            tuple: (帧率, 总帧数)，帧率默认使用 PAG 文件的帧率
+        """
+        if fps is None:
+            fps = self.pag.frameRate()
+        duration_seconds = self.pag.duration() / 1000000.0  # 微秒转秒
+        return fps, int(duration_seconds * fps)
+
+
+def _frame_ranges(total_frames, shards):
+    """把 [0, total_frames) 均分为 shards 个连续区间"""
+    base, extra = divmod(total_frames, shards)
+    ranges = []
+    start = 0
+    for i in range(shards):
+        end = start + base + (1 if i < extra else 0)
+        if end > start:
+            ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _init_render_worker():
+    """工作进程初始化：在子进程内导入 pypag（失败时由各分片的 load() 报错）"""
+    load_pag_module()
+
+
+def _render_range_in_worker(state, start, end, total_frames, options):
+    """
+    在工作进程中渲染一个帧区间（独立加载 PAG 文件和配置，pypag 对象不跨进程）
+    
+    Returns:
+        list: 成功的帧文件路径
+    """
+    pag_file_path, modifications, images_replaced, raw_mode = state
+    renderer = PAGRuntimeRenderer(pag_file_path)
+    renderer.raw_mode = raw_mode
+    renderer.load()
+    renderer.modifications = modifications
+    if images_replaced:
+        renderer.apply_image_replacements()
+    return renderer._render_frames(start, end, total_frames, *options)
+
+
+def _frame_progress(frame_num, total_frames):
+    """帧号对应的进度（首帧 0.0，末帧 1.0）"""
+    return frame_num / max(total_frames - 1, 1)
+
+
+def _format_for(path):
+    """按扩展名判断图片格式"""
+    return 'webp' if path.lower().endswith('.webp') else 'png'
 
 
 def main():
@@ -338,7 +629,7 @@ def main():
         
         print("\n✅ 渲染测试完成！")
         print("\n💡 提示:")
-        print("   - 变换在每帧渲染前都会重新应用")
+        print("   - 变换在每帧渲染前检查，只下发有变化的属性")
         print("   - 图片替换只需要应用一次")
         print("   - 要渲染完整视频，使用 renderer.render_video()")
         
@@ -0,0 +1,48 @@
+"""
+PAG SDK 加载 - 统一导入 pypag / libpag
+
+优先使用项目本地 pylib 目录下的 pypag（包含 Matrix.getTranslateX/Y 等新接口），
+其次是系统安装的 libpag。
+"""
+
+import sys
+from pathlib import Path
+
+# 项目本地的 pypag.pyd 所在目录
+PYLIB_PATH = str(Path(__file__).parent.parent / 'pylib')
+
+_pag_module = None
+_import_error = None
+
+
+def load_pag_module():
+    """
+    导入 PAG SDK
+
+    Returns:
+        module: pypag / libpag 模块，都未安装时返回 None
+    """
+    global _pag_module, _import_error
+
+    if _pag_module is not None or _import_error is not None:
+        return _pag_module
+
+    if PYLIB_PATH not in sys.path:
+        sys.path.insert(0, PYLIB_PATH)
+
+    try:
+        import pypag as module
+    except ImportError as e1:
+        try:
+            import libpag as module
+        except ImportError as e2:
+            _import_error = f"pypag: {e1}, libpag: {e2}"
+            return None
+
+    _pag_module = module
+    return _pag_module
+
+
+def import_error_message():
+    """导入失败时的错误信息"""
+    return _import_error or ""
@@ -0,0 +1,106 @@
+"""
+请求合并（single-flight） - 相同的工作同时只做一次
+
+活动上线时，成百上千个客户端在同一时刻用同一个模板请求 /api/analyze-layers
+和 /api/export-pag。结果缓存只能帮到后来的请求，同时到达的请求都会未命中，
+各自加载模板、各自导出。SingleFlight 按内容哈希合并正在进行的相同工作：
+第一个请求（leader）执行，其余请求（follower）等待并共享同一个结果。
+
+    result, shared = flight.do(key, lambda: expensive(key))
+
+    - leader 抛出的异常原样传给每一个 follower（与 concurrent.futures 相同），
+      包括等待 pypag 工作线程超时的 ActorTimeout
+    - follower 可以设置等待超时，超时后放弃等待（leader 继续执行，结果照常交给其他人）
+    - 工作完成后立即移除，不做结果缓存（缓存由 PAGOutputCache / PAGAnalysisStore 负责）
+"""
+
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """等待正在进行的相同工作超时"""
+
+
+class _Call:
+    """一次正在进行的工作"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发的相同工作"""
+
+    def __init__(self, name='default'):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        执行 fn()，同一 key 正在执行时等待并共享其结果
+
+        Args:
+            key: 工作的键（内容哈希等）
+            fn: 无参函数
+            timeout: follower 最长等待秒数（None 表示一直等待）
+
+        Returns:
+            tuple: (结果, 是否共享了其他请求的结果)
+
+        Raises:
+            fn() 抛出的异常（leader 和所有 follower 都会收到）
+            SingleFlightTimeout: follower 等待超时
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            return self._run(key, call, fn), False
+
+        if not call.done.wait(timeout):
+            raise SingleFlightTimeout(f'等待相同工作超时（{timeout}s）: {str(key)[:12]}')
+        with self._lock:
+            self.shared += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """正在进行的工作数"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """合并统计信息"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'shared': self.shared,
+            }
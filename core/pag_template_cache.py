@@ -0,0 +1,135 @@
+"""
+PAG 模板缓存 - 按内容哈希缓存已解析的 PAG 模板
+
+客户端会反复上传同一批模板，每次都写临时文件再 PAGFile.Load 非常浪费。
+这里以上传字节的 SHA-256 为键缓存解析结果，按总字节数做 LRU 淘汰，
+每次请求拿到的是模板的一份全新副本，修改互不影响。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from .pag_io import PAGBufferIO
+except ImportError:
+    from pag_io import PAGBufferIO
+
+
+def template_key(data):
+    """计算模板内容哈希（SHA-256 十六进制字符串）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class _CacheEntry:
+    """缓存条目：已解析的模板 + 原始字节（用于无 copyOriginal 时重新加载）"""
+
+    __slots__ = ('pag', 'data', 'lock')
+
+    def __init__(self, pag, data):
+        self.pag = pag
+        self.data = data
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        return len(self.data)
+
+
+class PAGTemplateCache:
+    """已解析 PAG 模板的 LRU 缓存（按总字节数限制容量）"""
+
+    def __init__(self, pag_module, max_bytes=512 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            pag_module: pypag / libpag 模块
+            max_bytes: 缓存模板的总字节数上限
+        """
+        self.pag_module = pag_module
+        self.io = PAGBufferIO(pag_module)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def checkout(self, data, key=None):
+        """
+        获取模板的全新副本
+
+        Args:
+            data: 模板文件字节
+            key: 已计算好的内容哈希（可选）
+
+        Returns:
+            tuple: (PAGFile 副本, 内容哈希)，加载失败时 PAGFile 为 None
+        """
+        if key is None:
+            key = template_key(data)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            pag = self.io.load(data)
+            if not pag:
+                return None, key
+            entry = _CacheEntry(pag, data)
+            if not self._insert(key, entry):
+                # 并发加载了同一模板，或单个模板超过容量：不缓存，直接使用
+                return pag, key
+
+        return self._copy(entry), key
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _insert(self, key, entry):
+        """
+        插入条目并按 LRU 淘汰超出容量的旧条目
+
+        Returns:
+            bool: 条目是否进入了缓存
+        """
+        with self._lock:
+            if key in self._entries or entry.size > self.max_bytes:
+                return False
+            self._entries[key] = entry
+            self._total_bytes += entry.size
+            while self._total_bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._total_bytes -= old.size
+                self.evictions += 1
+        return True
+
+    def _copy(self, entry):
+        """从缓存条目生成一份独立的模板副本"""
+        with entry.lock:
+            if hasattr(entry.pag, 'copyOriginal'):
+                return entry.pag.copyOriginal()
+            # 绑定不支持 copyOriginal 时退回到从字节重新加载
+            return self.io.load(entry.data)
@@ -0,0 +1,169 @@
+"""
+PAG 模板仓库 - 上传一次，之后按模板 ID 引用
+
+模板 ID 即文件内容的 SHA-256，同一模板重复上传只会存一份。
+文件按 ID 前两位分目录保存在磁盘上，超过容量时按最近访问时间淘汰。
+"""
+
+import os
+import re
+import tempfile
+import threading
+
+try:
+    from .pag_template_cache import template_key
+except ImportError:
+    from pag_template_cache import template_key
+
+
+_TEMPLATE_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_valid_template_id(template_id):
+    """检查模板 ID 是否为合法的 SHA-256 十六进制字符串"""
+    return bool(template_id) and bool(_TEMPLATE_ID_RE.match(template_id))
+
+
+class PAGTemplateStore:
+    """按内容寻址的磁盘模板仓库"""
+
+    def __init__(self, root_dir, max_bytes=2048 * 1024 * 1024):
+        """
+        初始化仓库
+
+        Args:
+            root_dir: 模板保存目录
+            max_bytes: 仓库总字节数上限，超过后淘汰最久未使用的模板
+        """
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def path_for(self, template_id):
+        """模板 ID 对应的文件路径"""
+        return os.path.join(self.root_dir, template_id[:2], f'{template_id}.pag')
+
+    def put(self, data):
+        """
+        保存模板
+
+        Args:
+            data: 模板文件字节
+
+        Returns:
+            tuple: (模板 ID, 是否为新保存的模板)
+        """
+        template_id = template_key(data)
+        path = self.path_for(template_id)
+
+        if os.path.exists(path):
+            self._touch(path)
+            return template_id, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子重命名，避免并发读到半个文件
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        self._prune(keep=path)
+        return template_id, True
+
+    def get(self, template_id):
+        """
+        读取模板
+
+        Returns:
+            bytes: 模板文件字节，不存在时返回 None
+        """
+        if not is_valid_template_id(template_id):
+            return None
+
+        path = self.path_for(template_id)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        self._touch(path)
+        return data
+
+    def info(self, template_id):
+        """模板元信息，不存在时返回 None"""
+        if not is_valid_template_id(template_id):
+            return None
+
+        path = self.path_for(template_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        return {'templateId': template_id, 'size': size}
+
+    def recent(self, limit):
+        """
+        最近使用的模板 ID（按访问时间从新到旧）
+
+        Args:
+            limit: 最多返回的数量
+        """
+        files = []
+        for dirpath, _, filenames in os.walk(self.root_dir):
+            for name in filenames:
+                template_id = name[:-4]
+                if not name.endswith('.pag') or not is_valid_template_id(template_id):
+                    continue
+                try:
+                    files.append((os.path.getmtime(os.path.join(dirpath, name)), template_id))
+                except OSError:
+                    continue
+        files.sort(reverse=True)
+        return [template_id for _, template_id in files[:limit]]
+
+    @staticmethod
+    def _touch(path):
+        """更新访问时间，用于 LRU 淘汰"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _prune(self, keep=None):
+        """总容量超限时删除最久未使用的模板"""
+        with self._lock:
+            files = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root_dir):
+                for name in filenames:
+                    if not name.endswith('.pag'):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
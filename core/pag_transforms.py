@@ -0,0 +1,130 @@
+"""
+图层变换应用 - 缓存图层对象，只下发有变化的变换
+
+渲染每一帧前都要保证图层变换（位置、锚点、缩放、旋转、透明度）已生效，
+原先每帧都要 getLayersByEditableIndex 再把所有 set* 调一遍。
+这里缓存 可编辑索引 → 图层对象，并记录每个图层上次下发的值，
+没有变化的帧不会产生任何绑定调用。
+"""
+
+try:
+    from .pag_logging import get_logger
+except ImportError:
+    from pag_logging import get_logger
+
+log = get_logger('transforms')
+
+
+def desired_transform(transform, skip_defaults=False):
+    """
+    把配置中的 transform 转换为要下发的属性值
+
+    Args:
+        transform: 配置中的 transform 字典
+        skip_defaults: 为 True 时忽略空的 position/anchorPoint/scale、旋转 0 和不透明度 1
+
+    Returns:
+        dict: 属性名 -> 参数元组（属性名即图层的 setter 名）
+    """
+    values = {}
+
+    position = transform.get('position')
+    if position is not None and (position or not skip_defaults):
+        values['setPosition'] = (position.get('x', 0), position.get('y', 0))
+
+    anchor = transform.get('anchorPoint')
+    if anchor is not None and (anchor or not skip_defaults):
+        values['setAnchorPoint'] = (anchor.get('x', 0), anchor.get('y', 0))
+
+    scale = transform.get('scale')
+    if scale is not None and (scale or not skip_defaults):
+        values['setScale'] = (scale.get('x', 1.0), scale.get('y', 1.0))
+
+    if 'rotation' in transform and not (skip_defaults and transform['rotation'] == 0):
+        values['setRotation'] = (transform['rotation'],)
+
+    if 'opacity' in transform and not (skip_defaults and transform['opacity'] == 1):
+        values['setAlpha'] = (int(transform['opacity'] * 255),)
+
+    return values
+
+
+class LayerTransformCache:
+    """单个 PAG 合成的图层对象缓存 + 变换脏检查"""
+
+    def __init__(self, pag_module, pag):
+        """
+        Args:
+            pag_module: pypag / libpag 模块
+            pag: PAG 文件对象
+        """
+        self.pag_module = pag_module
+        self.pag = pag
+        self._layers = {}
+        self._applied = {}
+
+    def layer(self, editable_index):
+        """
+        按可编辑索引获取图片图层（结果缓存，包括找不到的情况）
+
+        Returns:
+            图层对象，找不到时返回 None
+        """
+        if editable_index not in self._layers:
+            layer = None
+            layer_type = getattr(self.pag_module, 'LayerType', None)
+            if layer_type is not None and hasattr(layer_type, 'Image'):
+                layers = self.pag.getLayersByEditableIndex(editable_index, layer_type.Image)
+                if layers and len(layers) > 0:
+                    layer = layers[0]
+            self._layers[editable_index] = layer
+        return self._layers[editable_index]
+
+    def apply(self, modifications, skip_defaults=False, force=False):
+        """
+        应用 imageTransform 修改，只下发与上次不同的属性
+
+        Args:
+            modifications: 修改配置列表
+            skip_defaults: 同 desired_transform
+            force: 为 True 时忽略脏检查，全部重新下发
+
+        Returns:
+            int: 找到图层并处理的变换数量
+        """
+        applied_count = 0
+
+        for mod in modifications:
+            if mod.get('type') != 'imageTransform':
+                continue
+
+            layer_index = mod.get('layerIndex', mod.get('editableIndex', 0))
+
+            try:
+                layer = self.layer(layer_index)
+            except Exception:
+                log.exception("获取图层失败 - 图层 %s", layer_index)
+                continue
+            if layer is None:
+                continue
+
+            values = desired_transform(mod.get('transform', {}), skip_defaults)
+            applied = self._applied.setdefault(layer_index, {})
+
+            for setter, args in values.items():
+                if not force and applied.get(setter) == args:
+                    continue
+                try:
+                    getattr(layer, setter)(*args)
+                    applied[setter] = args
+                except Exception as e:
+                    log.warning("%s 失败 - 图层 %s: %s", setter, layer_index, e)
+
+            applied_count += 1
+
+        return applied_count
+
+    def invalidate(self):
+        """清空图层缓存和已下发记录（合成被替换或图层被外部修改后调用）"""
+        self._layers.clear()
+        self._applied.clear()
@@ -0,0 +1,161 @@
+"""
+PAG 二进制传输格式 - /api/export-pag-simple 的紧凑请求体
+
+JSON 版本把模板和图片都 base64 后塞进 JSON，体积多出 1/3，服务器还要同时持有
+JSON 文本、解码后的字节和重新编码的输出字符串。二进制格式按帧依次传输：
+
+    头部:  b'PAGW' + 版本号（1 字节）
+    帧:    类型（1 字节）+ 名称长度（uint16，大端）+ 数据长度（uint32，大端）
+           + 名称（UTF-8）+ 数据
+
+帧类型：
+    T  模板 PAG 文件字节（必须且只能有一个，名称可作为文件名）
+    M  修改配置 JSON（UTF-8，与 JSON 版本的 modifications 相同，可省略）
+    I  图片字节，名称为图片名；image 修改项的 value 填写该名称
+
+服务器从请求流中逐帧读取，每帧数据直接读成独立的 bytes，不会先把整个请求体
+读入内存再切分。响应是原始 application/octet-stream，不再 base64。
+
+客户端示例（requests 支持生成器作为请求体，图片数据不会被复制拼接）：
+
+    body = iter_request(template_bytes, [{'type': 'image', 'layerIndex': 0, 'value': 'logo'}],
+                        images={'logo': png_bytes})
+    resp = requests.post(url, data=body, headers={'Content-Type': CONTENT_TYPE})
+"""
+
+import json
+import struct
+
+CONTENT_TYPE = 'application/x-pag-wire'
+
+MAGIC = b'PAGW'
+VERSION = 1
+
+FRAME_TEMPLATE = b'T'
+FRAME_MODIFICATIONS = b'M'
+FRAME_IMAGE = b'I'
+
+_FRAME_HEADER = struct.Struct('>cHI')
+MAX_PAYLOAD = 0xFFFFFFFF
+
+
+class WireFormatError(ValueError):
+    """请求体不符合二进制传输格式"""
+
+
+def _frame(kind, name, payload):
+    name_bytes = name.encode('utf-8')
+    if len(name_bytes) > 0xFFFF:
+        raise WireFormatError(f'帧名称过长: {name[:32]}...')
+    if len(payload) > MAX_PAYLOAD:
+        raise WireFormatError(f'帧数据过大: {name}')
+    return _FRAME_HEADER.pack(kind, len(name_bytes), len(payload)) + name_bytes
+
+
+def iter_request(template, modifications=None, images=None, template_name=''):
+    """
+    编码请求体（逐块产出，图片等大块数据原样产出，不做拼接复制）
+
+    Args:
+        template: 模板 PAG 文件字节
+        modifications: 修改配置列表（可选）
+        images: 图片名 -> 图片字节（可选）
+        template_name: 模板文件名（可选）
+
+    Yields:
+        bytes: 请求体数据块
+    """
+    yield MAGIC + bytes([VERSION])
+    yield _frame(FRAME_TEMPLATE, template_name, template)
+    yield template
+    if modifications:
+        payload = json.dumps(modifications, ensure_ascii=False).encode('utf-8')
+        yield _frame(FRAME_MODIFICATIONS, '', payload)
+        yield payload
+    for name, data in (images or {}).items():
+        yield _frame(FRAME_IMAGE, name, data)
+        yield data
+
+
+def encode_request(template, modifications=None, images=None, template_name=''):
+    """编码为完整的请求体字节"""
+    return b''.join(iter_request(template, modifications, images, template_name))
+
+
+def _read_exact(stream, size):
+    """读取恰好 size 个字节；流提前结束时返回已读到的部分"""
+    data = stream.read(size)
+    if len(data) == size or not data:
+        return data
+    chunks = [data]
+    remaining = size - len(data)
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_request(stream):
+    """
+    从流中解析请求体
+
+    Args:
+        stream: 有 read(n) 方法的对象（Flask 的 request.stream）
+
+    Returns:
+        tuple: (模板字节, 模板文件名, 修改配置列表, 图片名 -> 图片字节)
+
+    Raises:
+        WireFormatError: 格式错误、帧被截断或缺少模板
+    """
+    header = _read_exact(stream, len(MAGIC) + 1)
+    if header[:len(MAGIC)] != MAGIC:
+        raise WireFormatError('不是 PAG 二进制请求（缺少 PAGW 头）')
+    if header[len(MAGIC)] != VERSION:
+        raise WireFormatError(f'不支持的格式版本: {header[len(MAGIC)]}')
+
+    template = None
+    template_name = ''
+    modifications = []
+    images = {}
+
+    while True:
+        frame_header = _read_exact(stream, _FRAME_HEADER.size)
+        if not frame_header:
+            break
+        if len(frame_header) != _FRAME_HEADER.size:
+            raise WireFormatError('帧头被截断')
+        kind, name_length, payload_length = _FRAME_HEADER.unpack(frame_header)
+
+        name_bytes = _read_exact(stream, name_length)
+        payload = _read_exact(stream, payload_length)
+        if len(name_bytes) != name_length or len(payload) != payload_length:
+            raise WireFormatError('帧数据被截断')
+        try:
+            name = name_bytes.decode('utf-8')
+        except UnicodeDecodeError:
+            raise WireFormatError('帧名称不是有效的 UTF-8')
+
+        if kind == FRAME_TEMPLATE:
+            if template is not None:
+                raise WireFormatError('只能包含一个模板帧')
+            template = payload
+            template_name = name
+        elif kind == FRAME_MODIFICATIONS:
+            try:
+                modifications = json.loads(payload)
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise WireFormatError('modifications 必须是有效的 JSON')
+            if not isinstance(modifications, list):
+                raise WireFormatError('modifications 必须是列表')
+        elif kind == FRAME_IMAGE:
+            images[name] = payload
+        else:
+            raise WireFormatError(f'未知的帧类型: {kind!r}')
+
+    if template is None:
+        raise WireFormatError('缺少模板帧')
+    return template, template_name, modifications, images
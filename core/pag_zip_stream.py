@@ -0,0 +1,51 @@
+"""
+流式 ZIP 输出 - 边生成边发送，不在内存或磁盘上拼完整个压缩包
+
+zipfile 写入不可 seek 的对象时会改用数据描述符（data descriptor）记录大小，
+所以只要给它一个只有 write() 的缓冲区，每写完一个文件就把缓冲区里的字节
+交给 HTTP 响应即可。内存占用只和单个条目大小有关，与条目数量无关。
+
+PAG 文件本身已经压缩过，默认使用 ZIP_STORED，不再浪费 CPU 压缩。
+"""
+
+import zipfile
+
+
+class _ChunkBuffer:
+    """只支持追加写入的缓冲区，取出后清空"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
+def iter_zip(entries, compression=zipfile.ZIP_STORED):
+    """
+    把 (文件名, 字节) 序列流式打包为 ZIP
+
+    Args:
+        entries: 可迭代对象，逐个产出 (压缩包内文件名, 文件字节)
+        compression: 压缩方式（默认不压缩）
+
+    Yields:
+        bytes: ZIP 数据块
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=compression, allowZip64=True) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+            yield from buffer.drain()
+    # 关闭时写入中央目录
+    yield from buffer.drain()
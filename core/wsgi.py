@@ -0,0 +1,13 @@
+"""
+WSGI 入口 - 供 gunicorn 等生产服务器加载
+
+使用方法（在 core 目录下）：
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+try:
+    from .pag_export_server import app
+except ImportError:
+    from pag_export_server import app
+
+__all__ = ['app']
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# 测试按包导入 core（core.pag_xxx），不依赖 pypag / Flask
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+FAKEPAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakepag')
+
+
+@pytest.fixture
+def fake_pag(monkeypatch):
+    """用 tests/fakepag/pypag.py 代替 pypag（spawn 启动的工作进程通过 sys.path 同样导入它）"""
+    monkeypatch.syspath_prepend(FAKEPAG_DIR)
+    import pypag
+    from core import pag_sdk
+    monkeypatch.setattr(pag_sdk, '_pag_module', pypag)
+    monkeypatch.setattr(pag_sdk, '_import_error', None)
+    return pypag
@@ -0,0 +1,270 @@
+"""
+测试用的 pypag 替身
+
+模板格式：b'PAG' + JSON {"texts": [...], "images": 图片层数}
+图片格式：b'IMG' + JSON {"w": 宽, "h": 高}
+保存结果：b'PAG' + JSON {"texts": [...], "images": {可编辑索引: 图片描述}}
+"""
+
+import io
+import json
+import os
+
+LOAD_COUNT = 0
+
+# 文本替换为该值后保存，工作进程会直接退出（模拟绑定层崩溃）
+CRASH_TEXT = '__crash__'
+
+
+def make_template(texts=('标题',), images=1, matrix=None):
+    """matrix: 图片图层占位图的 [a, b, c, d, tx, ty]（可选）"""
+    spec = {'texts': list(texts), 'images': images}
+    if matrix is not None:
+        spec['matrix'] = list(matrix)
+    return b'PAG' + json.dumps(spec).encode('utf-8')
+
+
+def make_image(width=100, height=100):
+    return b'IMG' + json.dumps({'w': width, 'h': height}).encode('utf-8')
+
+
+def parse_output(data):
+    assert data.startswith(b'PAG')
+    return json.loads(data[3:].decode('utf-8'))
+
+
+class LayerType:
+    Image = 5
+    Text = 3
+
+
+class PAGScaleMode:
+    LetterBox = 2
+
+
+class Matrix:
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=1.0, tx=0.0, ty=0.0):
+        self.a, self.b, self.c, self.d, self.tx, self.ty = a, b, c, d, tx, ty
+
+    def preScale(self, sx, sy):
+        self.a, self.b = self.a * sx, self.b * sx
+        self.c, self.d = self.c * sy, self.d * sy
+
+    def __repr__(self):
+        return f'Matrix({self.a}, {self.b}, {self.c}, {self.d}, {self.tx}, {self.ty})'
+
+
+class TextDocument:
+    def __init__(self, text):
+        self.text = text
+
+
+class Bounds:
+    def __init__(self, width, height):
+        self._width, self._height = width, height
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+
+class PAGImageLayer:
+    def __init__(self, index, bounds=(100, 100), matrix=None):
+        self.index = index
+        self._bounds = bounds
+        self._matrix = matrix
+
+    def getOriginalImageBounds(self):
+        return Bounds(*self._bounds)
+
+    def getOriginalScaleFactor(self):
+        return 1.0
+
+    def getOriginalImageMatrix(self):
+        return self._matrix
+
+
+class PAGFile:
+    def __init__(self, spec):
+        self.spec = spec
+        self.texts = list(spec.get('texts', []))
+        self.images = {}
+        # 测试可以替换图层（例如设置占位图矩阵）
+        matrix = spec.get('matrix')
+        self.layers = {i: PAGImageLayer(i, matrix=Matrix(*matrix) if matrix else None)
+                       for i in range(spec.get('images', 0))}
+
+    @staticmethod
+    def Load(path):
+        if not isinstance(path, str) or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        return PAGFile.LoadFromBytes(data)
+
+    @staticmethod
+    def LoadFromBytes(data):
+        global LOAD_COUNT
+        data = bytes(data)
+        if not data.startswith(b'PAG'):
+            return None
+        LOAD_COUNT += 1
+        try:
+            return PAGFile(json.loads(data[3:].decode('utf-8')))
+        except ValueError:
+            return None
+
+    def copyOriginal(self):
+        return PAGFile(self.spec)
+
+    def width(self):
+        return 64
+
+    def height(self):
+        return 32
+
+    def duration(self):
+        return 1000000
+
+    def frameRate(self):
+        return 30
+
+    def numTexts(self):
+        return len(self.texts)
+
+    def numImages(self):
+        return len(self.layers)
+
+    def getTextData(self, index):
+        if index is None or not 0 <= index < len(self.texts):
+            return None
+        return TextDocument(self.texts[index])
+
+    def replaceText(self, index, text_data):
+        self.texts[index] = text_data.text
+
+    def getLayersByEditableIndex(self, index, layer_type):
+        layer = self.layers.get(index)
+        return [layer] if layer is not None else []
+
+    def replaceImage(self, index, image):
+        if index not in self.layers:
+            return False
+        self.images[str(index)] = image.describe()
+        return True
+
+    def saveToBytes(self):
+        return b'PAG' + json.dumps({'texts': self.texts, 'images': self.images},
+                                   ensure_ascii=False).encode('utf-8')
+
+    def save(self, path):
+        if CRASH_TEXT in self.texts:
+            os._exit(1)
+        with open(path, 'wb') as f:
+            f.write(self.saveToBytes())
+        return True
+
+
+class PAGImage:
+    def __init__(self, width, height):
+        self._width, self._height = width, height
+        self._matrix = None
+        self._scale_mode = None
+
+    @staticmethod
+    def FromBytes(data):
+        data = bytes(data)
+        if not data.startswith(b'IMG'):
+            # 真实图片（例如经过 Pillow 缩小的 PNG）按实际尺寸创建
+            try:
+                from PIL import Image
+                return PAGImage(*Image.open(io.BytesIO(data)).size)
+            except Exception:
+                return None
+        size = json.loads(data[3:].decode('utf-8'))
+        return PAGImage(size['w'], size['h'])
+
+    @staticmethod
+    def FromPath(path):
+        with open(path, 'rb') as f:
+            return PAGImage.FromBytes(f.read())
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def matrix(self):
+        return self._matrix
+
+    def setMatrix(self, matrix):
+        self._matrix = matrix
+
+    def scaleMode(self):
+        return self._scale_mode
+
+    def setScaleMode(self, mode):
+        self._scale_mode = mode
+
+    def describe(self):
+        info = {'w': self._width, 'h': self._height}
+        if self._matrix is not None:
+            info['matrix'] = [self._matrix.a, self._matrix.b, self._matrix.c,
+                              self._matrix.d, self._matrix.tx, self._matrix.ty]
+        return info
+
+
+class PAGSurface:
+    """离屏 Surface：像素为 RGBA，每个字节都是 round(进度 × 100)（便于检查帧序）"""
+
+    def __init__(self, width, height):
+        self._width, self._height = width, height
+        self.pixels = bytes(width * height * 4)
+        # 每次 readPixels 的调用方式：'into' 或 'bytes'
+        self.reads = []
+
+    @staticmethod
+    def MakeOffscreen(width, height):
+        return PAGSurface(width, height)
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def readPixels(self, *args):
+        # 模块没有 ColorType / AlphaType 时只支持返回字节的旧接口
+        if not args:
+            self.reads.append('bytes')
+            return self.pixels
+        color_type, alpha_type, buffer, row_bytes = args
+        if row_bytes != self._width * 4 or len(buffer) < len(self.pixels):
+            return False
+        self.reads.append('into')
+        memoryview(buffer)[:len(self.pixels)] = self.pixels
+        return True
+
+
+class PAGPlayer:
+    def __init__(self):
+        self._surface = None
+        self._composition = None
+        self._progress = 0.0
+
+    def setSurface(self, surface):
+        self._surface = surface
+
+    def setComposition(self, composition):
+        self._composition = composition
+
+    def setProgress(self, progress):
+        self._progress = progress
+
+    def flush(self):
+        value = round(self._progress * 100) % 256
+        self._surface.pixels = bytes([value]) * len(self._surface.pixels)
+        return True
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from core.pag_actors import ActorTimeout, PAGActorPool
+from core.pag_profiler import RequestProfile, traced
+
+
+def _busy_actor_work(pipeline):
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        pass
+    pag = traced(pipeline.pag_module).PAGFile.LoadFromBytes(pipeline.pag_module.make_template())
+    return threading.current_thread().name, pag.numTexts()
+
+
+def test_profile_samples_actor_thread(fake_pag):
+    pool = PAGActorPool(fake_pag, threads=2)
+    profile = RequestProfile(interval=0.002)
+    profile.start()
+    try:
+        thread_name, texts = pool.call('00000001', _busy_actor_work)
+    finally:
+        profile.stop()
+        pool.shutdown()
+
+    assert thread_name.startswith('pag-actor-') and texts == 1
+    actor_stacks = [stack for stack in profile.sampler.stacks if stack.startswith(thread_name + ';')]
+    assert any('_busy_actor_work' in stack for stack in actor_stacks)
+    assert profile.calls.counts['PAGFile.LoadFromBytes'] == 1
+
+
+def test_same_key_routes_to_same_actor(fake_pag):
+    pool = PAGActorPool(fake_pag, threads=3)
+    try:
+        names = {pool.call('abcdef12', lambda p: threading.current_thread().name) for _ in range(5)}
+        assert len(names) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_call_timeout_cancels_queued_work(fake_pag):
+    pool = PAGActorPool(fake_pag, threads=1)
+    release = threading.Event()
+    ran = []
+    try:
+        blocking = pool.submit('k', lambda pipeline: release.wait(5))
+        with pytest.raises(ActorTimeout):
+            pool.call('k', lambda pipeline: ran.append(1), timeout=0.05)
+        release.set()
+        blocking.result(5)
+        # 超时时还在排队的任务被取消，不会在之后执行
+        assert pool.call('k', lambda pipeline: 'next', timeout=5) == 'next'
+    finally:
+        release.set()
+        pool.shutdown()
+    assert ran == []
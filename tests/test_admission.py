@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from core.pag_admission import AdmissionController, AdmissionRejected
+
+
+def test_queue_full_is_rejected_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    controller.acquire()
+    controller.release(held_seconds=3.0)
+    controller.acquire()
+
+    with pytest.raises(AdmissionRejected) as info:
+        controller.acquire()
+    # 服务器把 AdmissionRejected 转换为 503，retry_after 写入 Retry-After
+    assert info.value.reason == 'queue_full'
+    assert info.value.retry_after == 3
+    assert controller.stats()['rejected'] == 1
+
+
+def test_queue_timeout_is_rejected():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+    controller.acquire()
+
+    with pytest.raises(AdmissionRejected) as info:
+        controller.acquire()
+    assert info.value.reason == 'timeout'
+    assert info.value.retry_after >= 1
+    assert controller.stats()['queued'] == 0
+
+
+def test_queued_request_admitted_after_release():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+    controller.acquire()
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(controller.acquire()))
+    thread.start()
+    while controller.stats()['queued'] == 0:
+        thread.join(0.01)
+    controller.release()
+    thread.join(5)
+
+    assert len(waited) == 1 and waited[0] > 0
+    assert controller.stats()['active'] == 1
+
+
+def test_disabled_controller_never_rejects():
+    controller = AdmissionController(max_concurrent=0, max_queue=0)
+    for _ in range(10):
+        assert controller.acquire() == 0.0
+    assert controller.stats()['admitted'] == 0
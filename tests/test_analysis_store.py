@@ -0,0 +1,58 @@
+import os
+
+from core.pag_analysis_store import PAGAnalysisStore
+
+
+def result(size=100):
+    return {'layers': ['x' * size]}
+
+
+def test_put_and_get_round_trip(tmp_path):
+    store = PAGAnalysisStore(str(tmp_path))
+    store.put('abc', result())
+
+    # 新实例从磁盘读取（模拟服务重启）
+    reopened = PAGAnalysisStore(str(tmp_path))
+    assert reopened.get('abc') == result()
+    assert reopened.get('missing') is None
+    assert reopened.stats()['hits'] == 1
+    assert reopened.stats()['misses'] == 1
+
+
+def test_prunes_least_recently_used_files(tmp_path):
+    store = PAGAnalysisStore(str(tmp_path), max_bytes=350)
+    for index, name in enumerate(('old', 'used', 'mid')):
+        store.put(name, result())
+        path = store._path_for(name)
+        os.utime(path, (1000 + index, 1000 + index))
+
+    # 读取刷新访问时间，'old' 成为最久未使用的结果
+    reader = PAGAnalysisStore(str(tmp_path), max_memory_entries=0)
+    assert reader.get('used') == result()
+    store.put('new', result())
+
+    remaining = sorted(os.listdir(str(tmp_path)))
+    assert remaining == sorted(os.path.basename(store._path_for(name)) for name in ('used', 'mid', 'new'))
+    stats = store.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= 350
+
+
+def test_prune_removes_files_from_old_versions(tmp_path):
+    stale = tmp_path / 'deadbeef-v0.json'
+    stale.write_text('{"layers": []}' + ' ' * 500)
+    os.utime(str(stale), (1000, 1000))
+
+    store = PAGAnalysisStore(str(tmp_path), max_bytes=300)
+    store.put('abc', result())
+
+    assert not stale.exists()
+    assert os.path.exists(store._path_for('abc'))
+
+
+def test_newest_result_is_kept_even_if_over_limit(tmp_path):
+    store = PAGAnalysisStore(str(tmp_path), max_bytes=10)
+    store.put('big', result(500))
+
+    assert os.path.exists(store._path_for('big'))
+    assert store.get('big') == result(500)
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from core.pag_batch_editor import BatchCheckpointJournal, PAGTemplateBatchEditor
+
+
+def _configs(values):
+    return [{'name': f'item{i}', 'modifications': [{'type': 'text', 'layerIndex': 0, 'value': value}]}
+            for i, value in enumerate(values)]
+
+
+@pytest.fixture
+def editor(fake_pag, tmp_path):
+    template_path = tmp_path / 'card.pag'
+    template_path.write_bytes(fake_pag.make_template(texts=['标题'], images=0))
+    return PAGTemplateBatchEditor(str(template_path))
+
+
+def test_worker_crash_fails_in_flight_items_only(fake_pag, editor, tmp_path):
+    values = [str(i) for i in range(12)]
+    values[5] = fake_pag.CRASH_TEXT
+    output_dir = str(tmp_path / 'out')
+
+    results = editor.iter_batch(_configs(values), output_dir, workers=2,
+                                chunksize=2, max_in_flight=1, checkpoint=False)
+
+    by_index = {r.index: r for r in results}
+    assert sorted(by_index) == list(range(12))
+    # 崩溃的批次（4、5）失败，进程池重建后其余批次照常完成
+    assert not by_index[5].success and '工作进程' in by_index[5].error
+    assert not by_index[4].success
+    for index in (0, 1, 2, 3, 6, 7, 8, 9, 10, 11):
+        assert by_index[index].success, by_index[index].error
+        assert os.path.exists(by_index[index].output_path)
+
+
+def test_config_list_alias_warns(fake_pag, editor, tmp_path):
+    with pytest.warns(DeprecationWarning):
+        summary = editor.generate_batch(config_list=_configs(['a', 'b']),
+                                        output_dir=str(tmp_path / 'out'), checkpoint=False)
+    assert (summary.total, summary.succeeded) == (2, 2)
+
+    with pytest.raises(TypeError), pytest.warns(DeprecationWarning):
+        editor.generate_batch(_configs(['a']), str(tmp_path / 'out'), config_list=_configs(['b']))
+
+
+def test_resume_skips_completed_rows(fake_pag, editor, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    configs = _configs(['a', 'b', 'c'])
+    assert editor.generate_batch(configs, output_dir).succeeded == 3
+
+    os.remove(os.path.join(output_dir, 'card_item1.pag'))
+    results = list(editor.iter_batch(configs, output_dir, resume=True))
+    # 只有输出文件丢失的那一行重新生成
+    assert [r.index for r in results] == [1]
+
+
+def test_resume_false_truncates_journal(fake_pag, editor, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    editor.generate_batch(_configs(['a', 'b']), output_dir)
+    editor.generate_batch(_configs(['x']), output_dir)
+
+    with open(editor.journal_path(output_dir), encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 1
+
+
+def test_resume_after_partial_last_line(fake_pag, editor, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    configs = _configs(['a', 'b', 'c'])
+    editor.generate_batch(configs[:1], output_dir)
+    journal_path = editor.journal_path(output_dir)
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "1:item1", "ind')  # 崩溃时写了一半的行
+
+    editor.generate_batch(configs, output_dir, resume=True)
+    completed = BatchCheckpointJournal(journal_path).load()
+    # 续写的第一条记录没有和半行粘在一起
+    assert sorted(completed) == ['0:item0', '1:item1', '2:item2']
+
+
+def test_duplicate_names_are_distinct_rows(fake_pag, editor, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    configs = [{'name': 'same', 'modifications': []} for _ in range(2)]
+    editor.generate_batch(configs[:1], output_dir)
+
+    results = list(editor.iter_batch(configs, output_dir, resume=True))
+    assert [r.index for r in results] == [1]
+
+
+def test_malformed_config_fails_only_its_row(fake_pag, editor, tmp_path):
+    configs = _configs(['a']) + ['not a dict', None] + _configs(['b'])
+
+    results = list(editor.iter_batch(configs, str(tmp_path / 'out'), checkpoint=False))
+
+    assert [r.success for r in results] == [True, False, False, True]
+    assert '字典' in results[1].error
+    assert results[2].name == 'output_2'
+
+
+def test_failed_save_keeps_previous_output(fake_pag, editor, tmp_path, monkeypatch):
+    output_dir = str(tmp_path / 'out')
+    first, = editor.iter_batch(_configs(['v1']), output_dir, checkpoint=False)
+    with open(first.output_path, 'rb') as f:
+        previous = f.read()
+
+    monkeypatch.setattr(fake_pag.PAGFile, 'save', lambda self, path: False)
+    second, = editor.iter_batch(_configs(['v2']), output_dir, checkpoint=False)
+
+    assert not second.success and '保存失败' in second.error
+    with open(first.output_path, 'rb') as f:
+        assert f.read() == previous
+    # 临时文件已清理
+    assert os.listdir(output_dir) == [os.path.basename(first.output_path)]
+
+
+def test_generate_batch_returns_counts_and_failures_only(fake_pag, editor, tmp_path):
+    values = ['a', 'b', 'c', 'd']
+    configs = _configs(values) + ['bad'] * 3
+
+    summary = editor.generate_batch(configs, str(tmp_path / 'out'), checkpoint=False, max_failures=2)
+
+    assert (summary.total, summary.succeeded, summary.failed) == (7, 4, 3)
+    # 成功项不保留，失败项最多保留 max_failures 个
+    assert [r.index for r in summary.failures] == [4, 5]
+    assert all(not r.success for r in summary.failures)
+    assert summary.elapsed >= 0
@@ -0,0 +1,153 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from core.pag_export_jobs import ExportJob, ExportJobManager, _run_export_job
+from core.pag_export_pipeline import ExportError
+from core.pag_template_store import PAGTemplateStore
+
+
+def _wait_finished(manager, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job is not None and job.finished:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'任务 {job_id} 未完成')
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PAGTemplateStore(str(tmp_path / 'templates'))
+
+
+def test_job_visible_from_another_manager(fake_pag, store, tmp_path):
+    template_id, _ = store.put(fake_pag.make_template(texts=['旧标题']))
+    result_dir = str(tmp_path / 'results')
+    # 两个管理器共享结果目录，相当于 gunicorn 的两个工作进程
+    submitter = ExportJobManager(store, result_dir, workers=1)
+    other = ExportJobManager(store, result_dir, workers=1)
+    try:
+        job = submitter.submit(template_id, [{'type': 'text', 'layerIndex': 0, 'value': '新标题'}])
+        assert other.get(job.job_id).status in ('queued', 'running', 'done')
+
+        finished = _wait_finished(other, job.job_id)
+        assert finished.status == 'done', finished.error
+        with open(finished.output_path, 'rb') as f:
+            assert fake_pag.parse_output(f.read())['texts'] == ['新标题']
+        assert other.state_counts()['done'] == 1
+
+        assert other.cancel(job.job_id)
+        assert submitter.get(job.job_id) is None
+        assert not os.path.exists(finished.output_path)
+    finally:
+        submitter.shutdown(wait=True)
+        other.shutdown(wait=True)
+
+
+def test_job_of_exited_process_reported_failed(store, tmp_path):
+    result_dir = str(tmp_path / 'results')
+    manager = ExportJobManager(store, result_dir, workers=1)
+
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    job_id = 'ab' * 16
+    with open(os.path.join(result_dir, f'{job_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump({'job_id': job_id, 'template_id': 't', 'filename': 't.pag', 'state': 'running',
+                   'owner_pid': exited.pid, 'created_at': time.time()}, f)
+
+    job = manager.get(job_id)
+    assert job.status == 'failed'
+    assert job.error_status == 503
+
+
+def test_invalid_job_id_is_not_a_path(store, tmp_path):
+    manager = ExportJobManager(store, str(tmp_path / 'results'))
+    assert manager.get('../../etc/passwd') is None
+    assert not manager.cancel('../x')
+
+
+@pytest.mark.parametrize('variants', [[1], [['x']], [{'modifications': 'x'}], [[], None]])
+def test_malformed_variants_rejected_before_export(store, tmp_path, variants):
+    template_id, _ = store.put(b'PAG{}')
+    manager = ExportJobManager(store, str(tmp_path / 'results'))
+    # 调用时立即报错（不是在迭代时），服务器在发出响应头之前返回 400
+    with pytest.raises(ExportError) as info:
+        manager.iter_variants(template_id, variants)
+    assert info.value.status == 400
+    assert manager._executor is None
+
+
+def test_missing_template_rejected_before_export(store, tmp_path):
+    manager = ExportJobManager(store, str(tmp_path / 'results'))
+    with pytest.raises(ExportError) as info:
+        manager.iter_variants('0' * 64, [[]])
+    assert info.value.status == 404
+
+
+def test_iter_variants_exports_each_variant(fake_pag, store, tmp_path):
+    template_id, _ = store.put(fake_pag.make_template(texts=['旧']))
+    manager = ExportJobManager(store, str(tmp_path / 'results'), workers=1)
+    try:
+        results = sorted(manager.iter_variants(template_id, [
+            [{'type': 'text', 'layerIndex': 0, 'value': 'a'}],
+            {'name': 'b', 'modifications': [{'type': 'text', 'layerIndex': 0, 'value': 'b'}]},
+        ]))
+    finally:
+        manager.shutdown(wait=True)
+
+    assert [fake_pag.parse_output(data)['texts'] for _, data, _ in results] == [['a'], ['b']]
+    assert [error for _, _, error in results] == [None, None]
+
+
+def test_cancel_between_read_and_running_write(store, tmp_path):
+    manager = ExportJobManager(store, str(tmp_path / 'results'))
+    job = ExportJob('cd' * 16, 't', 't.pag', manager._output_path('cd' * 16))
+    manager._save(job)
+    record_path = manager._record_path(job.job_id)
+    # cancel() 已写下取消标记，工作进程随后把记录写回为 running
+    open(record_path[:-5] + '.cancelled', 'w').close()
+
+    with pytest.raises(ExportError) as info:
+        _run_export_job('missing.pag', 't', [], {}, job.output_path, record_path)
+    assert info.value.status == 410
+    assert manager.get(job.job_id) is None
+
+
+def test_cancelled_job_result_is_not_saved(store, tmp_path):
+    manager = ExportJobManager(store, str(tmp_path / 'results'))
+    job = ExportJob('ef' * 16, 't', 't.pag', manager._output_path('ef' * 16))
+    manager._save(job)
+    assert manager.cancel(job.job_id)
+
+    # 取消后工作进程才完成：结果不会让任务重新出现
+    future = Future()
+    future.set_result((3, {}))
+    with open(job.output_path, 'wb') as f:
+        f.write(b'PAG')
+    manager._save(job)  # 模拟取消之后写回的 running 记录
+    manager._on_done(job, future)
+    assert manager.get(job.job_id) is None
+    assert not os.path.exists(job.output_path)
+
+
+def test_state_counts_cached_between_scrapes(store, tmp_path, monkeypatch):
+    manager = ExportJobManager(store, str(tmp_path / 'results'))
+    assert manager.state_counts()['queued'] == 0
+
+    manager._save(ExportJob('ab' * 16, 't', 't.pag', manager._output_path('ab' * 16)))
+    listed = []
+    monkeypatch.setattr(manager, '_list_names', lambda: listed.append(1) or os.listdir(manager.result_dir))
+    # 缓存期内不再扫描结果目录
+    assert manager.state_counts()['queued'] == 0
+    assert listed == []
+
+    manager._state_counts_at -= 60
+    assert manager.state_counts()['queued'] == 1
+    assert listed == [1]
@@ -0,0 +1,92 @@
+import io
+
+import pytest
+
+from core.pag_export_pipeline import PAGExportPipeline
+from core.pag_image_resize import ImageFitPolicy
+
+
+def test_export_reports_failed_modifications(fake_pag):
+    pipeline = PAGExportPipeline(fake_pag)
+    failures = []
+    data = pipeline.export(
+        fake_pag.make_template(texts=['a']),
+        [
+            {'type': 'text', 'layerIndex': 0, 'value': 'b'},
+            {'type': 'image', 'layerIndex': 0, 'value': 'image_0'},
+        ],
+        images={'image_0': b'not an image'},
+        failures=failures,
+    )
+
+    # 失败的修改项不影响其余修改和保存
+    assert fake_pag.parse_output(data)['texts'] == ['b']
+    assert [index for index, _ in failures] == [0]
+
+
+def test_export_without_failures(fake_pag):
+    pipeline = PAGExportPipeline(fake_pag)
+    failures = []
+    data = pipeline.export(
+        fake_pag.make_template(),
+        [{'type': 'image', 'layerIndex': 0, 'value': 'image_0'}],
+        images={'image_0': fake_pag.make_image(40, 30)},
+        failures=failures,
+    )
+    assert failures == []
+    assert fake_pag.parse_output(data)['images']['0']['w'] == 40
+
+
+def _png(width, height):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(out, 'PNG')
+    return out.getvalue()
+
+
+def test_downscaled_image_keeps_layer_geometry(fake_pag):
+    pytest.importorskip('PIL')
+    pipeline = PAGExportPipeline(fake_pag, image_fit=ImageFitPolicy())
+    data = pipeline.export(
+        fake_pag.make_template(images=1, matrix=[0.5, 0, 0, 0.5, 10, 20]),
+        [{'type': 'image', 'layerIndex': 0, 'value': 'image_0'}],
+        images={'image_0': _png(400, 400)},
+    )
+
+    # 占位图 100×100：图片缩小到 1/4，matrix 放大 4 倍，图层中显示的大小不变
+    image = fake_pag.parse_output(data)['images']['0']
+    assert (image['w'], image['h']) == (100, 100)
+    assert image['matrix'] == [2.0, 0, 0, 2.0, 10, 20]
+
+
+def test_no_downscale_when_matrix_cannot_be_scaled(fake_pag, monkeypatch):
+    pytest.importorskip('PIL')
+    monkeypatch.delattr(fake_pag.Matrix, 'preScale')
+    pipeline = PAGExportPipeline(fake_pag, image_fit=ImageFitPolicy())
+    data = pipeline.export(
+        fake_pag.make_template(images=1, matrix=[0.5, 0, 0, 0.5, 10, 20]),
+        [{'type': 'image', 'layerIndex': 0, 'value': 'image_0'}],
+        images={'image_0': _png(400, 400)},
+    )
+
+    image = fake_pag.parse_output(data)['images']['0']
+    assert (image['w'], image['h']) == (400, 400)
+    assert image['matrix'] == [0.5, 0, 0, 0.5, 10, 20]
+
+
+def test_cached_image_reuses_fit_scale(fake_pag, monkeypatch):
+    PIL = pytest.importorskip('PIL.Image')
+    pipeline = PAGExportPipeline(fake_pag, image_fit=ImageFitPolicy())
+    template = fake_pag.make_template(images=1, matrix=[0.5, 0, 0, 0.5, 10, 20])
+    mods = [{'type': 'image', 'layerIndex': 0, 'value': 'image_0'}]
+    images = {'image_0': _png(400, 400)}
+    pipeline.export(template, mods, images=images)
+
+    # 图片缓存命中时不再用 Pillow 打开原图，缩小倍数随缓存条目一起保存
+    opened = []
+    original_open = PIL.open
+    monkeypatch.setattr(PIL, 'open', lambda *args, **kwargs: opened.append(1) or original_open(*args, **kwargs))
+    data = pipeline.export(template, mods, images=images)
+
+    assert opened == []
+    assert fake_pag.parse_output(data)['images']['0']['matrix'] == [2.0, 0, 0, 2.0, 10, 20]
@@ -0,0 +1,104 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('PIL')
+
+from core.pag_frame_io import FrameBufferPool, FrameEncoder
+
+
+def test_pool_reuses_released_buffers():
+    pool = FrameBufferPool(4, 2, 2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert len(first) == 4 * 2 * 4
+    assert first is not second
+
+    pool.release(first)
+    # 归还的缓冲区被再次取出，不重新分配
+    assert pool.acquire() is first
+
+
+def test_pool_blocks_until_a_buffer_is_released():
+    pool = FrameBufferPool(4, 2, 1)
+    buffer = pool.acquire()
+    acquired = threading.Event()
+
+    def worker():
+        pool.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    # 唯一的缓冲区还在使用中，渲染线程等待
+    assert not acquired.wait(0.2)
+
+    pool.release(buffer)
+    assert acquired.wait(5)
+    thread.join(5)
+
+
+def test_encoder_writes_frames_and_returns_buffers(tmp_path):
+    pool = FrameBufferPool(4, 2, 2)
+    encoder = FrameEncoder(pool, workers=2)
+    try:
+        for frame in range(6):
+            # 缓冲区数量小于帧数：编码完成后缓冲区必须归还，否则这里会一直等待
+            buffer = pool.acquire()
+            buffer[:] = bytes([frame]) * len(buffer)
+            encoder.submit(buffer, str(tmp_path / f'{frame}.png'), tag=frame)
+        results = encoder.results()
+    finally:
+        encoder.close()
+
+    assert sorted(tag for tag, _, _ in results) == list(range(6))
+    assert all(error is None for _, _, error in results)
+    from PIL import Image
+    with Image.open(tmp_path / '3.png') as image:
+        assert image.size == (4, 2)
+        assert image.getpixel((0, 0)) == (3, 3, 3, 3)
+    assert pool._free.qsize() == 2
+
+
+def test_encoder_reports_errors_per_frame(tmp_path):
+    pool = FrameBufferPool(4, 2, 2)
+    encoder = FrameEncoder(pool, workers=1)
+    try:
+        encoder.submit(pool.acquire(), str(tmp_path / 'ok.png'), tag='ok')
+        encoder.submit(pool.acquire(), str(tmp_path / 'missing' / 'bad.png'), tag='bad')
+        results = {tag: (path, error) for tag, path, error in encoder.results()}
+    finally:
+        encoder.close()
+
+    assert results['ok'][1] is None
+    assert os.path.exists(results['ok'][0])
+    assert isinstance(results['bad'][1], OSError)
+    # 编码失败的缓冲区同样归还
+    assert pool._free.qsize() == 2
+
+
+def test_encoder_collect_hands_over_finished_results_once(tmp_path):
+    pool = FrameBufferPool(4, 2, 1)
+    encoder = FrameEncoder(pool, workers=1)
+    collected = []
+    try:
+        for frame in range(5):
+            # 只有一个缓冲区：取到它说明上一帧已经编码完成
+            buffer = pool.acquire()
+            collected.extend(encoder.collect())
+            encoder.submit(buffer, str(tmp_path / f'{frame}.png'), tag=frame)
+        collected.extend(encoder.results())
+        assert encoder.collect() == []
+        assert encoder.results() == []
+    finally:
+        encoder.close()
+
+    assert sorted(tag for tag, _, _ in collected) == list(range(5))
+    # 已取走的结果不再留在编码器中
+    assert encoder._finished == []
+
+
+def test_encoder_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        FrameEncoder(FrameBufferPool(4, 2, 1), fmt='gif')
@@ -0,0 +1,165 @@
+import sys
+import threading
+
+import pytest
+
+from core.pag_frame_io import FrameBufferPool
+from core.pag_frame_sinks import (
+    EncoderProcessSink, FrameSink, FrameStreamWriter, RawFrameSink, Y4MFrameSink, _fps_fraction,
+)
+
+# 把 stdin 原样复制到 argv[1] 的"编码器"
+COPY_STDIN = 'import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], "wb"))'
+# 输出一行错误后立即退出的"编码器"
+FAIL_FAST = 'import sys; sys.stderr.write("unsupported codec\\n"); sys.exit(3)'
+
+
+@pytest.mark.parametrize('fps, expected', [
+    (30, (30, 1)),
+    (25.0, (25, 1)),
+    (29.97, (30000, 1001)),
+    (59.94, (60000, 1001)),
+    (23.976, (24000, 1001)),
+    (12.5, (1250, 100)),
+    (1 / 3, (333, 1000)),
+])
+def test_fps_fraction(fps, expected):
+    assert _fps_fraction(fps) == expected
+
+
+def test_raw_sink_writes_frames_back_to_back(tmp_path):
+    path = tmp_path / 'frames.rgba'
+    sink = RawFrameSink(str(path))
+    sink.open(2, 1, 30)
+    sink.write(0, bytes(range(8)))
+    sink.write(1, bytes(range(8, 16)))
+    assert sink.close() == str(path)
+
+    assert path.read_bytes() == bytes(range(16))
+
+
+def test_y4m_header_and_frames(tmp_path):
+    pytest.importorskip('PIL')
+    path = tmp_path / 'out.y4m'
+    sink = Y4MFrameSink(str(path))
+    sink.open(2, 2, 29.97)
+    # 白色 / 黑色各一帧
+    sink.write(0, b'\xff' * 16)
+    sink.write(1, b'\x00\x00\x00\xff' * 4)
+    sink.close()
+
+    data = path.read_bytes()
+    header, rest = data.split(b'\n', 1)
+    assert header == b'YUV4MPEG2 W2 H2 F30000:1001 Ip A1:1 C444 XCOLORRANGE=FULL'
+    frame_size = len(b'FRAME\n') + 2 * 2 * 3
+    assert len(rest) == 2 * frame_size
+    first, second = rest[:frame_size], rest[frame_size:]
+    assert first.startswith(b'FRAME\n') and second.startswith(b'FRAME\n')
+    # 全范围 BT.601：白色 Y=255、黑色 Y=0，色度都在 128
+    assert first[6:] == b'\xff' * 4 + b'\x80' * 8
+    assert second[6:] == b'\x00' * 4 + b'\x80' * 8
+
+
+def test_y4m_bgra_input(tmp_path):
+    pytest.importorskip('PIL')
+    rgba, bgra = tmp_path / 'rgba.y4m', tmp_path / 'bgra.y4m'
+    for path, pixel_format, pixel in ((rgba, 'rgba', b'\xff\x00\x00\xff'), (bgra, 'bgra', b'\x00\x00\xff\xff')):
+        sink = Y4MFrameSink(str(path))
+        sink.open(1, 1, 30, pixel_format)
+        sink.write(0, pixel)
+        sink.close()
+    # 同一个红色像素，按各自的排列解释后结果相同
+    assert rgba.read_bytes() == bgra.read_bytes()
+
+
+class FailingSink(FrameSink):
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.written = []
+
+    def write(self, frame_index, buffer):
+        if frame_index == self.fail_at:
+            raise IOError('disk full')
+        self.written.append(frame_index)
+
+
+def test_stream_writer_propagates_sink_errors():
+    pool = FrameBufferPool(1, 1, 2)
+    sink = FailingSink(fail_at=1)
+    writer = FrameStreamWriter(sink, pool)
+
+    with pytest.raises(IOError, match='disk full'):
+        for frame in range(100):
+            writer.submit(frame, pool.acquire())
+    with pytest.raises(IOError, match='disk full'):
+        writer.finish()
+
+    # 出错后的帧不再写出，缓冲区全部归还
+    assert sink.written == [0]
+    assert writer.frames == 1
+    assert pool._free.qsize() == 2
+
+
+def test_stream_writer_finish_returns_frame_count():
+    pool = FrameBufferPool(1, 1, 1)
+    sink = FailingSink(fail_at=None)
+    writer = FrameStreamWriter(sink, pool)
+    for frame in range(5):
+        writer.submit(frame, pool.acquire())
+
+    assert writer.finish() == 5
+    assert sink.written == list(range(5))
+
+
+def test_encoder_process_sink_pipes_frames(tmp_path):
+    path = tmp_path / 'encoded.raw'
+    seen = []
+
+    def command(width, height, fps, pixel_format):
+        seen.append((width, height, fps, pixel_format))
+        return [sys.executable, '-c', COPY_STDIN, str(path)]
+
+    sink = EncoderProcessSink(str(path), command=command)
+    sink.open(2, 1, 24, 'bgra')
+    sink.write(0, b'a' * 8)
+    sink.write(1, b'b' * 8)
+
+    assert sink.close() == str(path)
+    assert seen == [(2, 1, 24, 'bgra')]
+    assert path.read_bytes() == b'a' * 8 + b'b' * 8
+
+
+def test_encoder_process_sink_reports_early_exit():
+    sink = EncoderProcessSink(command=[sys.executable, '-c', FAIL_FAST])
+    sink.open(512, 512, 30)
+    frame = bytes(512 * 512 * 4)
+
+    # 管道缓冲区写满后 write() 发现编码器已退出；报错包含返回码和完整的 stderr
+    with pytest.raises(RuntimeError) as excinfo:
+        for index in range(1000):
+            sink.write(index, frame)
+        sink.close()
+    assert '返回码 3' in str(excinfo.value)
+    assert 'unsupported codec' in str(excinfo.value)
+    sink.abort()
+
+
+def test_encoder_process_sink_missing_executable():
+    sink = EncoderProcessSink(command=['definitely-not-an-encoder-binary'])
+    with pytest.raises(RuntimeError, match='找不到编码器'):
+        sink.open(2, 2, 30)
+
+
+def test_encoder_process_sink_abort_kills_process():
+    sink = EncoderProcessSink(command=[sys.executable, '-c', 'import time; time.sleep(60)'])
+    sink.open(2, 2, 30)
+    process = sink._process
+    done = threading.Event()
+
+    def abort():
+        sink.abort()
+        done.set()
+
+    threading.Thread(target=abort, daemon=True).start()
+    assert done.wait(10)
+    assert process.returncode is not None
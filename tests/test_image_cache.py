@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from core.pag_image_cache import PAGImageCache
+from core.pag_image_resize import ImageFit
+
+
+def test_bytes_keyed_by_content_and_variant(fake_pag):
+    cache = PAGImageCache(fake_pag)
+    data = fake_pag.make_image(10, 10)
+
+    image = cache.from_bytes(data)
+    assert cache.from_bytes(bytes(data)) is image
+    # 不同用法（模板 + 图层）各自持有一份，setMatrix 不会互相覆盖
+    assert cache.from_bytes(data, variant=('t', 0)) is not image
+    assert cache.from_bytes(fake_pag.make_image(10, 11)) is not image
+    assert cache.stats()['hits'] == 1
+
+
+def test_path_key_changes_with_file(fake_pag, tmp_path):
+    cache = PAGImageCache(fake_pag)
+    path = tmp_path / 'logo.img'
+    path.write_bytes(fake_pag.make_image(10, 10))
+
+    image = cache.from_path(str(path))
+    assert cache.from_path(str(path)) is image
+
+    path.write_bytes(fake_pag.make_image(20, 20))
+    os.utime(path, ns=(1, 1))
+    replaced = cache.from_path(str(path))
+    assert replaced is not image and replaced.width() == 20
+
+
+def test_lru_by_decoded_size(fake_pag):
+    # 按 宽 × 高 × 4 估算，容量只够前两张
+    images = [fake_pag.make_image(10, 10 + i) for i in range(3)]
+    cache = PAGImageCache(fake_pag, max_bytes=10 * 10 * 4 + 10 * 11 * 4)
+
+    first = cache.from_bytes(images[0])
+    cache.from_bytes(images[1])
+    cache.from_bytes(images[2])
+
+    assert cache.stats()['evictions'] >= 1
+    assert cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.from_bytes(images[0]) is not first
+
+
+def test_decode_failure_is_not_cached(fake_pag):
+    cache = PAGImageCache(fake_pag)
+    assert cache.from_bytes(b'broken') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_fit_scale_cached_with_image(fake_pag):
+    pytest.importorskip('PIL')
+    import io
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (300, 150)).save(out, 'PNG')
+    cache = PAGImageCache(fake_pag)
+    fit = ImageFit(100, 50, None, 90)
+
+    image, scale = cache.from_bytes_fitted(out.getvalue(), fit=fit)
+    assert (image.width(), image.height()) == (100, 50)
+    assert scale == (3.0, 3.0)
+    assert cache.from_bytes_fitted(out.getvalue(), fit=fit) == (image, scale)
+    assert cache.from_bytes_fitted(b'broken') == (None, (1.0, 1.0))
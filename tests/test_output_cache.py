@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from core.pag_output_cache import PAGOutputCache, output_key
+
+
+def _image_mod(value):
+    return [{'type': 'image', 'layerIndex': 0, 'value': value}]
+
+
+def test_key_uses_image_content_not_field_name():
+    a = output_key('export', 't' * 64, _image_mod('image_0'), {'image_0': b'same'})
+    b = output_key('export', 't' * 64, _image_mod('image_0'), {'image_0': b'other'})
+    c = output_key('export', 't' * 64, _image_mod('photo'), {'photo': b'same'})
+    assert a != b
+    assert a == c
+
+
+def test_key_changes_when_path_image_is_replaced(tmp_path):
+    path = tmp_path / 'logo.png'
+    path.write_bytes(b'first')
+    before = output_key('export', 't' * 64, _image_mod(str(path)))
+    assert before == output_key('export', 't' * 64, _image_mod(str(path)))
+
+    path.write_bytes(b'second version')
+    os.utime(path, ns=(1, 1))
+    assert output_key('export', 't' * 64, _image_mod(str(path))) != before
+
+
+def test_put_is_atomic_and_readable(tmp_path, monkeypatch):
+    cache = PAGOutputCache(str(tmp_path))
+    key = 'ab' + '0' * 62
+    cache.put(key, b'result')
+    assert cache.get(key) == b'result'
+    # 只留下最终文件，没有残留的临时文件
+    assert os.listdir(os.path.dirname(cache.path_for(key))) == [f'{key}.pag']
+
+    failing = 'cd' + '0' * 62
+
+    def fail(src, dst):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        cache.put(failing, b'partial')
+    assert cache.get(failing) is None
+    assert os.listdir(os.path.dirname(cache.path_for(failing))) == []
+
+
+def test_prune_removes_least_recently_used(tmp_path):
+    cache = PAGOutputCache(str(tmp_path), max_bytes=25)
+    keys = [f'{i:02d}' + '0' * 62 for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, b'x' * 10)
+        os.utime(cache.path_for(key), (1000 + i, 1000 + i))
+
+    cache.get(keys[0])  # 读取会刷新 mtime，keys[1] 变为最久未使用
+    cache.put(keys[2], b'y' * 10)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == b'x' * 10
+    assert cache.get(keys[2]) == b'y' * 10
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 20
+
+
+def test_oversized_result_is_not_stored(tmp_path):
+    cache = PAGOutputCache(str(tmp_path), max_bytes=4)
+    cache.put('ef' + '0' * 62, b'too large')
+    assert cache.get('ef' + '0' * 62) is None
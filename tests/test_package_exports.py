@@ -0,0 +1,52 @@
+import ast
+import os
+import subprocess
+import sys
+import warnings
+
+import core
+
+CORE_DIR = os.path.dirname(os.path.abspath(core.__file__))
+
+
+def _top_level_names(module_name):
+    """子模块顶层定义的名称（只解析源码，不导入 Flask / pypag）"""
+    with open(os.path.join(CORE_DIR, f'{module_name}.py'), encoding='utf-8') as f:
+        source = f.read()
+    with warnings.catch_warnings():
+        # 部分脚本的字符串里有无效转义（例如生成的正则），与导出名称无关
+        warnings.simplefilter('ignore', DeprecationWarning)
+        tree = ast.parse(source)
+    names = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Assign):
+            names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    # 再导出的名称可能在 try / except ImportError 中导入
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+    return names
+
+
+def test_every_lazy_name_exists_in_its_module():
+    missing = [(name, module) for name, module in core._LAZY_ATTRS.items()
+               if name not in _top_level_names(module)]
+    assert missing == []
+
+
+def test_names_from_the_old_star_imports_are_still_exported():
+    # 以前 core/__init__.py 通过 from .xxx import * 导出的公开名称
+    for name in ('app', 'main', 'PAG_AVAILABLE', 'PAG_MODULE', 'IMPORT_ERROR_MSG',
+                 'apply_transforms_to_layers', 'export_pag', 'analyze_layers',
+                 'PAGRuntimeRenderer', 'PAGTemplateBatchEditor', 'PAGBatchConfigGenerator',
+                 'generate_nodejs_script'):
+        assert name in core.__all__
+
+
+def test_import_core_is_lazy():
+    code = ('import sys, core; assert "core.pag_export_server" not in sys.modules; '
+            'core.generate_nodejs_script; assert "core.pag_batch_editor" in sys.modules; '
+            'assert "core.pag_export_server" not in sys.modules')
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(CORE_DIR), check=True)
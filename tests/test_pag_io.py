@@ -0,0 +1,56 @@
+import os
+import types
+
+from core.pag_io import PAGBufferIO
+
+
+class _PathOnlyPAGFile:
+    """只接受文件路径的绑定：传入字节时当作路径，找不到文件返回 None（不抛异常）"""
+
+    loads = []
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def Load(cls, path):
+        cls.loads.append(path)
+        if not isinstance(path, str) or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+
+class _BufferPAGFile:
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def Load(cls, data):
+        if isinstance(data, str):
+            with open(data, 'rb') as f:
+                data = f.read()
+        return cls(data) if data.startswith(b'PAG') else None
+
+
+def test_path_only_load_falls_back_to_temp_file():
+    _PathOnlyPAGFile.loads = []
+    io = PAGBufferIO(types.SimpleNamespace(PAGFile=_PathOnlyPAGFile))
+
+    pag = io.load(b'PAG-template')
+    assert pag is not None and pag.data == b'PAG-template'
+    assert io.capabilities()['load_from_bytes'] is False
+
+    # 之后直接走临时文件，不再把字节当作路径
+    _PathOnlyPAGFile.loads = []
+    assert io.load(b'PAG-second').data == b'PAG-second'
+    assert all(isinstance(path, str) for path in _PathOnlyPAGFile.loads)
+
+
+def test_buffer_load_keeps_none_for_invalid_data():
+    io = PAGBufferIO(types.SimpleNamespace(PAGFile=_BufferPAGFile))
+
+    assert io.load(b'PAG-ok').data == b'PAG-ok'
+    assert io.capabilities()['load_from_bytes'] is True
+    assert io.load(b'garbage') is None
+    assert io.capabilities()['load_from_bytes'] is True
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from core.pag_runtime_renderer import _frame_ranges
+
+
+@pytest.mark.parametrize('total, shards', [(10, 3), (9, 3), (1, 4), (0, 2), (100, 1), (7, 7)])
+def test_frame_ranges_cover_all_frames_once(total, shards):
+    ranges = _frame_ranges(total, shards)
+
+    frames = [frame for start, end in ranges for frame in range(start, end)]
+    assert frames == list(range(total))
+    assert len(ranges) <= shards
+    assert all(end > start for start, end in ranges)
+    # 各分片帧数最多相差 1
+    sizes = [end - start for start, end in ranges]
+    assert not sizes or max(sizes) - min(sizes) <= 1
+
+
+def test_frame_ranges_boundaries():
+    assert _frame_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert _frame_ranges(2, 4) == [(0, 1), (1, 2)]
+
+
+@pytest.fixture
+def renderer(fake_pag, tmp_path):
+    from core.pag_runtime_renderer import PAGRuntimeRenderer
+
+    path = tmp_path / 'template.pag'
+    path.write_bytes(fake_pag.make_template())
+    return PAGRuntimeRenderer(str(path)).load()
+
+
+def test_read_pixels_falls_back_to_bytes(renderer):
+    # 替身模块没有 ColorType / AlphaType：使用返回字节的 readPixels()
+    buffer = bytearray(64 * 32 * 4)
+    assert renderer._render(0.25, buffer)
+    assert renderer._read_mode == 'bytes'
+    assert renderer._surface.reads == ['bytes']
+    assert buffer == bytes([25]) * len(buffer)
+
+
+def test_read_pixels_into_buffer_when_supported(renderer, monkeypatch):
+    monkeypatch.setattr(renderer.pag_module, 'ColorType', type('ColorType', (), {'RGBA_8888': 4}), raising=False)
+    monkeypatch.setattr(renderer.pag_module, 'AlphaType', type('AlphaType', (), {'Unpremultiplied': 3}), raising=False)
+
+    buffer = bytearray(64 * 32 * 4)
+    assert renderer._render(0.5, buffer)
+    assert renderer._render(0.75, buffer)
+    assert renderer._read_mode == 'into'
+    assert renderer._surface.reads == ['into', 'into']
+    assert buffer == bytes([75]) * len(buffer)
+
+
+def test_read_pixels_rejects_short_result(renderer, monkeypatch):
+    renderer._render(0.0)
+    monkeypatch.setattr(renderer._surface, 'readPixels', lambda *args: b'\x00' * 10)
+    assert not renderer._render(0.5, bytearray(64 * 32 * 4))
+
+
+def test_render_video_writes_frames_in_order(renderer, tmp_path):
+    pytest.importorskip('PIL')
+    from PIL import Image
+
+    output_dir = tmp_path / 'frames'
+    # 缓冲区少于帧数：验证渲染等待编码归还缓冲区，结果按帧号排序
+    paths = renderer.render_video(str(output_dir), fps=10, encode_workers=2, max_pending=2)
+
+    assert [os.path.basename(path) for path in paths] == [f'frame_{n:04d}.png' for n in range(10)]
+    with Image.open(paths[5]) as image:
+        assert image.size == (64, 32)
+        assert image.getpixel((0, 0)) == (56,) * 4  # round(5 / 9 × 100)
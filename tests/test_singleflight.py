@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+from core.pag_singleflight import SingleFlight, SingleFlightTimeout
+
+
+def _start_leader(flight, key, fn):
+    """在后台线程中作为 leader 执行 fn，返回线程和结果列表"""
+    results = []
+
+    def run():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, results
+
+
+class _WatchedEvent(threading.Event):
+    """follower 开始等待时发出通知，测试不依赖 sleep"""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super().wait(timeout)
+
+
+def _watch_waiters(flight, key):
+    """替换正在进行的工作的完成事件，返回 follower 开始等待的通知"""
+    event = _WatchedEvent()
+    flight._calls[key].done = event
+    return event.waiting
+
+
+def test_followers_share_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    thread, leader_results = _start_leader(flight, 'k', work)
+    started.wait(5)
+    waiting = _watch_waiters(flight, 'k')
+    follower_results = []
+    follower = threading.Thread(target=lambda: follower_results.append(flight.do('k', work)))
+    follower.start()
+    assert waiting.wait(5)
+    release.set()
+    thread.join(5)
+    follower.join(5)
+
+    assert leader_results == [('done', False)]
+    assert follower_results == [('done', True)]
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_error_is_shared_with_followers():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        raise ValueError('模板损坏')
+
+    thread, leader_results = _start_leader(flight, 'k', work)
+    started.wait(5)
+    waiting = _watch_waiters(flight, 'k')
+    errors = []
+
+    def follow():
+        try:
+            flight.do('k', lambda: 'not called')
+        except ValueError as e:
+            errors.append(e)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    assert waiting.wait(5)
+    release.set()
+    thread.join(5)
+    follower.join(5)
+
+    assert isinstance(leader_results[0], ValueError)
+    assert errors and errors[0] is leader_results[0]
+
+
+def test_follower_timeout_leaves_leader_running():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+        return 'late'
+
+    thread, leader_results = _start_leader(flight, 'k', work)
+    started.wait(5)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do('k', work, timeout=0.05)
+    release.set()
+    thread.join(5)
+
+    assert leader_results == [('late', False)]
+    assert flight.in_flight() == 0
+
@@ -0,0 +1,51 @@
+from core.pag_template_cache import PAGTemplateCache, template_key
+
+
+def test_hit_returns_independent_copy(fake_pag):
+    cache = PAGTemplateCache(fake_pag)
+    data = fake_pag.make_template(texts=['原标题'])
+    loads = fake_pag.LOAD_COUNT
+
+    first, key = cache.checkout(data)
+    first.texts[0] = '已修改'
+    second, second_key = cache.checkout(data)
+
+    # 模板只解析一次，命中时拿到的是全新副本，不受上一次修改影响
+    assert key == second_key == template_key(data)
+    assert fake_pag.LOAD_COUNT == loads + 1
+    assert second is not first
+    assert second.texts == ['原标题']
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_lru_evicts_least_recently_used(fake_pag):
+    templates = [fake_pag.make_template(texts=[name]) for name in ('aa', 'bb', 'cc')]
+    cache = PAGTemplateCache(fake_pag, max_bytes=len(templates[0]) * 2)
+
+    cache.checkout(templates[0])
+    cache.checkout(templates[1])
+    cache.checkout(templates[0])  # a 变为最近使用
+    cache.checkout(templates[2])  # 超出容量，淘汰 b
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 2
+    assert stats['bytes'] <= cache.max_bytes
+    loads = fake_pag.LOAD_COUNT
+    cache.checkout(templates[0])
+    assert fake_pag.LOAD_COUNT == loads
+    cache.checkout(templates[1])
+    assert fake_pag.LOAD_COUNT == loads + 1
+
+
+def test_oversized_template_is_not_cached(fake_pag):
+    data = fake_pag.make_template(texts=['x' * 100])
+    cache = PAGTemplateCache(fake_pag, max_bytes=len(data) - 1)
+
+    pag, _ = cache.checkout(data)
+    assert pag is not None
+    assert cache.stats()['entries'] == 0
+
+
+def test_invalid_template(fake_pag):
+    pag, key = PAGTemplateCache(fake_pag).checkout(b'not a pag')
+    assert pag is None and key == template_key(b'not a pag')
@@ -0,0 +1,135 @@
+import types
+
+import pytest
+
+from core.pag_transforms import LayerTransformCache, desired_transform
+
+
+class RecordingLayer:
+    """记录每次 set* 调用的图层"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if not name.startswith('set'):
+            raise AttributeError(name)
+        return lambda *args: self.calls.append((name, args))
+
+
+class FakeComposition:
+    def __init__(self, count=2):
+        self.layers = {index: RecordingLayer() for index in range(count)}
+        self.lookups = 0
+
+    def getLayersByEditableIndex(self, index, layer_type):
+        self.lookups += 1
+        layer = self.layers.get(index)
+        return [layer] if layer is not None else []
+
+
+MODULE = types.SimpleNamespace(LayerType=types.SimpleNamespace(Image=5))
+
+
+def transform(index=0, **values):
+    return {'type': 'imageTransform', 'layerIndex': index, 'transform': values}
+
+
+@pytest.fixture
+def composition():
+    return FakeComposition()
+
+
+@pytest.fixture
+def cache(composition):
+    return LayerTransformCache(MODULE, composition)
+
+
+def test_desired_transform_maps_to_setters():
+    values = desired_transform({'position': {'x': 1, 'y': 2}, 'scale': {'x': 2}, 'rotation': 90, 'opacity': 0.5})
+    assert values == {
+        'setPosition': (1, 2),
+        'setScale': (2, 1.0),
+        'setRotation': (90,),
+        'setAlpha': (127,),
+    }
+    assert desired_transform({'position': {}, 'rotation': 0, 'opacity': 1}, skip_defaults=True) == {}
+
+
+def test_unchanged_frames_make_no_setter_calls(cache, composition):
+    modifications = [transform(0, position={'x': 10, 'y': 20}, rotation=45),
+                     transform(1, opacity=0.5)]
+
+    assert cache.apply(modifications) == 2
+    first, second = composition.layers[0], composition.layers[1]
+    assert first.calls == [('setPosition', (10, 20)), ('setRotation', (45,))]
+    assert second.calls == [('setAlpha', (127,))]
+
+    for _ in range(10):
+        assert cache.apply(modifications) == 2
+    # 后续帧没有任何绑定调用，图层对象只查找一次
+    assert len(first.calls) == 2
+    assert len(second.calls) == 1
+    assert composition.lookups == 2
+
+
+def test_only_changed_properties_are_sent(cache, composition):
+    cache.apply([transform(0, position={'x': 0, 'y': 0}, rotation=0)])
+    cache.apply([transform(0, position={'x': 5, 'y': 0}, rotation=0)])
+
+    assert composition.layers[0].calls == [
+        ('setPosition', (0, 0)), ('setRotation', (0,)), ('setPosition', (5, 0)),
+    ]
+
+
+def test_force_resends_everything(cache, composition):
+    modifications = [transform(0, position={'x': 1, 'y': 1}, scale={'x': 2, 'y': 2})]
+    cache.apply(modifications)
+    cache.apply(modifications, force=True)
+
+    assert composition.layers[0].calls == [
+        ('setPosition', (1, 1)), ('setScale', (2, 2)),
+        ('setPosition', (1, 1)), ('setScale', (2, 2)),
+    ]
+    assert composition.lookups == 1
+
+
+def test_invalidate_drops_layers_and_applied_values(cache, composition):
+    modifications = [transform(0, rotation=30)]
+    cache.apply(modifications)
+
+    # 合成被替换：新的图层对象需要重新查找并重新下发
+    composition.layers[0] = replacement = RecordingLayer()
+    cache.invalidate()
+    cache.apply(modifications)
+    cache.apply(modifications)
+
+    assert replacement.calls == [('setRotation', (30,))]
+    assert composition.lookups == 2
+
+
+def test_missing_layer_is_cached_and_skipped(cache, composition):
+    modifications = [transform(7, rotation=30), {'type': 'textReplace', 'layerIndex': 0}]
+
+    assert cache.apply(modifications) == 0
+    assert cache.apply(modifications) == 0
+    assert composition.lookups == 1
+
+
+def test_failed_setter_is_retried_next_frame(cache, composition):
+    layer = composition.layers[0]
+    attempts = []
+
+    def flaky_rotation(value):
+        attempts.append(value)
+        if len(attempts) == 1:
+            raise RuntimeError('binding error')
+
+    layer.setRotation = flaky_rotation
+    modifications = [transform(0, rotation=15)]
+    cache.apply(modifications)
+    cache.apply(modifications)
+    cache.apply(modifications)
+
+    # 失败的值没有记为已下发，下一帧重试，成功后不再调用
+    assert attempts == [15, 15]
@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+from core.pag_wire import WireFormatError, encode_request, iter_request, read_request
+
+
+class _ChunkedStream(io.BytesIO):
+    """每次最多返回 3 个字节，模拟分块到达的请求体"""
+
+    def read(self, size=-1):
+        return super().read(min(size, 3) if size >= 0 else 3)
+
+
+def test_wire_round_trip():
+    modifications = [{'type': 'image', 'layerIndex': 0, 'value': '标志'}]
+    images = {'标志': b'\x89PNG' + bytes(range(256)), 'empty': b''}
+    body = encode_request(b'PAG-template', modifications, images, template_name='card.pag')
+
+    assert body == b''.join(iter_request(b'PAG-template', modifications, images, 'card.pag'))
+    template, name, parsed_mods, parsed_images = read_request(_ChunkedStream(body))
+    assert (template, name) == (b'PAG-template', 'card.pag')
+    assert parsed_mods == modifications
+    assert parsed_images == images
+
+
+def test_wire_without_modifications():
+    template, _, modifications, images = read_request(io.BytesIO(encode_request(b'T')))
+    assert (template, modifications, images) == (b'T', [], {})
+
+
+@pytest.mark.parametrize('body, message', [
+    (b'NOPE\x01', 'PAGW'),
+    (b'PAGW\x02', '版本'),
+    (encode_request(b'template')[:-2], '截断'),
+    (encode_request(b'template')[:8], '帧头'),
+    (b'PAGW\x01', '缺少模板'),
+    (encode_request(b'a') + encode_request(b'b')[5:], '一个模板'),
+])
+def test_wire_rejects_malformed_bodies(body, message):
+    with pytest.raises(WireFormatError, match=message):
+        read_request(io.BytesIO(body))
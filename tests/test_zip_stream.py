@@ -0,0 +1,21 @@
+import io
+import zipfile
+
+from core.pag_zip_stream import iter_zip
+
+
+def test_zip_stream_round_trip():
+    entries = [(f'card_{i}.pag', bytes([i]) * (i * 1000)) for i in range(5)]
+    chunks = list(iter_zip(iter(entries)))
+
+    assert len(chunks) > len(entries)  # 每个条目写完就产出，不是最后一次性产出
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert zf.namelist() == [name for name, _ in entries]
+        for name, data in entries:
+            assert zf.read(name) == data
+            assert zf.getinfo(name).compress_type == zipfile.ZIP_STORED
+
+
+def test_zip_stream_empty():
+    with zipfile.ZipFile(io.BytesIO(b''.join(iter_zip([])))) as zf:
+        assert zf.namelist() == []
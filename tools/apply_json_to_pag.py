@@ -31,7 +31,13 @@ import sys
 import os
 from pathlib import Path
 
-def apply_json_to_pag(pag_template, json_config, output_path, images_dir=None):
+# 添加 core 目录到路径（复用图片缓存）
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(script_dir), 'core'))
+
+from pag_image_cache import PAGImageCache
+
+def apply_json_to_pag(pag_template, json_config, output_path, images_dir=None, image_cache=None):
     """
     应用 JSON 配置到 PAG 文件
     
@@ -40,6 +46,7 @@ def apply_json_to_pag(pag_template, json_config, output_path, images_dir=None):
         json_config: JSON 配置文件路径
         output_path: 输出 PAG 文件路径
         images_dir: 图片文件目录（可选）
+        image_cache: 图片缓存（可选，批量调用时传入同一个实例，重复的图片只解码一次）
     """
     try:
         import libpag
@@ -48,6 +55,9 @@ def apply_json_to_pag(pag_template, json_config, output_path, images_dir=None):
         print("请运行: pip install libpag")
         return False
     
+    if image_cache is None:
+        image_cache = PAGImageCache(libpag)
+    
     # 读取 JSON 配置
     print(f"📖 读取配置: {json_config}")
     with open(json_config, 'r', encoding='utf-8') as f:
@@ -98,27 +108,25 @@ def apply_json_to_pag(pag_template, json_config, output_path, images_dir=None):
             elif mod_type == 'image':
                 # 替换图片
                 image_path = None
+                image = None
                 
                 # 方法 1: 使用 base64 数据（如果有）
                 if image_data and image_data.startswith('data:image'):
                     import base64
-                    import tempfile
                     
                     # 提取 base64 数据
                     base64_data = image_data.split(',')[1]
                     image_bytes = base64.b64decode(base64_data)
                     
-                    # 保存到临时文件
                     ext = '.png'
                     if 'jpeg' in image_data or 'jpg' in image_data:
                         ext = '.jpg'
                     elif 'webp' in image_data:
                         ext = '.webp'
                     
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-                    temp_file.write(image_bytes)
-                    temp_file.close()
-                    image_path = temp_file.name
+                    # 同一图片只解码一次
+                    image = image_cache.from_bytes(image_bytes, suffix=ext)
+                    image_path = 'base64 数据'
                     print(f"  📦 使用 base64 图片数据")
                 
                 # 方法 2: 使用文件路径
@@ -133,19 +141,15 @@ def apply_json_to_pag(pag_template, json_config, output_path, images_dir=None):
                     for path in possible_paths:
                         if path and os.path.exists(path):
                             image_path = path
+                            image = image_cache.from_path(path)
                             print(f"  📁 找到图片: {os.path.basename(path)}")
                             break
                 
                 if image_path:
-                    image = libpag.PAGImage.FromPath(image_path)
                     if image:
                         pag.replaceImage(layer_index, image)
                         print(f"  ✅ 图片已更新")
                         success_count += 1
-                        
-                        # 清理临时文件
-                        if image_data:
-                            os.unlink(image_path)
                     else:
                         print(f"  ❌ 无法加载图片: {image_path}")
                         error_count += 1
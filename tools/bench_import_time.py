@@ -0,0 +1,130 @@
+"""
+core 包导入耗时基准
+
+每个导入语句在全新的 Python 进程中执行多次，统计墙钟时间（中位数 / 最小值），
+可选用 -X importtime 列出最耗时的模块。批量任务这类短命进程的启动时间
+主要花在导入上，改动 core 的导入结构后跑一下，确认没有退化。
+
+使用方法：
+    python bench_import_time.py                    # 默认的几组导入语句
+    python bench_import_time.py -n 20              # 每组重复 20 次
+    python bench_import_time.py --top 15           # 同时列出最耗时的 15 个模块
+    python bench_import_time.py --max-ms 150       # 任一组中位数超过 150ms 时返回 1
+    python bench_import_time.py -s "from core import PAGRuntimeRenderer"
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 项目根目录（core 包所在目录）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_STATEMENTS = [
+    'pass',  # 解释器本身的启动时间，作为基线
+    'import core',
+    'from core import PAGTemplateBatchEditor',
+    'from core import PAGTemplateCache, PAGImageCache',
+    'from core import load_pag_module; load_pag_module()',
+]
+
+
+def time_statement(statement, repeat):
+    """
+    在全新进程中执行导入语句 repeat 次
+
+    Returns:
+        list: 每次的耗时（毫秒）
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', statement], cwd=PROJECT_ROOT,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        elapsed = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise RuntimeError(f"执行失败: {statement}\n{result.stderr.decode(errors='replace')}")
+        samples.append(elapsed)
+    return samples
+
+
+def top_imports(statement, top):
+    """
+    用 -X importtime 找出最耗时的模块
+
+    Returns:
+        list: [(累计微秒, 模块名), ...]，按耗时从高到低
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    rows = []
+    for line in result.stderr.decode(errors='replace').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            rows.append((int(parts[1]), parts[2].rstrip()))
+        except ValueError:
+            continue
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='core 包导入耗时基准')
+    parser.add_argument('-s', '--statement', action='append',
+                        help='要测量的导入语句（可重复），默认测量一组常用导入')
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='每组重复次数（默认 10）')
+    parser.add_argument('--top', type=int, default=0, help='列出最耗时的 N 个模块')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='中位数超过该值（毫秒）时返回非零退出码')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    statements = args.statement or DEFAULT_STATEMENTS
+    results = []
+    for statement in statements:
+        samples = time_statement(statement, args.repeat)
+        results.append({
+            'statement': statement,
+            'median_ms': round(statistics.median(samples), 1),
+            'min_ms': round(min(samples), 1),
+            'max_ms': round(max(samples), 1),
+        })
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"Python {sys.version.split()[0]}，每组 {args.repeat} 次\n")
+        print(f"{'中位数':>8} {'最小':>8} {'最大':>8}  语句")
+        for r in results:
+            print(f"{r['median_ms']:>7.1f}ms {r['min_ms']:>6.1f}ms {r['max_ms']:>6.1f}ms  {r['statement']}")
+
+    if args.top:
+        for statement in statements:
+            if statement == 'pass':
+                continue
+            print(f"\n📊 {statement}")
+            for cumulative, module in top_imports(statement, args.top):
+                print(f"   {cumulative / 1000:>8.1f}ms  {module}")
+
+    if args.max_ms is not None:
+        slow = [r for r in results if r['statement'] != 'pass' and r['median_ms'] > args.max_ms]
+        if slow:
+            for r in slow:
+                print(f"❌ 超过 {args.max_ms}ms: {r['statement']} ({r['median_ms']}ms)")
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())